@@ -1,6 +1,8 @@
 import os
+import time
+
 from celery import Celery
-from celery.signals import beat_init
+from celery.signals import beat_init, before_task_publish, task_prerun
 
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.local")
@@ -21,3 +23,41 @@ app.autodiscover_tasks()
 def on_startup_subscribe(conf=None, **kwargs):
     from trade_portal.websub_receiver.tasks import subscribe_to_new_messages
     subscribe_to_new_messages.delay()
+
+
+@beat_init.connect()
+def on_startup_warm_verifier(conf=None, **kwargs):
+    # don't wait for the first schedule to know the verifier state and renderer urls
+    from trade_portal.oa_verify.tasks import keep_verify_api_warm
+    keep_verify_api_warm.delay()
+
+
+@before_task_publish.connect()
+def on_task_publish(headers=None, **kwargs):
+    # to know how long the task has been waiting in its queue (see on_task_prerun)
+    if headers is not None:
+        headers.setdefault("published_at", time.time())
+
+
+@task_prerun.connect()
+def on_task_prerun(task=None, **kwargs):
+    """
+    Report the task latency (time between being sent and started) by queue,
+    so the queue falling behind is seen before its tasks' results are late
+    """
+    from trade_portal.utils.monitoring import statsd_timing
+
+    request = task.request
+    published_at = getattr(request, "published_at", None) or (request.headers or {}).get("published_at")
+    if not published_at:
+        # sent by something not having the hook (or a rerun from a tool)
+        return
+    queue = (request.delivery_info or {}).get("routing_key") or app.conf.task_default_queue
+    if request.eta:
+        # delayed tasks start waiting when they are due, not when sent
+        try:
+            from celery.utils.time import maybe_iso8601
+            published_at = max(published_at, maybe_iso8601(request.eta).timestamp())
+        except Exception:
+            pass
+    statsd_timing(f"celery.latency.{queue}", max(time.time() - published_at, 0))
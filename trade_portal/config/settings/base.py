@@ -201,6 +201,40 @@ CELERY_TASK_SOFT_TIME_LIMIT = 4 * 60
 CELERY_WORKER_MAX_TASKS_PER_CHILD = 50
 CELERY_WORKER_HIJACK_ROOT_LOGGER = False
 
+# Tasks are routed by their class to the queues consumed by separate worker lanes
+# (see APP_WORKER_LANE in the worker start script), so a batch upload of heavy PDFs
+# doesn't delay the status updates, notifications or the healthcheck canary:
+#   cpu-pdf: PDF processing; lodge-watermark, lodge-wrap, lodge-encrypt are its issue pipeline stages
+#   network-igl: IGL node and notary calls; lodge-notarize, lodge-igl are its issue pipeline stages
+#   verification: the verifier calls, including the public verifier jobs
+#     (formerly the "verify" queue, still consumed by the verification lane workers
+#     for a release, see the worker start script; drained before removing it there)
+#   notifications: emails
+#   canary: the healthcheck canary only
+# anything else goes to the default "celery" queue
+CELERY_TASK_DEFAULT_QUEUE = "celery"
+CELERY_TASK_ROUTES = {
+    'trade_portal.documents.tasks.lodge_document': {'queue': 'cpu-pdf'},
+    'trade_portal.documents.tasks.textract_document': {'queue': 'cpu-pdf'},
+    'trade_portal.documents.tasks.fill_document_metadata': {'queue': 'cpu-pdf'},
+    'trade_portal.documents.tasks.lodge_watermark_stage': {'queue': 'lodge-watermark'},
+    'trade_portal.documents.tasks.lodge_wrap_stage': {'queue': 'lodge-wrap'},
+    'trade_portal.documents.tasks.lodge_encrypt_stage': {'queue': 'lodge-encrypt'},
+    'trade_portal.documents.tasks.lodge_notarize_stage': {'queue': 'lodge-notarize'},
+    'trade_portal.documents.tasks.lodge_igl_stage': {'queue': 'lodge-igl'},
+    'trade_portal.documents.tasks.issue_document_batch': {'queue': 'network-igl'},
+    'trade_portal.documents.tasks.update_message_by_sender_ref': {'queue': 'network-igl'},
+    'trade_portal.documents.tasks.store_message_by_ping_body': {'queue': 'network-igl'},
+    'trade_portal.documents.tasks.process_incoming_document_received': {'queue': 'network-igl'},
+    'trade_portal.websub_receiver.tasks.*': {'queue': 'network-igl'},
+    'trade_portal.documents.tasks.document_oa_verify': {'queue': 'verification'},
+    'trade_portal.documents.tasks.verify_pending_documents': {'queue': 'verification'},
+    'trade_portal.documents.tasks.consume_oa_issued_events': {'queue': 'verification'},
+    'trade_portal.oa_verify.tasks.*': {'queue': 'verification'},
+    'trade_portal.users.tasks.notify_*': {'queue': 'notifications'},
+    'trade_portal.feedback.tasks.*': {'queue': 'notifications'},
+    'trade_portal.documents.tasks.canary_task': {'queue': 'canary'},
+}
 CELERY_BEAT_SCHEDULE = {
     'subscribe_to_new_messages': {
         'task': 'trade_portal.websub_receiver.tasks.subscribe_to_new_messages',
@@ -275,3 +309,30 @@ from .base_cache import *  # NOQA
 from .base_constance import *  # NOQA
 from .base_logging import *  # NOQA
 from .base_storages import *  # NOQA
+
+if OA_BATCH_ISSUE_SIZE > 1:  # NOQA
+    CELERY_BEAT_SCHEDULE['issue_document_batch'] = {
+        'task': 'trade_portal.documents.tasks.issue_document_batch',
+        'schedule': datetime.timedelta(seconds=OA_BATCH_ISSUE_WINDOW_SECONDS),  # NOQA
+    }
+
+if OA_VERIFY_SWEEP_INTERVAL_SECONDS:  # NOQA
+    CELERY_BEAT_SCHEDULE['verify_pending_documents'] = {
+        'task': 'trade_portal.documents.tasks.verify_pending_documents',
+        'schedule': datetime.timedelta(seconds=OA_VERIFY_SWEEP_INTERVAL_SECONDS),  # NOQA
+        'options': {'expires': OA_VERIFY_SWEEP_INTERVAL_SECONDS},  # NOQA
+    }
+
+if OA_ISSUED_EVENTS_QUEUE_URL:  # NOQA
+    CELERY_BEAT_SCHEDULE['consume_oa_issued_events'] = {
+        'task': 'trade_portal.documents.tasks.consume_oa_issued_events',
+        'schedule': datetime.timedelta(seconds=OA_ISSUED_EVENTS_POLL_SECONDS),  # NOQA
+        'options': {'expires': OA_ISSUED_EVENTS_POLL_SECONDS},  # NOQA
+    }
+
+if (OA_VERIFY_API_HEALTHCHECK_URL or OA_TEMPLATE_URLS_PRERESOLVE) and OA_VERIFY_WARM_INTERVAL_SECONDS:  # NOQA
+    CELERY_BEAT_SCHEDULE['keep_verify_api_warm'] = {
+        'task': 'trade_portal.oa_verify.tasks.keep_verify_api_warm',
+        'schedule': datetime.timedelta(seconds=OA_VERIFY_WARM_INTERVAL_SECONDS),  # NOQA
+        'options': {'expires': OA_VERIFY_WARM_INTERVAL_SECONDS},  # NOQA
+    }
@@ -45,6 +45,19 @@ else:
         env('IGL_DOCAPI_PORT', default='5000'),
     )
 
+# HTTP client parameters for the node APIs above; connections are kept alive and reused
+IGL_HTTP_CONNECT_TIMEOUT = env.float("IGL_HTTP_CONNECT_TIMEOUT", default=5)
+IGL_HTTP_READ_TIMEOUT = env.float("IGL_HTTP_READ_TIMEOUT", default=30)
+# GET requests are retried with exponential backoff on connection errors and 502/503/504
+IGL_HTTP_RETRIES = env.int("IGL_HTTP_RETRIES", default=3)
+# connections kept per API, in format "message=20,document=10,subscription=2"
+IGL_HTTP_POOL_SIZES = env.dict(
+    "IGL_HTTP_POOL_SIZES",
+    cast={"value": int},
+    default={"message": 10, "document": 10, "subscription": 2},
+)
+# parallel requests made by the async client, when messages are processed in bulk
+IGL_ASYNC_CONCURRENCY = env.int("IGL_ASYNC_CONCURRENCY", default=20)
 
 ABR_UUID = env("ABR_UUID", default=None) or None
 
@@ -61,6 +74,18 @@ OA_NOTARY_DOMAIN = env("OA_NOTARY_DOMAIN")
 # Either local or remote setup which is able to wrap documents
 # (the API providing /wrap and /unwrap endpoints)
 OA_WRAP_API_URL = env("OA_WRAP_API_URL")
+# "api" to wrap documents using the OA_WRAP_API_URL above or "native" to wrap
+# them in-process (no external calls, the same result)
+OA_WRAP_ENGINE = env("OA_WRAP_ENGINE", default="api")
+# Batch issue: when greater than 1, lodged documents are collected (for up to
+# OA_BATCH_ISSUE_WINDOW_SECONDS or until that many of them are waiting) and issued
+# together under a single merkle root, so it's one document store transaction per batch
+OA_BATCH_ISSUE_SIZE = env.int("OA_BATCH_ISSUE_SIZE", default=1)
+OA_BATCH_ISSUE_WINDOW_SECONDS = env.int("OA_BATCH_ISSUE_WINDOW_SECONDS", default=30)
+# Redirect to the presigned storage URL instead of streaming the file through the app;
+# the bucket must allow CORS GET requests for that
+OA_CIPHERTEXT_REDIRECT = env.bool("OA_CIPHERTEXT_REDIRECT", default=False)
+OA_CIPHERTEXT_REDIRECT_EXPIRY = env.int("OA_CIPHERTEXT_REDIRECT_EXPIRY", default=300)
 
 # ## Variables needed for notarisastion step, which relies on buckets/queues
 # ## may be replaced by other mechanisms once they are defined
@@ -71,6 +96,11 @@ OA_UNPROCESSED_QUEUE_URL = env("OA_UNPROCESSED_QUEUE_URL")
 # Just a plain bucket name, do not send files to notarisation if empty
 OA_UNPROCESSED_BUCKET_NAME = env("OA_UNPROCESSED_BUCKET_NAME")
 
+# The worker publishes there an event once the documents are issued, which makes them valid
+# without waiting for the verification; read every OA_ISSUED_EVENTS_POLL_SECONDS, not used if empty
+OA_ISSUED_EVENTS_QUEUE_URL = env("OA_ISSUED_EVENTS_QUEUE_URL", default="")
+OA_ISSUED_EVENTS_POLL_SECONDS = env.int("OA_ISSUED_EVENTS_POLL_SECONDS", default=20)
+
 # Values in format accesskey:secretkey, None if empty (policy defined)
 OA_AWS_ACCESS_KEYS = env("OA_AWS_ACCESS_KEYS", default="") or None
 
@@ -83,6 +113,39 @@ if OA_VERIFY_API_URL:
     ) or None
 else:
     OA_VERIFY_API_HEALTHCHECK_URL = None
+# The healthcheck is called that often to keep the verifier warm and know if it's available
+# (verifications fail fast when it's not); 0 to disable
+OA_VERIFY_WARM_INTERVAL_SECONDS = env.int("OA_VERIFY_WARM_INTERVAL_SECONDS", default=60)
+# Verify the documents submitted to the public verifier by the workers ("verification" queue)
+# instead of the web request; the page waits for the result for OA_VERIFY_JOB_SECONDS at most
+OA_VERIFY_ASYNC_JOBS = env.bool("OA_VERIFY_ASYNC_JOBS", default=False)
+OA_VERIFY_JOB_SECONDS = env.int("OA_VERIFY_JOB_SECONDS", default=60 * 10)
+# Seconds the verifier response is cached for the same document (by merkle root and content);
+# responses other than valid (not yet notarized documents, verifier errors) are kept for less. 0 to disable
+OA_VERIFY_CACHE_SECONDS = env.int("OA_VERIFY_CACHE_SECONDS", default=60 * 5)
+OA_VERIFY_CACHE_ERROR_SECONDS = env.int("OA_VERIFY_CACHE_ERROR_SECONDS", default=30)
+# Documents not yet valid after the issue (waiting for the notarisation) are checked
+# in bulk that often, at most OA_VERIFY_SWEEP_SIZE of them at once, one verification
+# per merkle root until it's issued; they are failed after OA_VERIFY_PENDING_MAX_SECONDS
+OA_VERIFY_SWEEP_INTERVAL_SECONDS = env.int("OA_VERIFY_SWEEP_INTERVAL_SECONDS", default=60)
+OA_VERIFY_SWEEP_SIZE = env.int("OA_VERIFY_SWEEP_SIZE", default=500)
+OA_VERIFY_PENDING_MAX_SECONDS = env.int("OA_VERIFY_PENDING_MAX_SECONDS", default=2 * 60 * 60)
+
+# ## QR codes extraction from the PDF files uploaded to the verifier
+# Processes decoding images and rendering pages, shared by all requests of the web process;
+# 0 to do it in the request process (no limits on CPU then)
+OA_VERIFY_QR_WORKERS = env.int("OA_VERIFY_QR_WORKERS", default=2)
+# CPU seconds for a single image decoding or page rendering, the worker is killed after it
+OA_VERIFY_QR_CPU_SECONDS = env.int("OA_VERIFY_QR_CPU_SECONDS", default=10)
+# wall time for the whole file, whatever is found by that moment is returned
+OA_VERIFY_QR_TIME_BUDGET = env.float("OA_VERIFY_QR_TIME_BUDGET", default=20)
+# pages to look for the embedded images on
+OA_VERIFY_QR_MAX_PAGES = env.int("OA_VERIFY_QR_MAX_PAGES", default=20)
+# pages to render if no codes are found in the images, and resolutions to try, lowest first
+OA_VERIFY_QR_RASTERISE_PAGES = env.int("OA_VERIFY_QR_RASTERISE_PAGES", default=2)
+OA_VERIFY_QR_RASTERISE_DPI = [
+    int(dpi) for dpi in env.list("OA_VERIFY_QR_RASTERISE_DPI", default=["100", "200", "300"])
+]
 
 # ## Universal actions QR code parameters
 
@@ -91,6 +154,15 @@ else:
 UA_BASE_HOST = env("UA_BASE_HOST")
 # Renderer we use by default; The host with protocol without trailing slash
 OA_RENDERER_HOST = env("OA_RENDERER_HOST")
+# Renderer urls from the verified documents are resolved (following redirects) with that timeout
+# and cached, failures for less time
+OA_TEMPLATE_URL_TIMEOUT = env.float("OA_TEMPLATE_URL_TIMEOUT", default=5)
+OA_TEMPLATE_URL_CACHE_SECONDS = env.int("OA_TEMPLATE_URL_CACHE_SECONDS", default=60 * 60)
+OA_TEMPLATE_URL_ERROR_CACHE_SECONDS = env.int("OA_TEMPLATE_URL_ERROR_CACHE_SECONDS", default=60)
+# Renderer urls resolved in advance (by the keep_verify_api_warm task), our own one by default
+OA_TEMPLATE_URLS_PRERESOLVE = env.list(
+    "OA_TEMPLATE_URLS_PRERESOLVE", default=[OA_RENDERER_HOST] if OA_RENDERER_HOST else []
+)
 
 
 IPINFO_KEY = env("IPINFO_KEY", default=None) or None
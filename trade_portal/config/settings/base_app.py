@@ -45,3 +45,17 @@ IGL_OAUTH_CLIENT_ID = env("IGL_OAUTH_CLIENT_ID", default=None)
 IGL_OAUTH_CLIENT_SECRET = env("IGL_OAUTH_CLIENT_SECRET", default=None)
 IGL_OAUTH_WELLKNOWN_URL = env("IGL_OAUTH_WELLKNOWN_URL", default=None)
 IGL_OAUTH_SCOPES = env("IGL_OAUTH_SCOPES", default=None)
+
+# the documents list (UI) counts the documents by the planner estimate if it's that many
+# or more of them, COUNT(*) takes long for big tables; 0 to always count exactly
+APPROXIMATE_COUNT_FROM = env.int("APPROXIMATE_COUNT_FROM", default=100000)
+
+# The certificates API changes feed doesn't move the client cursor past the changes made
+# that recently, so the changes of transactions committed later than others (but having
+# earlier updated_at) are not missed; such changes may be returned twice
+API_CHANGES_LAG_SECONDS = env.int("API_CHANGES_LAG_SECONDS", default=60)
+
+# First page PNG previews of uploaded PDFs, for the QR code positioning UI;
+# rendered once after the upload and stored next to the file
+DOCUMENT_PREVIEW_DPI = env.int("DOCUMENT_PREVIEW_DPI", default=200)
+DOCUMENT_PREVIEW_MAX_SIZE_PX = env.int("DOCUMENT_PREVIEW_MAX_SIZE_PX", default=2400)
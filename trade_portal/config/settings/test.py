@@ -26,3 +26,9 @@ CELERY_TASK_ALWAYS_EAGER = True
 IS_UNITTEST = True
 
 DUMB_ABR_REQUESTS = True
+
+# the cache is shared between test runs, tests expect the verifier to be called
+OA_VERIFY_CACHE_SECONDS = 0
+OA_VERIFY_CACHE_ERROR_SECONDS = 0
+OA_TEMPLATE_URL_CACHE_SECONDS = 0
+OA_TEMPLATE_URL_ERROR_CACHE_SECONDS = 0
@@ -1,21 +1,24 @@
 import logging
 from http import HTTPStatus
 
-import requests
-
 from .auth import BaseAuthClass
+from .session import DEFAULT_RETRIES, DEFAULT_TIMEOUT, HttpMixin, make_session
 
 logger = logging.getLogger(__name__)
 VERSION = "0.0.3"
 VERSION_API = "20200501"
 
 
-class IntergovClient(object):
+class IntergovClient(HttpMixin):
     """
     Helper class to perform the intergov API calls easily
     """
 
-    def __init__(self, country: str, endpoints: dict, auth_class: BaseAuthClass):
+    def __init__(
+        self, country: str, endpoints: dict, auth_class: BaseAuthClass,
+        session=None, timeout=DEFAULT_TIMEOUT, pool_sizes: dict = None,
+        retries: int = DEFAULT_RETRIES, metrics_callback=None,
+    ):
         """
         Country: 2-letter country code, example: AU, SG, CN
 
@@ -30,6 +33,13 @@ class IntergovClient(object):
 
         auth_class: instance of class implementing the auth.py::BaseAuthClass
         interface
+
+        HTTP parameters (all optional):
+            session: requests.Session to use; created with the parameters below if not passed
+            timeout: (connect, read) seconds for each request
+            pool_sizes: dict {endpoint name: connections kept alive}, like {"message": 20}
+            retries: how many times idempotent requests are retried on connection errors and 50x
+            metrics_callback: function(call_name, seconds, status_code) called after each request
         """
         country = str(country)
         if len(country) != 2 or country.upper() != country:
@@ -42,6 +52,19 @@ class IntergovClient(object):
         self.auth_class = auth_class
         self.ENDPOINTS = endpoints
 
+        self.timeout = timeout
+        self.metrics_callback = metrics_callback
+        if session is None:
+            session = make_session(
+                pool_sizes={
+                    self.ENDPOINTS[name]: size
+                    for name, size in (pool_sizes or {}).items()
+                    if isinstance(self.ENDPOINTS.get(name), str)
+                },
+                retries=retries,
+            )
+        self.session = session
+
     def retrieve_message(self, sender_ref: str) -> dict:
         """
         Retrieves message and returns None or JSON of it's body
@@ -50,7 +73,8 @@ class IntergovClient(object):
             raise Exception("Message API must be configured first")
 
         auth_h_name, auth_h_value, exp = self.auth_class.get_message_auth_header()
-        resp = requests.get(
+        resp = self._request(
+            "message.retrieve", "get",
             self.ENDPOINTS["message"] + f"/message/{sender_ref}",
             headers={
                 auth_h_name: auth_h_value,
@@ -71,7 +95,8 @@ class IntergovClient(object):
             raise Exception("Message API must be configured first")
 
         auth_h_name, auth_h_value, exp = self.auth_class.get_message_auth_header()
-        resp = requests.post(
+        resp = self._request(
+            "message.post", "post",
             self.ENDPOINTS["message"] + "/message",
             json=message_json,
             headers={
@@ -106,7 +131,8 @@ class IntergovClient(object):
         files = {
             'document': ('document.json', document_body)
         }
-        resp = requests.post(
+        resp = self._request(
+            "document.post", "post",
             self.ENDPOINTS["document"] + f"/jurisdictions/{receiver}",
             files=files,
             headers={
@@ -126,7 +152,8 @@ class IntergovClient(object):
         files = {
             'document': ('document.json', document_stream)
         }
-        resp = requests.post(
+        resp = self._request(
+            "document.post", "post",
             self.ENDPOINTS["document"] + f"/jurisdictions/{receiver}",
             files=files,
             headers={
@@ -147,9 +174,10 @@ class IntergovClient(object):
 
         auth_h_name, auth_h_value, exp = self.auth_class.get_document_auth_header()
         endpoint = f'{self.ENDPOINTS["document"]}/{document_multihash}'
-        resp = requests.get(
+        resp = self._request(
+            "document.retrieve", "get",
             endpoint,
-            {
+            params={
                 "as_jurisdiction": str(self.COUNTRY)
             },
             headers={
@@ -172,7 +200,8 @@ class IntergovClient(object):
             raise Exception("Subscription API must be configured first")
 
         auth_h_name, auth_h_value, exp = self.auth_class.get_subscr_auth_header()
-        resp = requests.post(
+        resp = self._request(
+            "subscription.subscribe", "post",
             self.ENDPOINTS["subscription"] + "/subscriptions",
             data={
                 'hub.callback': callback,
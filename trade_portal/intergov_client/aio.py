@@ -0,0 +1,190 @@
+"""
+Asyncio variant of the IntergovClient, for processing many messages at once
+(like catching up with the messages after the outage) without doing them one by one.
+
+    async with AsyncIntergovClient("AU", endpoints, auth_class) as client:
+        messages = await client.retrieve_messages(sender_refs, concurrency=20)
+
+Requires httpx; the auth class is the same (sync) one the IntergovClient uses,
+it's called in the thread pool because it may request a token.
+"""
+import asyncio
+import logging
+import time
+from http import HTTPStatus
+
+import httpx
+
+from .auth import BaseAuthClass
+from .session import (
+    DEFAULT_BACKOFF_FACTOR, DEFAULT_POOL_SIZE, DEFAULT_RETRIES, DEFAULT_TIMEOUT, RETRY_STATUSES,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 10
+
+
+class AsyncIntergovClient:
+    def __init__(
+        self, country: str, endpoints: dict, auth_class: BaseAuthClass,
+        client: httpx.AsyncClient = None, timeout=DEFAULT_TIMEOUT, pool_size: int = DEFAULT_POOL_SIZE,
+        retries: int = DEFAULT_RETRIES, metrics_callback=None,
+    ):
+        """
+        The same parameters as for the IntergovClient, except:
+            client: httpx.AsyncClient to use instead of creating a new one
+            pool_size: max connections open at once (for all endpoints)
+        """
+        country = str(country)
+        if len(country) != 2 or country.upper() != country:
+            raise Exception("Country parameter is invalid")
+        self.COUNTRY = country
+
+        if not isinstance(endpoints, dict):
+            raise Exception("Correct endpoints must be provided")
+
+        self.auth_class = auth_class
+        self.ENDPOINTS = endpoints
+        self.retries = retries
+        self.metrics_callback = metrics_callback
+        if client is None:
+            connect_timeout, read_timeout = timeout
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            )
+        self.client = client
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def _auth_headers(self, getter) -> dict:
+        auth_h_name, auth_h_value, exp = await asyncio.get_running_loop().run_in_executor(None, getter)
+        return {auth_h_name: auth_h_value}
+
+    async def _request(self, call_name: str, method: str, url: str, **kwargs) -> httpx.Response:
+        # only GET requests are retried, the same way the sync client does
+        attempts = 1 + (self.retries if method == "GET" else 0)
+        for attempt in range(attempts):
+            is_last = attempt == attempts - 1
+            started = time.perf_counter()
+            status_code = None
+            try:
+                resp = await self.client.request(method, url, **kwargs)
+                status_code = resp.status_code
+            except httpx.TransportError:
+                if is_last:
+                    raise
+            else:
+                if is_last or status_code not in RETRY_STATUSES:
+                    return resp
+            finally:
+                if self.metrics_callback:
+                    try:
+                        self.metrics_callback(call_name, time.perf_counter() - started, status_code)
+                    except Exception as e:
+                        logger.exception(e)
+            await asyncio.sleep(DEFAULT_BACKOFF_FACTOR * (2 ** attempt))
+
+    async def retrieve_message(self, sender_ref: str) -> dict:
+        """
+        Retrieves message and returns None or JSON of it's body
+        """
+        if not isinstance(self.ENDPOINTS.get("message"), str):
+            raise Exception("Message API must be configured first")
+
+        resp = await self._request(
+            "message.retrieve", "GET",
+            self.ENDPOINTS["message"] + f"/message/{sender_ref}",
+            headers=await self._auth_headers(self.auth_class.get_message_auth_header),
+        )
+        if not str(resp.status_code).startswith("2"):
+            logger.warning("Non-2xx response for message retrieval; %s", resp.content)
+            return None
+        return resp.json()
+
+    async def retrieve_messages(self, sender_refs, concurrency: int = DEFAULT_CONCURRENCY) -> dict:
+        """
+        Retrieves messages with up to `concurrency` requests at once
+        Returns {sender_ref: message body or None if it can't be retrieved}
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _retrieve(sender_ref):
+            async with semaphore:
+                try:
+                    return await self.retrieve_message(sender_ref)
+                except Exception as e:
+                    logger.warning("Unable to retrieve message %s: %s", sender_ref, e)
+                    return None
+
+        sender_refs = list(sender_refs)
+        results = await asyncio.gather(*[_retrieve(sender_ref) for sender_ref in sender_refs])
+        return dict(zip(sender_refs, results))
+
+    async def post_message(self, message_json: dict) -> dict:
+        """
+        Posts a message to message TX API, returns posted message body
+        Raises exceptions if any.
+        """
+        if not isinstance(self.ENDPOINTS.get("message"), str):
+            raise Exception("Message API must be configured first")
+
+        resp = await self._request(
+            "message.post", "POST",
+            self.ENDPOINTS["message"] + "/message",
+            json=message_json,
+            headers=await self._auth_headers(self.auth_class.get_message_auth_header),
+        )
+        if resp.status_code != HTTPStatus.CREATED:
+            short_text = resp.text[:2000]
+            logger.error("Unable to publish message: %s %s", resp.status_code, short_text)
+            raise Exception("url: {}, resp: {}".format(self.ENDPOINTS["message"], short_text))
+        return resp.json()
+
+    async def retrieve_document(self, document_multihash: str) -> bytes:
+        if not isinstance(self.ENDPOINTS.get("document"), str):
+            raise Exception("Document API must be configured first")
+
+        resp = await self._request(
+            "document.retrieve", "GET",
+            f'{self.ENDPOINTS["document"]}/{document_multihash}',
+            params={"as_jurisdiction": str(self.COUNTRY)},
+            headers=await self._auth_headers(self.auth_class.get_document_auth_header),
+        )
+        if resp.status_code == 200:
+            return resp.content
+        try:
+            error = resp.json()
+        except Exception:
+            error = resp.content.decode("utf-8")
+        raise Exception(f"Unable to retrieve document: {resp.status_code}, {error}")
+
+    async def subscribe(self, predicate=None, topic=None, callback=None) -> bool:
+        if not callback:
+            raise Exception("The callback parameter is required")
+        if not isinstance(self.ENDPOINTS.get("subscription"), str):
+            raise Exception("Subscription API must be configured first")
+
+        resp = await self._request(
+            "subscription.subscribe", "POST",
+            self.ENDPOINTS["subscription"] + "/subscriptions",
+            data={
+                'hub.callback': callback,
+                'hub.topic': predicate or topic,
+                'hub.mode': 'subscribe'
+            },
+            headers=await self._auth_headers(self.auth_class.get_subscr_auth_header),
+        )
+        if resp.status_code != 202:
+            raise Exception(
+                "Unable to subscribe to {}: {}, {}".format(predicate, resp, resp.text[:2000])
+            )
+        return True
@@ -1,8 +1,12 @@
 import base64
 import logging
+import threading
+import time
 
 import requests
 
+from .session import DEFAULT_TIMEOUT, HttpMixin, make_session
+
 logger = logging.getLogger(__name__)
 
 
@@ -34,26 +38,41 @@ class DumbAuth(BaseAuthClass):
         return "Authorization", "Dumb", 3600
 
 
-class CognitoOIDCAuth(BaseAuthClass):
+class CognitoOIDCAuth(HttpMixin, BaseAuthClass):
 
     @classmethod
     def resolve_wellknown_to_token_url(cls, wellknown_url):
         wellknown_content = requests.get(
-            wellknown_url
+            wellknown_url,
+            timeout=DEFAULT_TIMEOUT,
         )
         if not wellknown_content.status_code == 200:
             raise Exception("Unable to resolve wellknown url to token url", wellknown_content.content)
         return wellknown_content.json().get("token_endpoint")
 
-    def __init__(self, token_url, client_id, client_secret, scope):
+    def __init__(
+        self, token_url, client_id, client_secret, scope,
+        session=None, timeout=DEFAULT_TIMEOUT, metrics_callback=None,
+    ):
         self.TOKEN_URL = token_url
         self.CLIENT_ID = client_id
         self.CLIENT_SECRET = client_secret
         self.SCOPE = scope
+        # tokens are requested rarely, so a couple of connections is enough
+        self.session = session or make_session(pool_sizes={token_url: 2})
+        self.timeout = timeout
+        self.metrics_callback = metrics_callback
 
     def get_auth_header(self):
+        return self.fetch_token()
+
+    def fetch_token(self, call_name="auth.token"):
+        """
+        Requests a new token; call_name is what it's reported as to the metrics callback
+        """
         cognito_auth = base64.b64encode(f"{self.CLIENT_ID}:{self.CLIENT_SECRET}".encode("utf-8")).decode("utf-8")
-        token_resp = requests.post(
+        token_resp = self._request(
+            call_name, "post",
             self.TOKEN_URL,
             data={
                 "grant_type": "client_credentials",
@@ -90,6 +109,20 @@ class DjangoCachedCognitoOIDCAuth(CognitoOIDCAuth):
     With local imports it shoudln't break things for users without it
     """
 
+    # tokens are refreshed in the background when they have that much lifetime left
+    # (or a quarter of it, whatever is bigger)
+    REFRESH_BEFORE_SECONDS = 60
+    # and never used when they expire in less than that (the request must reach the API)
+    EXPIRY_MARGIN_SECONDS = 10
+    # how long the process fetching the token keeps the lock, and others wait for it
+    LOCK_TIMEOUT_SECONDS = 30
+    LOCK_WAIT_SECONDS = 10
+
+    # per-process layer above the Django cache, {cache_key: token}, so the
+    # cache is requested only when the token is about to be refreshed
+    _local_tokens = {}
+    _local_lock = threading.Lock()
+
     @classmethod
     def resolve_wellknown_to_token_url(cls, wellknown_url):
         import hashlib
@@ -108,16 +141,92 @@ class DjangoCachedCognitoOIDCAuth(CognitoOIDCAuth):
         cache.set(cache_key, token_endpoint, 30)
         return token_endpoint
 
-    def get_auth_header(self, *args, **kwargs):
+    def _cache_key(self):
         import hashlib
-        from django.core.cache import cache
-        cache_key = "auth_header_cache" + hashlib.md5(
+        return "auth_token_" + hashlib.md5(
             f"{self.CLIENT_ID}:{self.CLIENT_SECRET}:{self.SCOPE}".encode("utf-8")
         ).hexdigest()
 
-        cached_value = cache.get(cache_key)
-        if cached_value:
-            return cached_value
-        a, b, exp = super().get_auth_header(*args, **kwargs)
-        cache.set(cache_key, (a, b, 0), exp - 60 if exp > 60 else exp / 2)
-        return a, b, exp
+    def _is_usable(self, token, now):
+        return bool(token) and now < token["expires_at"] - self.EXPIRY_MARGIN_SECONDS
+
+    def get_auth_header(self, *args, **kwargs):
+        """
+        Returns the token from the process memory, or the Django cache, or requests it.
+        The token is requested by a single process at once (the others wait for
+        the result) and is refreshed in the background before it expires,
+        while the current one is still returned.
+        """
+        from django.core.cache import cache
+
+        cache_key = self._cache_key()
+        now = time.time()
+        token = self._local_tokens.get(cache_key)
+        if not self._is_usable(token, now) or now >= token["refresh_at"]:
+            token = cache.get(cache_key)
+            if self._is_usable(token, now):
+                with self._local_lock:
+                    self._local_tokens[cache_key] = token
+
+        if self._is_usable(token, now):
+            if now >= token["refresh_at"]:
+                # stale-while-revalidate
+                if cache.add(cache_key + "_lock", 1, self.LOCK_TIMEOUT_SECONDS):
+                    threading.Thread(
+                        target=self._refresh_token, args=(cache_key, "auth.token.background"), daemon=True,
+                    ).start()
+            return self._header(token, now)
+
+        if cache.add(cache_key + "_lock", 1, self.LOCK_TIMEOUT_SECONDS):
+            token = self._refresh_token(cache_key)
+        else:
+            token = self._wait_for_token(cache_key)
+        return self._header(token, time.time())
+
+    def _header(self, token, now):
+        name, value = token["header"]
+        return name, value, int(token["expires_at"] - now)
+
+    def _wait_for_token(self, cache_key):
+        """
+        Some other process is fetching the token; wait for it instead of sending
+        the same request, unless it takes too long
+        """
+        from django.core.cache import cache
+
+        wait_until = time.time() + self.LOCK_WAIT_SECONDS
+        while time.time() < wait_until:
+            token = cache.get(cache_key)
+            if self._is_usable(token, time.time()):
+                with self._local_lock:
+                    self._local_tokens[cache_key] = token
+                return token
+            if not cache.get(cache_key + "_lock"):
+                # released without the result (failed) or the cache is unavailable
+                break
+            time.sleep(0.1)
+        return self._refresh_token(cache_key, lock_acquired=False)
+
+    def _refresh_token(self, cache_key, call_name="auth.token", lock_acquired=True):
+        from django.core.cache import cache
+
+        try:
+            name, value, exp = self.fetch_token(call_name)
+            now = time.time()
+            token = {
+                "header": (name, value),
+                "expires_at": now + exp,
+                "refresh_at": now + exp - max(self.REFRESH_BEFORE_SECONDS, exp / 4),
+            }
+            cache.set(cache_key, token, exp)
+            with self._local_lock:
+                self._local_tokens[cache_key] = token
+            return token
+        except Exception as e:
+            # background refresh errors are just logged, next calls will try again
+            logger.exception(e)
+            if call_name != "auth.token.background":
+                raise
+        finally:
+            if lock_acquired:
+                cache.delete(cache_key + "_lock")
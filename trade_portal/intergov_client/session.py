@@ -0,0 +1,85 @@
+import logging
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (5, 30)
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+# statuses worth retrying: the node API is behind load balancers which return these
+# while the upstream service is being restarted
+RETRY_STATUSES = (502, 503, 504)
+
+
+def make_retry(retries=DEFAULT_RETRIES, backoff_factor=DEFAULT_BACKOFF_FACTOR) -> Retry:
+    # the default allowed methods are idempotent ones only (GET, PUT, DELETE, HEAD...),
+    # so posting a message is never repeated by the retry logic
+    return Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        raise_on_status=False,
+    )
+
+
+def make_session(pool_sizes=None, retries=DEFAULT_RETRIES, backoff_factor=DEFAULT_BACKOFF_FACTOR):
+    """
+    Session with keep-alive connections pool and retries with exponential backoff
+
+    pool_sizes: {url_prefix: max connections kept to that host}; requests to other
+    urls use the default pool size
+    """
+    session = requests.Session()
+    for prefix in ("http://", "https://"):
+        session.mount(
+            prefix,
+            HTTPAdapter(
+                pool_maxsize=DEFAULT_POOL_SIZE,
+                max_retries=make_retry(retries, backoff_factor),
+            ),
+        )
+    # the longest prefix wins so endpoints get their own adapters
+    for prefix, pool_size in (pool_sizes or {}).items():
+        session.mount(
+            prefix,
+            HTTPAdapter(
+                pool_maxsize=pool_size,
+                max_retries=make_retry(retries, backoff_factor),
+            ),
+        )
+    return session
+
+
+class HttpMixin:
+    """
+    Performs requests using the shared session, with the timeout and reports
+    latency of each call to the metrics callback
+    metrics_callback(call_name: str, seconds: float, status_code: int or None)
+    """
+
+    session = None
+    timeout = DEFAULT_TIMEOUT
+    metrics_callback = None
+
+    def _request(self, call_name: str, method: str, url: str, **kwargs):
+        if self.session is None:
+            self.session = make_session()
+        kwargs.setdefault("timeout", self.timeout)
+        started = time.perf_counter()
+        status_code = None
+        try:
+            resp = getattr(self.session, method)(url, **kwargs)
+            status_code = resp.status_code
+            return resp
+        finally:
+            if self.metrics_callback:
+                try:
+                    self.metrics_callback(call_name, time.perf_counter() - started, status_code)
+                except Exception as e:
+                    logger.exception(e)
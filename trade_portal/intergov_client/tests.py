@@ -3,6 +3,7 @@ from unittest import mock
 
 from . import IntergovClient
 from .auth import DumbAuth
+from .session import DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT
 
 
 class MockedResponse:
@@ -52,7 +53,7 @@ def test_init():
     assert e.value.args[0] == "Document API must be configured first"
 
 
-@mock.patch("requests.get")
+@mock.patch("requests.Session.get")
 def test_retrieve_message(get_mock):
     ac = DumbAuth()
     c = IntergovClient(
@@ -66,7 +67,7 @@ def test_retrieve_message(get_mock):
     assert ret == {"lala": "lala"}
 
 
-@mock.patch("requests.post")
+@mock.patch("requests.Session.post")
 def test_subscribe(get_mock):
     ac = DumbAuth()
     auth_h_name, auth_h_value, exp = ac.get_subscr_auth_header()
@@ -92,6 +93,159 @@ def test_subscribe(get_mock):
         headers={
             auth_h_name: auth_h_value,
         },
+        timeout=DEFAULT_TIMEOUT,
     )
 
     assert ret is True
+
+
+def test_session_pools_and_retries():
+    c = IntergovClient(
+        country="GB",
+        endpoints={"message": "http://message-api.tld", "document": "http://document-api.tld"},
+        auth_class=DumbAuth(),
+        pool_sizes={"message": 20, "subscription": 5},
+        retries=5,
+    )
+    message_adapter = c.session.get_adapter("http://message-api.tld/message/123")
+    assert message_adapter._pool_maxsize == 20
+    assert message_adapter.max_retries.total == 5
+    # not configured explicitly
+    assert c.session.get_adapter("http://document-api.tld/123")._pool_maxsize == DEFAULT_POOL_SIZE
+    # only idempotent requests are retried
+    assert message_adapter.max_retries.is_retry("GET", 503)
+    assert not message_adapter.max_retries.is_retry("POST", 503)
+
+
+@mock.patch("requests.Session.get")
+def test_metrics_callback(get_mock):
+    calls = []
+    c = IntergovClient(
+        country="GB",
+        endpoints={"message": "http://dumb-domain.tld"},
+        auth_class=DumbAuth(),
+        metrics_callback=lambda *args: calls.append(args),
+    )
+    get_mock.return_value = MockedResponse(200, json={})
+    assert c.retrieve_message("message-sender-ref") == {}
+    assert len(calls) == 1
+    call_name, seconds, status_code = calls[0]
+    assert (call_name, status_code) == ("message.retrieve", 200)
+    assert seconds >= 0
+
+    get_mock.side_effect = ConnectionError("Node is down")
+    with pytest.raises(ConnectionError):
+        c.retrieve_message("message-sender-ref")
+    assert calls[1][0] == "message.retrieve" and calls[1][2] is None
+
+
+def test_async_retrieve_messages():
+    import asyncio
+
+    import httpx
+
+    from .aio import AsyncIntergovClient
+
+    requested = []
+    in_flight = {"now": 0, "max": 0}
+
+    async def handler(request):
+        sender_ref = request.url.path.split("/")[-1]
+        requested.append(sender_ref)
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(0.01)
+        in_flight["now"] -= 1
+        if sender_ref == "GB:flaky" and requested.count(sender_ref) == 1:
+            return httpx.Response(503)
+        if sender_ref == "GB:missing":
+            return httpx.Response(404)
+        return httpx.Response(200, json={"sender_ref": sender_ref})
+
+    async def retrieve(sender_refs):
+        async with AsyncIntergovClient(
+            country="GB",
+            endpoints={"message": "http://dumb-domain.tld"},
+            auth_class=DumbAuth(),
+            client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        ) as c:
+            return await c.retrieve_messages(sender_refs, concurrency=3)
+
+    sender_refs = [f"GB:{i}" for i in range(10)] + ["GB:flaky", "GB:missing"]
+    result = asyncio.run(retrieve(sender_refs))
+
+    assert list(result.keys()) == sender_refs
+    assert result["GB:5"] == {"sender_ref": "GB:5"}
+    # 503 is retried, 404 is not
+    assert result["GB:flaky"] == {"sender_ref": "GB:flaky"}
+    assert result["GB:missing"] is None
+    assert requested.count("GB:missing") == 1
+    assert in_flight["max"] == 3
+
+
+@pytest.fixture
+def cached_auth():
+    from django.core.cache.backends.locmem import LocMemCache
+
+    from .auth import DjangoCachedCognitoOIDCAuth
+
+    DjangoCachedCognitoOIDCAuth._local_tokens.clear()
+    with mock.patch("django.core.cache.cache", LocMemCache("auth-tests", {})):
+        yield DjangoCachedCognitoOIDCAuth("http://token-url.tld", "client-id", "secret", "scope")
+    DjangoCachedCognitoOIDCAuth._local_tokens.clear()
+
+
+def test_cached_auth_single_flight(cached_auth):
+    import threading
+    import time
+
+    def slow_fetch(call_name="auth.token"):
+        time.sleep(0.2)
+        return "Authorization", "token-1", 3600
+
+    with mock.patch.object(cached_auth, "fetch_token", side_effect=slow_fetch) as fetch_mock:
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(cached_auth.get_auth_header()))
+            for i in range(10)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    assert fetch_mock.call_count == 1
+    assert {value for name, value, exp in results} == {"token-1"}
+
+    # served from the process memory now, without the cache
+    with mock.patch("django.core.cache.cache") as cache_mock:
+        assert cached_auth.get_auth_header()[1] == "token-1"
+    assert cache_mock.get.call_count == 0
+
+
+def test_cached_auth_refresh_before_expiry(cached_auth):
+    import time
+
+    with mock.patch.object(cached_auth, "fetch_token", return_value=("Authorization", "token-1", 3600)):
+        cached_auth.get_auth_header()
+    from django.core.cache import cache
+
+    # the refresh time has come, for both the process memory and the shared cache
+    token = cached_auth._local_tokens[cached_auth._cache_key()]
+    token["refresh_at"] = time.time() - 1
+    cache.set(cached_auth._cache_key(), token, 3600)
+
+    with mock.patch.object(cached_auth, "fetch_token", return_value=("Authorization", "token-2", 3600)) as fetch_mock:
+        with mock.patch("threading.Thread") as thread_mock:
+            # the current token is still returned while the new one is requested in the background
+            assert cached_auth.get_auth_header()[1] == "token-1"
+            assert thread_mock.call_count == 1
+            thread_kwargs = thread_mock.call_args[1]
+            thread_kwargs["target"](*thread_kwargs["args"])
+        assert fetch_mock.call_args[0] == ("auth.token.background",)
+        assert cached_auth.get_auth_header()[1] == "token-2"
+
+    # expired tokens are never returned
+    cached_auth._local_tokens.clear()
+    cache.set(cached_auth._cache_key(), dict(token, expires_at=time.time() + 5), 10)
+    with mock.patch.object(cached_auth, "fetch_token", return_value=("Authorization", "token-3", 3600)):
+        assert cached_auth.get_auth_header()[1] == "token-3"
@@ -75,6 +75,25 @@ class ShortCertificateSerializer(serializers.ModelSerializer):
         return obj.exporter.clear_business_id if obj.exporter else None
 
 
+class CertificateChangeSerializer(serializers.ModelSerializer):
+    # the changes feed item, just enough to tell which certificates to fetch again
+    verificationStatus = serializers.CharField(source="verification_status", read_only=True)
+    messageStatus = serializers.CharField(source="status", read_only=True)
+    workflowStatus = serializers.CharField(source="workflow_status", read_only=True)
+    updatedAt = serializers.DateTimeField(source="updated_at", read_only=True)
+
+    class Meta:
+        model = Document
+        fields = (
+            "id",
+            "version",
+            "updatedAt",
+            "verificationStatus",
+            "messageStatus",
+            "workflowStatus",
+        )
+
+
 class CertificateSerializer(serializers.Serializer):
     importingCountry = CountryField(source="importing_country", read_only=True)
     verificationStatus = serializers.CharField(
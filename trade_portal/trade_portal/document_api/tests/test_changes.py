@@ -0,0 +1,164 @@
+import datetime
+from unittest import mock
+
+import pytest
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from trade_portal.documents.models import Document, DocumentFile, OaDetails, Party
+from trade_portal.documents.tests.factories import DocumentFactory, PartyFactory
+
+pytestmark = pytest.mark.django_db
+
+CHANGES_URL = "/api/documents/v0/CertificatesOfOrigin/changes/"
+
+
+@pytest.fixture
+def api_client(docapi_env):
+    c = APIClient()
+    c.credentials(HTTP_AUTHORIZATION=f'Token {docapi_env["t1"].access_token}')
+    return c
+
+
+def _changes(api_client, since, **params):
+    resp = api_client.get(CHANGES_URL, dict(params, since=since))
+    assert resp.status_code == 200, resp.content
+    return resp.json()
+
+
+def test_document_version(docapi_env):
+    doc = DocumentFactory()
+    doc.refresh_from_db()
+    assert doc.version == 1
+
+    # saved without changes
+    doc.save()
+    doc.refresh_from_db()
+    assert doc.version == 1
+
+    # bookkeeping only
+    Document.objects.filter(pk=doc.pk).update(verification_checked_at=timezone.now())
+    doc.refresh_from_db()
+    assert doc.version == 1
+
+    Document.objects.filter(pk=doc.pk).update(verification_status=Document.V_STATUS_VALID)
+    doc.refresh_from_db()
+    assert doc.version == 2
+    updated_at = doc.updated_at
+
+    # the stale instance saved
+    stale = Document.objects.get(pk=doc.pk)
+    Document.objects.filter(pk=doc.pk).update(status=Document.STATUS_VALIDATED)
+    stale.save()
+    doc.refresh_from_db()
+    assert doc.version == 4
+    assert doc.updated_at >= updated_at
+
+    docfile = DocumentFile.objects.create(doc=doc, file=ContentFile(b"%PDF", name="a.pdf"), filename="a.pdf")
+    doc.refresh_from_db()
+    assert doc.version == 5
+
+    # the file bookkeeping only
+    docfile.update_metadata("pages", 1)
+    DocumentFile.objects.filter(pk=docfile.pk).update(size=4, is_watermarked=None)
+    doc.refresh_from_db()
+    assert doc.version == 5
+
+    DocumentFile.objects.filter(pk=docfile.pk).update(filename="b.pdf")
+    doc.refresh_from_db()
+    assert doc.version == 6
+
+    docfile.delete()
+    doc.refresh_from_db()
+    assert doc.version == 7
+
+
+def test_changes_feed(api_client, settings):
+    settings.API_CHANGES_LAG_SECONDS = 0
+    docs = [DocumentFactory() for i in range(3)]
+
+    data = _changes(api_client, "", page_size=2)
+    assert data["hasMore"]
+    seen = [item["id"] for item in data["results"]]
+    data = _changes(api_client, data["cursor"], page_size=2)
+    assert not data["hasMore"]
+    seen += [item["id"] for item in data["results"]]
+    assert seen == [str(doc.pk) for doc in docs]
+
+    # nothing changed
+    cursor = data["cursor"]
+    assert _changes(api_client, cursor)["results"] == []
+    assert _changes(api_client, cursor)["cursor"] == cursor
+
+    Document.objects.filter(pk=docs[0].pk).update(verification_status=Document.V_STATUS_VALID)
+    data = _changes(api_client, cursor)
+    assert data["results"] == [
+        {
+            "id": str(docs[0].pk),
+            "version": 2,
+            "updatedAt": data["results"][0]["updatedAt"],
+            "verificationStatus": Document.V_STATUS_VALID,
+            "messageStatus": docs[0].status,
+            "workflowStatus": docs[0].workflow_status,
+        }
+    ]
+    assert api_client.get(data["next"]).json()["results"] == []
+
+    assert api_client.get(CHANGES_URL, {"since": "invalid"}).status_code == 404
+
+
+def test_changes_feed_lag(api_client, settings):
+    settings.API_CHANGES_LAG_SECONDS = 60
+    old, new = DocumentFactory(), DocumentFactory()
+    old.refresh_from_db()
+
+    # the new one is changed less than a minute ago
+    with mock.patch(
+        "trade_portal.document_api.views.timezone.now",
+        return_value=old.updated_at + datetime.timedelta(seconds=60),
+    ):
+        data = _changes(api_client, "")
+    # the recent change is returned but the cursor stays before it
+    assert [item["id"] for item in data["results"]] == [str(old.pk), str(new.pk)]
+    assert [item["id"] for item in _changes(api_client, data["cursor"])["results"]] == [str(new.pk)]
+
+
+def test_certificate_etag(api_client):
+    doc = DocumentFactory(exporter=PartyFactory(name="Wine Exports"))
+    url = f"/api/documents/v0/CertificatesOfOrigin/{doc.pk}/"
+    resp = api_client.get(url)
+    assert resp.status_code == 200
+    etag = resp["ETag"]
+    assert "no-cache" in resp["Cache-Control"]
+
+    resp = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == 304
+    assert resp["ETag"] == etag
+
+    Document.objects.filter(pk=doc.pk).update(importer_name="Somebody else")
+    resp = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == 200
+    assert resp["ETag"] != etag
+    etag = resp["ETag"]
+
+    # the exporter is rendered with the document
+    doc.exporter.name = "Renamed Exporter"
+    doc.exporter.save()
+    resp = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == 200
+    assert resp["ETag"] != etag
+    etag = resp["ETag"]
+
+    # and so is the OA (the QR code), the new encryption changes it as well
+    doc.oa.save_ciphertext("new-iv", "new-tag", "new-ciphertext")
+    resp = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == 200
+    assert resp["ETag"] != etag
+    etag = resp["ETag"]
+
+    # the bookkeeping changes don't
+    OaDetails.objects.filter(pk=doc.oa.pk).update(issue_queued_at=timezone.now())
+    Party.objects.filter(pk=doc.exporter.pk).update(created_by_org=None)
+    resp = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == 304
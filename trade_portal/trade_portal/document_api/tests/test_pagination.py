@@ -0,0 +1,72 @@
+import datetime
+
+import pytest
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from trade_portal.documents.models import Document
+from trade_portal.documents.tests.factories import DocumentFactory
+
+pytestmark = pytest.mark.django_db
+
+LIST_URL = "/api/documents/v0/CertificatesOfOrigin/"
+
+
+@pytest.fixture
+def api_client(docapi_env):
+    c = APIClient()
+    c.credentials(HTTP_AUTHORIZATION=f'Token {docapi_env["t1"].access_token}')
+    return c
+
+
+def _create_documents(count):
+    now = timezone.now()
+    for i in range(count):
+        doc = DocumentFactory()
+        # pairs of documents created at the same moment
+        Document.objects.filter(pk=doc.pk).update(created_at=now - datetime.timedelta(minutes=i // 2))
+    return [
+        str(pk) for pk in Document.objects.order_by("-created_at", "-id").values_list("pk", flat=True)
+    ]
+
+
+def test_cursor_pagination(api_client):
+    expected = _create_documents(7)
+
+    resp = api_client.get(LIST_URL, {"cursor": "", "page_size": 2})
+    assert resp.status_code == 200
+    assert list(resp.json()) == ["next", "results"]
+    seen = [doc["id"] for doc in resp.json()["results"]]
+    next_link = resp.json()["next"]
+    # the new documents don't shift the pages already being walked
+    DocumentFactory()
+    while next_link:
+        resp = api_client.get(next_link)
+        assert resp.status_code == 200
+        assert len(resp.json()["results"]) <= 2
+        seen += [doc["id"] for doc in resp.json()["results"]]
+        next_link = resp.json()["next"]
+    assert seen == expected
+
+    assert api_client.get(LIST_URL, {"cursor": "invalid"}).status_code == 404
+    assert api_client.get(LIST_URL, {"cursor": "aW52YWxpZHxpbnZhbGlk"}).status_code == 404
+
+
+def test_pagination_without_count(api_client):
+    expected = _create_documents(5)
+
+    resp = api_client.get(LIST_URL, {"count": "false", "page_size": 2})
+    assert resp.json()["count"] is None
+    assert resp.json()["previous"] is None
+    assert [doc["id"] for doc in resp.json()["results"]] == expected[:2]
+
+    resp = api_client.get(resp.json()["next"])
+    assert "page=" not in resp.json()["previous"]
+    resp = api_client.get(resp.json()["next"])
+    assert [doc["id"] for doc in resp.json()["results"]] == expected[4:]
+    assert resp.json()["next"] is None
+    assert "page=2" in resp.json()["previous"]
+
+    assert api_client.get(LIST_URL, {"count": "false", "page": "0"}).status_code == 404
+    # counted as before otherwise
+    assert api_client.get(LIST_URL).json()["count"] == 5
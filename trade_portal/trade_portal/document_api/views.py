@@ -1,9 +1,17 @@
+import datetime
 import json
+import uuid
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
 
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import transaction
 from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_datetime
 from django.utils.functional import cached_property
 from rest_framework import (
     viewsets,
@@ -14,21 +22,121 @@ from rest_framework import (
     status,
     exceptions,
 )
+from rest_framework.decorators import action
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 from trade_portal.document_api.serializers import (
+    CertificateChangeSerializer,
     CertificateSerializer,
     ShortCertificateSerializer,
 )
 from trade_portal.documents.models import Document, DocumentFile
+from trade_portal.documents.services.access import visible_documents
+from trade_portal.documents.services.search import search_documents
 from trade_portal.documents.tasks import textract_document, lodge_document, fill_document_metadata
+from trade_portal.utils.dates import date_range_filter
+
+
+def encode_cursor(moment, pk) -> str:
+    """
+    The position in the documents list ordered by some datetime field and id
+    """
+    return urlsafe_b64encode(f"{moment.isoformat()}|{pk}".encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        moment, pk = urlsafe_b64decode(cursor.encode()).decode().split("|")
+        moment = parse_datetime(moment)
+        if moment is None:
+            raise ValueError(cursor)
+        return moment, uuid.UUID(pk)
+    except (ValueError, TypeError):
+        # including the base64 and unicode decoding errors
+        raise exceptions.NotFound("Invalid cursor")
 
 
 class PaginationBy10(PageNumberPagination):
+    """
+    Pages by number, as usual, or by cursor (for going through all the documents):
+
+        ?cursor= for the first page, the "next" link has the cursor of the next one;
+            the newest documents first (whatever the other ordering is), the documents
+            created meanwhile don't shift the pages and there is no total count
+        ?count=false skips counting the documents for pages by number ("count" is null)
+    """
     page_size = 20
     page_size_query_param = "page_size"
     max_page_size = 1000
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        self.counted = request.query_params.get(self.count_query_param, "").lower() != "false"
+        if self.cursor_mode:
+            return self._paginate_by_cursor(queryset, request)
+        if not self.counted:
+            return self._paginate_without_count(queryset, request)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_mode:
+            return Response(OrderedDict([
+                ("next", self._next_link),
+                ("results", data),
+            ]))
+        if not self.counted:
+            return Response(OrderedDict([
+                ("count", None),
+                ("next", self._next_link),
+                ("previous", self._previous_link),
+                ("results", data),
+            ]))
+        return super().get_paginated_response(data)
+
+    def _paginate_by_cursor(self, queryset, request):
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by("-created_at", "-id")
+        cursor = request.query_params[self.cursor_query_param]
+        if cursor:
+            created_at, pk = decode_cursor(cursor)
+            # (created_at, id) < (cursor values), written so the created_at index bounds the scan
+            queryset = queryset.filter(created_at__lte=created_at).exclude(created_at=created_at, pk__gte=pk)
+        rows = list(queryset[:page_size + 1])
+        self._next_link = None
+        if len(rows) > page_size:
+            last = rows[page_size - 1]
+            self._next_link = replace_query_param(
+                self.request.build_absolute_uri(),
+                self.cursor_query_param,
+                encode_cursor(last.created_at, last.pk),
+            )
+        return rows[:page_size]
+
+    def _paginate_without_count(self, queryset, request):
+        page_size = self.get_page_size(request)
+        try:
+            page_number = int(request.query_params.get(self.page_query_param, 1))
+            if page_number < 1:
+                raise ValueError(page_number)
+        except ValueError:
+            raise exceptions.NotFound(self.invalid_page_message)
+        offset = (page_number - 1) * page_size
+        rows = list(queryset[offset:offset + page_size + 1])
+        url = self.request.build_absolute_uri()
+        self._next_link = None
+        if len(rows) > page_size:
+            self._next_link = replace_query_param(url, self.page_query_param, page_number + 1)
+        self._previous_link = None
+        if page_number == 2:
+            self._previous_link = remove_query_param(url, self.page_query_param)
+        elif page_number > 2:
+            self._previous_link = replace_query_param(url, self.page_query_param, page_number - 1)
+        return rows[:page_size]
 
 
 class QsMixin(object):
@@ -51,33 +159,7 @@ class QsMixin(object):
                 raise Exception("Please provide specific org for that request")
 
     def get_queryset(self):
-        # note: this code is copied from the documents/views/documents.py
-        # but will change in the future, having different filtering logic
-        qs = Document.objects.all()
-        if self.current_org.is_regulator:
-            # regulator can see everything
-            pass
-        elif self.current_org.is_chambers:
-            # chambers can see only their own documents
-            qs = qs.filter(created_by_org=self.current_org)
-        elif self.current_org.is_trader:
-            qs = (
-                qs.filter(
-                    importer_name__in=(
-                        self.current_org.name,
-                        self.current_org.business_id,
-                    )
-                )
-                | qs.filter(
-                    exporter__clear_business_id=self.current_org.business_id
-                ).exclude(exporter__clear_business_id="")
-                | qs.filter(exporter__name=self.current_org.name).exclude(
-                    exporter__name=""
-                )
-            )
-        else:
-            qs = Document.objects.none()
-
+        qs = visible_documents(Document.objects.all(), self.current_org)
         qs = qs.select_related("issuer", "exporter")
         return qs
 
@@ -104,6 +186,7 @@ class CertificateViewSet(
             exporter={business identifier (ABN in AU)}
             createdDateAfter={date}
             createdDateBefore={date}
+            q={free text search, the best matches first}
 
         """
         qs = super().get_queryset()
@@ -131,7 +214,7 @@ class CertificateViewSet(
             createdDateAfter = self.request.GET.get("createdDateAfter")
             if createdDateAfter:
                 try:
-                    qs = qs.filter(created_at__date__gte=createdDateAfter)
+                    qs = qs.filter(**date_range_filter("created_at", after=createdDateAfter))
                 except ValidationError as e:
                     raise serializers.ValidationError(
                         {"createdDateAfter": e.error_list[0]}
@@ -140,12 +223,16 @@ class CertificateViewSet(
             createdDateBefore = self.request.GET.get("createdDateBefore")
             if createdDateBefore:
                 try:
-                    qs = qs.filter(created_at__date__lte=createdDateBefore)
+                    qs = qs.filter(**date_range_filter("created_at", before=createdDateBefore))
                 except ValidationError as e:
                     raise serializers.ValidationError(
                         {"createdDateBefore": e.error_list[0]}
                     )
 
+            q = self.request.GET.get("q", "").strip()
+            if q:
+                qs = search_documents(qs, q)
+
         return qs
 
     def get_serializer(self, *args, **kwargs):
@@ -169,7 +256,47 @@ class CertificateViewSet(
         return super().create(*args, **kwargs)
 
     def retrieve(self, request, pk=None):
-        return Response(self.get_serializer(self.get_object()).data)
+        obj = self.get_object()
+        # the representation is the same for all organisations
+        etag = f'"{obj.pk}-{obj.version}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = Response(self.get_serializer(obj).data)
+        response["ETag"] = etag
+        # the client may keep it, asking if it's still fresh (If-None-Match) every time
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    @action(detail=False)
+    def changes(self, request):
+        """
+        The certificates changed after the cursor (?since=, empty for all of them), the oldest
+        changes first; the same filters as the list apply. Fetch the certificates having new
+        versions, then request the "next" link right away if "hasMore" or later otherwise.
+        The same version of a certificate could be returned more than once.
+        """
+        page_size = self.paginator.get_page_size(request)
+        since = request.query_params.get("since", "")
+        qs = self.get_queryset().order_by("updated_at", "id")
+        if since:
+            updated_at, pk = decode_cursor(since)
+            # (updated_at, id) > (cursor values), the same way as the cursor pagination does
+            qs = qs.filter(updated_at__gte=updated_at).exclude(updated_at=updated_at, pk__lte=pk)
+        changes = list(qs[:page_size])
+
+        # the cursor is not moved to the changes made less than API_CHANGES_LAG_SECONDS ago
+        safe_before = timezone.now() - datetime.timedelta(seconds=settings.API_CHANGES_LAG_SECONDS)
+        cursor = since
+        for doc in changes:
+            if doc.updated_at > safe_before:
+                break
+            cursor = encode_cursor(doc.updated_at, doc.pk)
+        return Response(OrderedDict([
+            ("cursor", cursor),
+            ("next", replace_query_param(request.build_absolute_uri(), "since", cursor)),
+            ("hasMore", len(changes) == page_size and cursor != since),
+            ("results", CertificateChangeSerializer(changes, many=True).data),
+        ]))
 
 
 class CertificateFileView(QsMixin, views.APIView):
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+
+from trade_portal.documents.models import Document
+from trade_portal.documents.services.access import legacy_visible_documents, visible_documents
+from trade_portal.users.models import Organisation
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the trader documents list query using the visibility rows to "
+        "matching the importer/exporter names, printing the timings and query plans"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--org", type=int, help="trader organisation id, the one seeing most documents by default")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--plans", action="store_true", default=False)
+
+    def handle(self, *args, **kwargs):
+        if kwargs["org"]:
+            org = Organisation.objects.get(pk=kwargs["org"])
+        else:
+            org = Organisation.objects.filter(is_trader=True).annotate(
+                documents_count=Count("document_access")
+            ).order_by("-documents_count").first()
+        if org is None:
+            self.stderr.write("No trader organisations")
+            return
+        self.stdout.write(f"Organisation {org.pk} {org}")
+
+        qs = Document.objects.select_related("issuer", "exporter")
+        for name, func in (("access rows", visible_documents), ("legacy filters", legacy_visible_documents)):
+            # the first page of the documents list and its count, as the list view asks for them
+            page_qs = func(qs, org).order_by("-created_at")[:25]
+            count_qs = func(qs, org)
+            timings = []
+            for i in range(kwargs["repeat"]):
+                t0 = time.perf_counter()
+                list(page_qs)
+                count = count_qs.count()
+                timings.append(time.perf_counter() - t0)
+            timings.sort()
+            self.stdout.write(
+                f"{name}: {count} documents, median {timings[len(timings) // 2] * 1000:.1f}ms, "
+                f"max {timings[-1] * 1000:.1f}ms"
+            )
+            if kwargs["plans"]:
+                sql, params = page_qs.query.sql_with_params()
+                with connection.cursor() as cursor:
+                    cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {sql}", params)
+                    self.stdout.write("\n".join(row[0] for row in cursor.fetchall()))
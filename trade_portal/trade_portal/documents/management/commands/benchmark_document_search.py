@@ -0,0 +1,97 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from trade_portal.documents.services.search import SEARCH_CONFIG, WORD_RE, _word_query
+
+WORDS = [
+    "Certificate", "Origin", "Preferential", "Non-preferential", "Issued", "Draft",
+    "Australia", "Singapore", "China", "Indonesia", "AANZFTA", "ChAFTA", "Pty", "Ltd",
+    "Trading", "Export", "Wine", "Beef", "Wool", "Barley", "Holdings", "International",
+]
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the substring (icontains) search to the indexed search vector on a synthetic "
+        "table of the given size; the table is temporary and nothing is left in the database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1000000)
+        parser.add_argument("--queries", type=int, default=100)
+
+    def handle(self, *args, **kwargs):
+        rnd = random.Random(42)
+        # documents numbers, names and countries, similar to Document.search_field
+        queries = [
+            rnd.choice([
+                f"AU-{rnd.randint(1, kwargs['rows'])}",
+                rnd.choice(WORDS),
+                f"{rnd.choice(WORDS)} {rnd.choice(WORDS)}",
+                f"{rnd.randint(10000000000, 99999999999)}",
+            ])
+            for i in range(kwargs["queries"])
+        ]
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            t0 = time.perf_counter()
+            cursor.execute("CREATE TEMPORARY TABLE benchmark_search (id serial, search_field text) ON COMMIT DROP")
+            cursor.execute(
+                "INSERT INTO benchmark_search (search_field) "
+                "SELECT concat_ws(E'\\n', "
+                "  'Certificate of Origin', 'Issued', 'AU-' || i, md5(i::text), "
+                "  (%(words)s)[1 + i %% array_length(%(words)s, 1)], "
+                "  (%(words)s)[1 + (i / 7) %% array_length(%(words)s, 1)] || ' Pty Ltd', "
+                "  (10000000000 + (i::bigint * 7919) %% 89999999999)::text) "
+                "FROM generate_series(1, %(rows)s) AS i",
+                {"words": WORDS, "rows": kwargs["rows"]},
+            )
+            cursor.execute(
+                "ALTER TABLE benchmark_search ADD COLUMN search_vector tsvector; "
+                "UPDATE benchmark_search SET search_vector = to_tsvector(%s, search_field); "
+                "ANALYZE benchmark_search",
+                [SEARCH_CONFIG],
+            )
+            self.stdout.write(f"{kwargs['rows']} rows created in {time.perf_counter() - t0:.1f}s")
+
+            def measure(name, sql, params_func):
+                timings = []
+                for q in queries:
+                    t0 = time.perf_counter()
+                    cursor.execute(sql, params_func(q))
+                    cursor.fetchall()
+                    timings.append(time.perf_counter() - t0)
+                self.stdout.write(
+                    f"{name}: p50 {_percentile(timings, 50) * 1000:.1f}ms, "
+                    f"p95 {_percentile(timings, 95) * 1000:.1f}ms"
+                )
+
+            # the first page, the way the documents list asks for it
+            measure(
+                "icontains",
+                "SELECT id FROM benchmark_search WHERE UPPER(search_field) LIKE UPPER(%s) "
+                "ORDER BY id DESC LIMIT 25",
+                lambda q: [f"%{q}%"],
+            )
+            t0 = time.perf_counter()
+            cursor.execute("CREATE INDEX ON benchmark_search USING gin (search_vector)")
+            self.stdout.write(f"Index created in {time.perf_counter() - t0:.1f}s")
+            measure(
+                "search vector, ranked",
+                "SELECT id FROM benchmark_search WHERE search_vector @@ to_tsquery(%s, %s) "
+                "ORDER BY ts_rank(search_vector, to_tsquery(%s, %s)) DESC, id DESC LIMIT 25",
+                lambda q: [SEARCH_CONFIG, self._tsquery(q)] * 2,
+            )
+
+    @staticmethod
+    def _tsquery(text):
+        # the same query build_search_query() makes
+        return " & ".join(_word_query(word) for word in WORD_RE.findall(text.lower()))
@@ -0,0 +1,51 @@
+import base64
+import json
+import os
+import tracemalloc
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+
+from trade_portal.utils.jsonstream import Base64File, JsonReader
+
+
+def _drain(reader, chunk_size=64 * 1024):
+    # what the storage and HTTP client do with the file object passed to them
+    while reader.read(chunk_size):
+        pass
+
+
+def _in_memory(attachment: ContentFile):
+    # the way OA document used to be processed before the streaming
+    oa_doc = {"attachedFile": {"file": base64.b64encode(attachment.read()).decode("utf-8")}}
+    len(json.dumps(oa_doc))
+    json.dumps(oa_doc, indent=2).encode("utf-8")
+    json.dumps({"document": oa_doc}).encode("utf-8")
+
+
+def _streamed(attachment: ContentFile):
+    oa_doc = {"attachedFile": {"file": Base64File(attachment)}}
+    oa_doc_file = JsonReader(oa_doc)
+    len(oa_doc_file)
+    _drain(oa_doc_file)
+    _drain(JsonReader({"document": oa_doc}))
+
+
+class Command(BaseCommand):
+    help = "Measure peak memory used to serialise the OA document with attachments of different sizes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=str, default="1,10,50", help="Attachment sizes, MB")
+
+    def handle(self, *args, **kwargs):
+        for size_mb in [int(size) for size in kwargs["sizes"].split(",")]:
+            attachment = ContentFile(os.urandom(size_mb * 1024 * 1024), name="attachment.pdf")
+            for name, procedure in (("in-memory", _in_memory), ("streamed", _streamed)):
+                attachment.seek(0)
+                tracemalloc.start()
+                procedure(attachment)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                self.stdout.write(
+                    f"{size_mb}MB attachment, {name}: peak {peak / 1024 / 1024:.1f}MB"
+                )
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from trade_portal.documents.services import oa_wrap
+
+
+def _sample_document(index: int) -> dict:
+    # roughly the shape (and the size without attachments) of the CoO we render
+    return {
+        "version": "https://schema.openattestation.com/2.0/schema.json",
+        "reference": f"benchmark-{index}",
+        "name": "Certificate of Origin",
+        "issuers": [
+            {
+                "name": "Trade Portal",
+                "documentStore": "0x0000000000000000000000000000000000000000",
+                "identityProof": {"type": "DNS-TXT", "location": "example.com"},
+            }
+        ],
+        "$template": {"name": "CoO", "type": "EMBEDDED_RENDERER", "url": "https://example.com"},
+        "certificateOfOrigin": {
+            "id": f"benchmark-{index}",
+            "issueDateTime": "2020-01-01T00:00:00Z",
+            "supplyChainConsignment": {
+                "includedConsignmentItems": [
+                    {"id": f"item-{i}", "tradeLineItems": [{"sequenceNumber": i}]}
+                    for i in range(10)
+                ],
+            },
+        },
+        "attachments": [],
+    }
+
+
+class Command(BaseCommand):
+    help = "Measure the native OA wrapping throughput (single and batch wrap)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=500)
+
+    def handle(self, *args, **kwargs):
+        documents = [_sample_document(i) for i in range(kwargs["count"])]
+
+        started = time.perf_counter()
+        for doc in documents:
+            oa_wrap.wrap_document(doc)
+        single_spent = time.perf_counter() - started
+
+        started = time.perf_counter()
+        oa_wrap.wrap_documents(documents)
+        batch_spent = time.perf_counter() - started
+
+        self.stdout.write(
+            f"native, one by one: {len(documents) / single_spent:.1f} documents/sec"
+        )
+        self.stdout.write(
+            f"native, single batch: {len(documents) / batch_spent:.1f} documents/sec"
+        )
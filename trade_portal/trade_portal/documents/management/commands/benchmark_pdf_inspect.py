@@ -0,0 +1,77 @@
+import io
+import os
+import time
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+
+from trade_portal.documents.models import DocumentFile
+from trade_portal.documents.services.pdf import PdfInspector
+
+DEFAULT_CORPUS = os.path.join(
+    os.path.dirname(__file__), "..", "..", "..", "oa_verify", "tests", "assets"
+)
+
+
+def _separate_parses(content: bytes):
+    # the way the file used to be read: fill_document_metadata, watermark
+    # (the page size) and textract (the first page extraction) parsed it separately
+    from PyPDF2 import PdfFileReader, PdfFileWriter
+
+    for i in range(2):
+        try:
+            PdfFileReader(io.BytesIO(content)).getPage(0).mediaBox
+        except Exception:
+            pass
+    try:
+        writer = PdfFileWriter()
+        writer.addPage(PdfFileReader(io.BytesIO(content)).getPage(0))
+        writer.write(io.BytesIO())
+    except Exception:
+        pass
+
+
+def _inspected_once(content: bytes, name: str):
+    docfile = DocumentFile(file=ContentFile(content, name=name), filename=name)
+    PdfInspector(docfile).inspect()
+    # the same 3 consumers, using the cached info
+    for i in range(3):
+        PdfInspector(docfile).first_page_size_pt()
+
+
+class Command(BaseCommand):
+    help = "Compare parsing each PDF by every consumer to a single PdfInspector pass, over a corpus of PDFs"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--corpus", type=str, default=DEFAULT_CORPUS, help="Directory with PDF files")
+        parser.add_argument("--rounds", type=int, default=3)
+
+    def handle(self, *args, **kwargs):
+        files = sorted(
+            os.path.join(kwargs["corpus"], name)
+            for name in os.listdir(kwargs["corpus"])
+            if name.lower().endswith(".pdf")
+        )
+        totals = {"separate": 0.0, "inspector": 0.0}
+        for path in files:
+            with open(path, "rb") as f:
+                content = f.read()
+            timings = {}
+            for name, procedure in (
+                ("separate", lambda: _separate_parses(content)),
+                ("inspector", lambda: _inspected_once(content, os.path.basename(path))),
+            ):
+                t0 = time.perf_counter()
+                for i in range(kwargs["rounds"]):
+                    procedure()
+                timings[name] = (time.perf_counter() - t0) / kwargs["rounds"]
+                totals[name] += timings[name]
+            self.stdout.write(
+                f"{os.path.basename(path)} ({len(content) // 1024}KB): "
+                f"separate parses {timings['separate'] * 1000:.1f}ms, "
+                f"inspector {timings['inspector'] * 1000:.1f}ms"
+            )
+        self.stdout.write(
+            f"Total for {len(files)} files: separate parses {totals['separate'] * 1000:.1f}ms, "
+            f"inspector {totals['inspector'] * 1000:.1f}ms"
+        )
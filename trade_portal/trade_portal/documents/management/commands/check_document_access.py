@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from trade_portal.documents.models import Document, DocumentAccess
+from trade_portal.documents.services.access import legacy_visible_documents
+from trade_portal.users.models import Organisation
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the documents visibility rows to the importer/exporter rule "
+        "for every organisation (or the given ones), fixing them if asked to"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--org", type=int, action="append", help="organisation id, may be repeated")
+        parser.add_argument("--fix", action="store_true", default=False)
+
+    def handle(self, *args, **kwargs):
+        orgs = Organisation.objects.order_by("pk")
+        if kwargs["org"]:
+            orgs = orgs.filter(pk__in=kwargs["org"])
+        inconsistent = 0
+        for org in orgs.iterator():
+            expected = set(legacy_visible_documents(Document.objects.all(), org).values_list("pk", flat=True))
+            actual = set(DocumentAccess.objects.filter(org=org).values_list("document_id", flat=True))
+            if expected == actual:
+                continue
+            inconsistent += 1
+            self.stdout.write(
+                f"{org.pk} {org}: {len(expected - actual)} documents missing, "
+                f"{len(actual - expected)} documents not expected"
+            )
+            if kwargs["fix"]:
+                DocumentAccess.update_for_org(org)
+        if inconsistent and not kwargs["fix"]:
+            self.stderr.write(f"{inconsistent} organisations are inconsistent, run with --fix to fix them")
+            raise SystemExit(1)
+        self.stdout.write(f"Done, {inconsistent} organisations {'fixed' if kwargs['fix'] else 'inconsistent'}")
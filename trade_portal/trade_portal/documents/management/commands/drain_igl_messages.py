@@ -0,0 +1,63 @@
+import asyncio
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from trade_portal.documents.services import get_async_ig_client
+from trade_portal.documents.services.igl import IGLService
+
+
+async def _retrieve(sender_refs, concurrency):
+    async with get_async_ig_client(concurrency) as client:
+        return await client.retrieve_messages(sender_refs, concurrency=concurrency)
+
+
+class Command(BaseCommand):
+    help = (
+        "Retrieve node messages by their sender refs concurrently and process them "
+        "the same way websub notifications are processed (to catch up after an outage)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("sender_refs", nargs="*", help="Sender refs in format AU:uuid")
+        parser.add_argument("--file", type=str, help="File with sender refs, one per line; '-' for stdin")
+        parser.add_argument("--updates", action="store_true", help="Sender refs are status updates of our messages")
+        parser.add_argument("--concurrency", type=int, default=settings.IGL_ASYNC_CONCURRENCY)
+        parser.add_argument("--chunk-size", type=int, default=500, help="Messages retrieved before processing them")
+
+    def handle(self, *args, **kwargs):
+        sender_refs = list(kwargs["sender_refs"])
+        if kwargs["file"]:
+            f = sys.stdin if kwargs["file"] == "-" else open(kwargs["file"])
+            with f:
+                sender_refs += [line.strip() for line in f if line.strip()]
+
+        service = IGLService()
+        started = time.perf_counter()
+        processed, failed = 0, 0
+        chunk_size = kwargs["chunk_size"]
+        for i in range(0, len(sender_refs), chunk_size):
+            messages = asyncio.run(_retrieve(sender_refs[i:i + chunk_size], kwargs["concurrency"]))
+            # the processing is done one by one because it's the database work
+            for sender_ref, msg_body in messages.items():
+                if not msg_body:
+                    failed += 1
+                    continue
+                try:
+                    if kwargs["updates"]:
+                        is_ok = service.update_message_by_sender_ref(sender_ref, msg_body=msg_body)
+                    else:
+                        is_ok = service.store_message_by_ping_body({"sender_ref": sender_ref}, msg_body=msg_body)
+                except Exception as e:
+                    self.stderr.write(f"{sender_ref}: {e}")
+                    is_ok = False
+                if is_ok:
+                    processed += 1
+                else:
+                    failed += 1
+            self.stdout.write(f"{min(i + chunk_size, len(sender_refs))}/{len(sender_refs)} messages done")
+        self.stdout.write(
+            f"Processed {processed}, failed {failed} in {time.perf_counter() - started:.1f}s"
+        )
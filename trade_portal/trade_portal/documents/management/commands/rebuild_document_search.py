@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from trade_portal.documents.models import Document
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the documents search field again (the search vector follows it), "
+        "needed after changing what is searched by; may be interrupted and run again"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **kwargs):
+        last_pk = None
+        done = 0
+        while True:
+            with transaction.atomic():
+                qs = Document.objects.select_related("exporter", "fta").order_by("pk")
+                if last_pk is not None:
+                    qs = qs.filter(pk__gt=last_pk)
+                chunk = list(qs[:kwargs["chunk_size"]])
+                if not chunk:
+                    break
+                changed = []
+                for document in chunk:
+                    search_field = document.search_field
+                    document._fill_search_field()
+                    if document.search_field != search_field:
+                        changed.append(document)
+                # not save() so the other fields (possibly changed meanwhile) are not written
+                Document.objects.bulk_update(changed, ["search_field"])
+            last_pk = chunk[-1].pk
+            done += len(chunk)
+            self.stdout.write(f"{done} documents processed, {len(changed)} updated in the last chunk")
+        self.stdout.write("Done")
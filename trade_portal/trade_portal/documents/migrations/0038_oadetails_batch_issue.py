@@ -0,0 +1,32 @@
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0037_documenthistoryitem_is_error'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='oadetails',
+            name='merkle_root',
+            field=models.CharField(blank=True, default='', max_length=128),
+        ),
+        migrations.AddField(
+            model_name='oadetails',
+            name='target_hash',
+            field=models.CharField(blank=True, default='', max_length=128),
+        ),
+        migrations.AddField(
+            model_name='oadetails',
+            name='proof',
+            field=django.contrib.postgres.fields.jsonb.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='oadetails',
+            name='issue_queued_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0038_oadetails_batch_issue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='lodge_stage',
+            field=models.CharField(blank=True, choices=[('watermark', 'Watermark'), ('wrap', 'Wrap'), ('encrypt', 'Encrypt'), ('notarize', 'Notarize'), ('igl', 'IGL message'), ('done', 'Done')], default='', max_length=16),
+        ),
+    ]
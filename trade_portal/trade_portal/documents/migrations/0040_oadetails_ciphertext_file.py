@@ -0,0 +1,18 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0039_document_lodge_stage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='oadetails',
+            name='ciphertext_file',
+            field=models.FileField(
+                blank=True, help_text='Encrypted wrapped OA document as served by the uri, JSON', upload_to=''
+            ),
+        ),
+    ]
@@ -0,0 +1,66 @@
+import json
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import migrations, transaction
+
+CHUNK_SIZE = 100
+
+
+def move_ciphertext_to_storage(apps, schema_editor):
+    """
+    Each chunk is committed separately so the migration may be interrupted
+    and restarted, continuing with the rows not moved yet
+    """
+    OaDetails = apps.get_model("documents", "OaDetails")
+    pending = OaDetails.objects.exclude(ciphertext="").filter(ciphertext_file="")
+    while True:
+        with transaction.atomic():
+            chunk = list(
+                pending.order_by("pk").only("id", "iv_base64", "tag_base64", "ciphertext")[:CHUNK_SIZE]
+            )
+            if not chunk:
+                break
+            for oa in chunk:
+                # the same format as OaDetails.render_ciphertext_document
+                content = {
+                    "document": {
+                        "cipherText": oa.ciphertext,
+                        "iv": oa.iv_base64,
+                        "tag": oa.tag_base64,
+                        "type": "OPEN-ATTESTATION-TYPE-1",
+                    }
+                }
+                OaDetails.objects.filter(pk=oa.pk).update(
+                    ciphertext="",
+                    ciphertext_file=default_storage.save(
+                        f"oa/{oa.id}/ciphertext.json",
+                        ContentFile(json.dumps(content).encode("utf-8")),
+                    ),
+                )
+
+
+def move_ciphertext_to_database(apps, schema_editor):
+    OaDetails = apps.get_model("documents", "OaDetails")
+    pending = OaDetails.objects.filter(ciphertext="").exclude(ciphertext_file="")
+    while True:
+        with transaction.atomic():
+            chunk = list(pending.order_by("pk").only("id", "ciphertext_file")[:CHUNK_SIZE])
+            if not chunk:
+                break
+            for oa in chunk:
+                with default_storage.open(oa.ciphertext_file.name, "rb") as f:
+                    ciphertext = json.load(f)["document"]["cipherText"]
+                OaDetails.objects.filter(pk=oa.pk).update(ciphertext=ciphertext, ciphertext_file="")
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('documents', '0040_oadetails_ciphertext_file'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_ciphertext_to_storage, move_ciphertext_to_database),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.13 on 2026-10-18 02:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0041_move_ciphertext_to_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='verification_checked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='verification_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 2.2.13 on 2026-10-18 02:04
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, transaction
+
+CHUNK_SIZE = 1000
+
+# search_vector follows search_field for any way the row is saved (including raw SQL);
+# the configuration must be the same as services/search.py uses
+CREATE_TRIGGER = """
+CREATE TRIGGER documents_document_search_vector_update
+BEFORE INSERT OR UPDATE OF search_field ON documents_document
+FOR EACH ROW EXECUTE PROCEDURE
+tsvector_update_trigger(search_vector, 'pg_catalog.simple', search_field);
+"""
+DROP_TRIGGER = "DROP TRIGGER IF EXISTS documents_document_search_vector_update ON documents_document;"
+
+# built without locking the documents table for writes (the same index as the state one)
+CREATE_INDEX = """
+CREATE INDEX CONCURRENTLY IF NOT EXISTS "documents_search_vector_idx"
+ON documents_document USING gin ("search_vector");
+"""
+DROP_INDEX = 'DROP INDEX CONCURRENTLY IF EXISTS "documents_search_vector_idx";'
+
+
+def fill_search_vector(apps, schema_editor):
+    """
+    The existing documents are searchable right away, by their current search_field
+    (rebuild_document_search command updates search_field itself); chunked the same way
+    as 0041 so the big table isn't locked for the whole migration
+    """
+    Document = apps.get_model("documents", "Document")
+    pending = Document.objects.filter(search_vector__isnull=True)
+    while True:
+        with transaction.atomic():
+            chunk = list(pending.order_by("pk").values_list("pk", flat=True)[:CHUNK_SIZE])
+            if not chunk:
+                break
+            Document.objects.filter(pk__in=chunk).update(
+                search_vector=SearchVector("search_field", config="simple"),
+            )
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('documents', '0042_document_verification_sweep'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+        migrations.RunPython(fill_search_vector, migrations.RunPython.noop),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(CREATE_INDEX, DROP_INDEX),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='document',
+                    index=django.contrib.postgres.indexes.GinIndex(
+                        fields=['search_vector'], name='documents_search_vector_idx'
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 2.2.13 on 2026-10-18 02:09
+
+from django.db import migrations, models, transaction
+import django.db.models.deletion
+
+
+def fill_document_access(apps, schema_editor):
+    """
+    The same rule as DocumentAccess.documents_q (traders only), one organisation per transaction
+    so the migration may be interrupted and restarted (the filled ones are skipped)
+    """
+    Organisation = apps.get_model("users", "Organisation")
+    Document = apps.get_model("documents", "Document")
+    DocumentAccess = apps.get_model("documents", "DocumentAccess")
+    pending = Organisation.objects.filter(is_trader=True).exclude(document_access__isnull=False)
+    for org in pending.order_by("pk").iterator():
+        q = models.Q(pk__in=[])
+        if org.name:
+            q |= models.Q(importer_name=org.name) | models.Q(exporter__name=org.name)
+        if org.business_id:
+            q |= models.Q(importer_name=org.business_id) | models.Q(exporter__clear_business_id=org.business_id)
+        with transaction.atomic():
+            DocumentAccess.objects.bulk_create(
+                [
+                    DocumentAccess(org_id=org.pk, document_id=document_id)
+                    for document_id in Document.objects.filter(q).values_list("pk", flat=True)
+                ],
+                batch_size=1000,
+                ignore_conflicts=True,
+            )
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('users', '0008_organisationauthtoken'),
+        ('documents', '0043_document_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentAccess',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access', to='documents.Document')),
+                ('org', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_access', to='users.Organisation')),
+            ],
+            options={
+                'unique_together': {('org', 'document')},
+            },
+        ),
+        migrations.RunPython(fill_document_access, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 2.2.13 on 2026-10-18 02:13
+
+from django.db import migrations, models
+
+# the indexes are created without locking the documents table for writes,
+# which is why the database operations are written out (the same indexes as the state ones)
+INDEXES = [
+    ("documents_party_clear_business_id_ea0b671a", 'documents_party ("clear_business_id")'),
+    ("documents_party_clear_business_id_ea0b671a_like", 'documents_party ("clear_business_id" varchar_pattern_ops)'),
+    ("documents_created_idx", 'documents_document ("created_at")'),
+    ("documents_org_created_idx", 'documents_document ("created_by_org_id", "created_at")'),
+    ("documents_vstatus_created_idx", 'documents_document ("verification_status", "created_at")'),
+    ("documents_status_created_idx", 'documents_document ("status", "created_at")'),
+    ("documents_type_created_idx", 'documents_document ("type", "created_at")'),
+    ("documents_country_created_idx", 'documents_document ("importing_country", "created_at")'),
+    (
+        "documents_nondraft_idx",
+        'documents_document ("workflow_status", "created_at") WHERE NOT ("workflow_status" = \'draft\')',
+    ),
+    ("documents_number_idx", 'documents_document ("document_number")'),
+]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('documents', '0044_document_access'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" ON {definition};',
+                    f'DROP INDEX CONCURRENTLY IF EXISTS "{name}";',
+                )
+                for name, definition in INDEXES
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='party',
+                    name='clear_business_id',
+                    field=models.CharField(blank=True, db_index=True, default='', max_length=128),
+                ),
+                migrations.AddIndex(
+                    model_name='document',
+                    index=models.Index(fields=['created_at'], name='documents_created_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='document',
+                    index=models.Index(fields=['created_by_org', 'created_at'], name='documents_org_created_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='document',
+                    index=models.Index(fields=['verification_status', 'created_at'], name='documents_vstatus_created_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='document',
+                    index=models.Index(fields=['status', 'created_at'], name='documents_status_created_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='document',
+                    index=models.Index(fields=['type', 'created_at'], name='documents_type_created_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='document',
+                    index=models.Index(fields=['importing_country', 'created_at'], name='documents_country_created_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='document',
+                    index=models.Index(condition=models.Q(('workflow_status', 'draft'), _negated=True), fields=['workflow_status', 'created_at'], name='documents_nondraft_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='document',
+                    index=models.Index(fields=['document_number'], name='documents_number_idx'),
+                ),
+            ],
+        ),
+    ]
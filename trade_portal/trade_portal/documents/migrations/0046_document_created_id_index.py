@@ -0,0 +1,39 @@
+# Generated by Django 2.2.13 on 2026-10-18 02:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('documents', '0045_document_list_indexes'),
+    ]
+
+    operations = [
+        # concurrently, the same way as 0045
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    'CREATE INDEX CONCURRENTLY IF NOT EXISTS "documents_created_id_idx" '
+                    'ON documents_document ("created_at", "id");',
+                    'DROP INDEX CONCURRENTLY IF EXISTS "documents_created_id_idx";',
+                ),
+                migrations.RunSQL(
+                    'DROP INDEX CONCURRENTLY IF EXISTS "documents_created_idx";',
+                    'CREATE INDEX CONCURRENTLY IF NOT EXISTS "documents_created_idx" '
+                    'ON documents_document ("created_at");',
+                ),
+            ],
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name='document',
+                    name='documents_created_idx',
+                ),
+                migrations.AddIndex(
+                    model_name='document',
+                    index=models.Index(fields=['created_at', 'id'], name='documents_created_id_idx'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,154 @@
+# Generated by Django 2.2.13 on 2026-10-18 02:47
+
+import django.utils.timezone
+from django.db import migrations, models, transaction
+
+CHUNK_SIZE = 1000
+
+# the columns changed without the document itself changing (bookkeeping and derived ones)
+IGNORED_COLUMNS = "ARRAY['updated_at', 'version', 'verification_checked_at', 'search_vector']"
+# the same for the document files, the content being the file itself
+FILE_IGNORED_COLUMNS = "ARRAY['metadata', 'is_watermarked', 'size']"
+# and for the exporter and issuer parties, rendered with the document
+PARTY_IGNORED_COLUMNS = "ARRAY['created_by_user_id', 'created_by_org_id']"
+
+# version is incremented and updated_at set on any real change of the row, the stale values
+# saved by the ORM are ignored; setting the version higher is the way to mark the document changed.
+# clock_timestamp() is used (not the transaction start time) so the time is close to the commit
+CREATE_TRIGGERS = f"""
+CREATE FUNCTION documents_document_version_update() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        NEW.version := 1;
+        NEW.updated_at := clock_timestamp();
+    ELSIF (to_jsonb(NEW) - {IGNORED_COLUMNS}) IS DISTINCT FROM (to_jsonb(OLD) - {IGNORED_COLUMNS})
+            OR NEW.version > OLD.version THEN
+        NEW.version := OLD.version + 1;
+        NEW.updated_at := clock_timestamp();
+    ELSE
+        NEW.version := OLD.version;
+        NEW.updated_at := OLD.updated_at;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER documents_document_version_update
+BEFORE INSERT OR UPDATE ON documents_document
+FOR EACH ROW EXECUTE PROCEDURE documents_document_version_update();
+
+CREATE FUNCTION documents_documentfile_version_update() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE documents_document SET version = version + 1 WHERE id = NEW.doc_id;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE documents_document SET version = version + 1 WHERE id = OLD.doc_id;
+    ELSIF (to_jsonb(NEW) - {FILE_IGNORED_COLUMNS}) IS DISTINCT FROM (to_jsonb(OLD) - {FILE_IGNORED_COLUMNS}) THEN
+        UPDATE documents_document SET version = version + 1
+        WHERE id IN (NEW.doc_id, OLD.doc_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER documents_documentfile_version_update
+AFTER INSERT OR UPDATE OR DELETE ON documents_documentfile
+FOR EACH ROW EXECUTE PROCEDURE documents_documentfile_version_update();
+
+CREATE FUNCTION documents_party_version_update() RETURNS trigger AS $$
+BEGIN
+    IF (to_jsonb(NEW) - {PARTY_IGNORED_COLUMNS}) IS DISTINCT FROM (to_jsonb(OLD) - {PARTY_IGNORED_COLUMNS}) THEN
+        UPDATE documents_document SET version = version + 1
+        WHERE exporter_id = NEW.id OR issuer_id = NEW.id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER documents_party_version_update
+AFTER UPDATE ON documents_party
+FOR EACH ROW EXECUTE PROCEDURE documents_party_version_update();
+
+-- the OA details rendered (the QR code) and the encrypted document it points to,
+-- the IV changes every time the document is encrypted
+CREATE FUNCTION documents_oadetails_version_update() RETURNS trigger AS $$
+BEGIN
+    IF (NEW.uri, NEW.key, NEW.iv_base64) IS DISTINCT FROM (OLD.uri, OLD.key, OLD.iv_base64) THEN
+        UPDATE documents_document SET version = version + 1 WHERE oa_id = NEW.id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER documents_oadetails_version_update
+AFTER UPDATE ON documents_oadetails
+FOR EACH ROW EXECUTE PROCEDURE documents_oadetails_version_update();
+"""
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS documents_oadetails_version_update ON documents_oadetails;
+DROP FUNCTION IF EXISTS documents_oadetails_version_update();
+DROP TRIGGER IF EXISTS documents_party_version_update ON documents_party;
+DROP FUNCTION IF EXISTS documents_party_version_update();
+DROP TRIGGER IF EXISTS documents_documentfile_version_update ON documents_documentfile;
+DROP FUNCTION IF EXISTS documents_documentfile_version_update();
+DROP TRIGGER IF EXISTS documents_document_version_update ON documents_document;
+DROP FUNCTION IF EXISTS documents_document_version_update();
+"""
+
+
+def fill_updated_at(apps, schema_editor):
+    """
+    The existing documents are considered changed when created (that's as much as is known),
+    chunked the same way as 0041; done before the trigger is created
+    """
+    Document = apps.get_model("documents", "Document")
+    last_pk = None
+    while True:
+        with transaction.atomic():
+            qs = Document.objects.order_by("pk")
+            if last_pk is not None:
+                qs = qs.filter(pk__gt=last_pk)
+            chunk = list(qs.values_list("pk", flat=True)[:CHUNK_SIZE])
+            if not chunk:
+                break
+            Document.objects.filter(pk__in=chunk).update(updated_at=models.F("created_at"))
+        last_pk = chunk[-1]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('documents', '0046_document_created_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+        # concurrently, the same way as 0045
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    'CREATE INDEX CONCURRENTLY IF NOT EXISTS "documents_updated_id_idx" '
+                    'ON documents_document ("updated_at", "id");',
+                    'DROP INDEX CONCURRENTLY IF EXISTS "documents_updated_id_idx";',
+                ),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='document',
+                    index=models.Index(fields=['updated_at', 'id'], name='documents_updated_id_idx'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.13 on 2026-10-18 13:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0047_document_updated_at_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='document',
+            name='lodge_stage',
+            field=models.CharField(blank=True, choices=[('watermark', 'Watermark'), ('batch', 'Queued for the batch issue'), ('wrap', 'Wrap'), ('encrypt', 'Encrypt'), ('notarize', 'Notarize'), ('igl', 'IGL message'), ('done', 'Done')], default='', max_length=16),
+        ),
+    ]
@@ -1,3 +1,4 @@
+import hashlib
 import json
 import logging
 import mimetypes
@@ -10,12 +11,17 @@ from urllib.parse import quote
 
 from django.conf import settings
 from django.contrib.postgres.fields import JSONField
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import models, transaction
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django_countries.fields import CountryField
 
+from trade_portal.utils.jsonstream import Base64File
 from trade_portal.utils.qr import get_qrcode_image
 from trade_portal.utils.monitoring import statsd_timer
 
@@ -71,7 +77,7 @@ class Party(models.Model):
         max_length=1, blank=True, choices=TYPE_CHOICES, default=TYPE_OTHER
     )
     bid_prefix = models.CharField(max_length=64, blank=True, default="")
-    clear_business_id = models.CharField(max_length=128, blank=True, default="")
+    clear_business_id = models.CharField(max_length=128, blank=True, default="", db_index=True)
     business_id = models.CharField(
         max_length=256, help_text=_("ABN or UEN for example"), blank=True
     )
@@ -105,7 +111,12 @@ class Party(models.Model):
         else:
             if not self.clear_business_id and ":" not in self.business_id:
                 self.clear_business_id = self.business_id
+        adding = self._state.adding
         super().save(*args, **kwargs)
+        if not adding:
+            # the name or business id could change, the new documents are updated on their own save
+            for document in self.documents_exported.all():
+                DocumentAccess.update_for_document(document)
 
     @property
     def contact_info(self):
@@ -170,17 +181,26 @@ class OaDetails(models.Model):
     iv_base64 = models.TextField(blank=True)
     tag_base64 = models.TextField(blank=True)
 
-    # after we have it wrapper and issued we store the cyphertext here
-    # so it can be returned per request
-    # please note the ciphertext contains binary attachments base64 representations,
-    # which may be quite space-consuming and generally should'nt be storted in
-    # database
-    # TODO: fix it and store it as file somewhere
-    # Looks like it's not used anymore so much
+    # legacy: ciphertext used to be stored here; it contains the binary attachments
+    # base64 representations, so now it's kept in ciphertext_file instead and the
+    # column is emptied by the migration. Only read as a fallback for rows left
     ciphertext = models.TextField(blank=True)
+    # after we have it wrapped and issued we store the encrypted document here, already
+    # in the format returned to the OA document uri (see OaCyphertextRetrieve)
+    ciphertext_file = models.FileField(
+        blank=True, help_text="Encrypted wrapped OA document as served by the uri, JSON"
+    )
 
     oa_file = models.FileField(blank=True, help_text="Wrapped OA document, JSON")
 
+    # signature of the wrapped document; multiple documents issued in a single batch
+    # share the merkle root, each having its own proof
+    merkle_root = models.CharField(max_length=128, blank=True, default="")
+    target_hash = models.CharField(max_length=128, blank=True, default="")
+    proof = JSONField(default=list, blank=True)
+    # set while the document waits for the batch issue (see OA_BATCH_ISSUE_SIZE)
+    issue_queued_at = models.DateTimeField(blank=True, null=True, db_index=True)
+
     class Meta:
         ordering = ("-created_at",)
         verbose_name = _("OA details")
@@ -243,6 +263,49 @@ class OaDetails(models.Model):
     def _generate_aes_key(cls, key_len=256):
         return os.urandom(key_len // 8).hex().upper()
 
+    @staticmethod
+    def render_ciphertext_document(iv_base64, tag_base64, ciphertext) -> dict:
+        return {
+            "document": {
+                "cipherText": ciphertext,
+                "iv": iv_base64,  # "5O0HYHcYhTzB/Xmt",
+                "tag": tag_base64,  # "Yo1q82WRHFQuKUSYHgnawQ==",
+                "type": "OPEN-ATTESTATION-TYPE-1",
+            }
+        }
+
+    def save_ciphertext(self, iv_base64, tag_base64, ciphertext):
+        """
+        Store the encrypted document in the default storage, ready to be served as is
+        """
+        self.iv_base64 = iv_base64
+        self.tag_base64 = tag_base64
+        self.ciphertext = ""
+        self.ciphertext_file = default_storage.save(
+            f"oa/{self.id}/ciphertext.json",
+            ContentFile(
+                json.dumps(
+                    self.render_ciphertext_document(iv_base64, tag_base64, ciphertext)
+                ).encode("utf-8")
+            ),
+        )
+        self.save()
+
+    def get_ciphertext(self) -> str:
+        if not self.ciphertext_file:
+            return self.ciphertext
+        self.ciphertext_file.open("rb")
+        try:
+            return json.load(self.ciphertext_file)["document"]["cipherText"]
+        finally:
+            self.ciphertext_file.close()
+
+    @property
+    def ciphertext_etag(self) -> str:
+        # IV is random for each encryption so it changes every time the content does,
+        # which saves reading the file to calculate the ETag
+        return '"{}"'.format(hashlib.md5(f"{self.id}:{self.iv_base64}".encode("utf-8")).hexdigest())
+
     def get_OA_file(self):
         """
         Tries to retrieve a wrapped saved OA document from the history tokens
@@ -322,6 +385,26 @@ class Document(models.Model):
         (WORKFLOW_STATUS_INCOMING, "Incoming"),
     )
 
+    # The issue pipeline stage (see tasks.lodge_document) to be run next;
+    # stages are resumable so a failed one may be retried without re-running the previous ones
+    LODGE_STAGE_WATERMARK = "watermark"
+    LODGE_STAGE_BATCH = "batch"
+    LODGE_STAGE_WRAP = "wrap"
+    LODGE_STAGE_ENCRYPT = "encrypt"
+    LODGE_STAGE_NOTARIZE = "notarize"
+    LODGE_STAGE_IGL = "igl"
+    LODGE_STAGE_DONE = "done"
+
+    LODGE_STAGE_CHOICES = (
+        (LODGE_STAGE_WATERMARK, "Watermark"),
+        (LODGE_STAGE_BATCH, "Queued for the batch issue"),
+        (LODGE_STAGE_WRAP, "Wrap"),
+        (LODGE_STAGE_ENCRYPT, "Encrypt"),
+        (LODGE_STAGE_NOTARIZE, "Notarize"),
+        (LODGE_STAGE_IGL, "IGL message"),
+        (LODGE_STAGE_DONE, "Done"),
+    )
+
     TYPE_PREF_COO = "pref_coo"
     TYPE_NONPREF_COO = "non_pref_coo"
 
@@ -411,12 +494,19 @@ class Document(models.Model):
         default=V_STATUS_NOT_STARTED,
         choices=V_STATUS_CHOICES,
     )
+    # pending verifications are checked by the verify_pending_documents sweeper
+    # until the document issuance is confirmed or OA_VERIFY_PENDING_MAX_SECONDS pass
+    verification_started_at = models.DateTimeField(blank=True, null=True)
+    verification_checked_at = models.DateTimeField(blank=True, null=True)
     workflow_status = models.CharField(
         _("Workflow status"),
         max_length=32,
         default=WORKFLOW_STATUS_DRAFT,
         choices=WORKFLOW_STATUS_CHOICES,
     )
+    lodge_stage = models.CharField(
+        max_length=16, blank=True, default="", choices=LODGE_STAGE_CHOICES,
+    )
 
     extra_data = JSONField(
         default=dict, blank=True, help_text=_("Extra data like the QR code position")
@@ -432,9 +522,38 @@ class Document(models.Model):
     )
 
     search_field = models.TextField(blank=True, default="")
+    # maintained by the database trigger from search_field (see services/search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # maintained by the database trigger (see the migration adding them) whatever way the document
+    # is changed, including its files; the certificates API changes feed and ETags are based on them
+    updated_at = models.DateTimeField(default=timezone.now, editable=False)
+    version = models.PositiveIntegerField(default=1, editable=False)
 
     class Meta:
         ordering = ("-created_at",)
+        # the documents list (UI and API) is always ordered by created_at, so each filter
+        # has the index with created_at next (used for both the filter and the page order);
+        # the plans are checked by tests_indexes.py, update it along with these
+        indexes = [
+            GinIndex(fields=["search_vector"], name="documents_search_vector_idx"),
+            # id is the tie-breaker of the API cursor pagination
+            models.Index(fields=["created_at", "id"], name="documents_created_id_idx"),
+            models.Index(fields=["created_by_org", "created_at"], name="documents_org_created_idx"),
+            models.Index(fields=["verification_status", "created_at"], name="documents_vstatus_created_idx"),
+            models.Index(fields=["status", "created_at"], name="documents_status_created_idx"),
+            models.Index(fields=["type", "created_at"], name="documents_type_created_idx"),
+            models.Index(fields=["importing_country", "created_at"], name="documents_country_created_idx"),
+            # issued and incoming documents by the workflow status, drafts (many of them
+            # abandoned) are only counted so are left out to keep the index small
+            models.Index(
+                fields=["workflow_status", "created_at"],
+                name="documents_nondraft_idx",
+                condition=~models.Q(workflow_status="draft"),
+            ),
+            models.Index(fields=["document_number"], name="documents_number_idx"),
+            models.Index(fields=["updated_at", "id"], name="documents_updated_id_idx"),
+        ]
 
     def get_absolute_url(self):
         return reverse("documents:detail", args=[self.pk])
@@ -446,17 +565,23 @@ class Document(models.Model):
     def save(self, *args, **kwargs):
         self._fill_search_field()
         super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or {"importer_name", "exporter", "exporter_id"} & set(update_fields):
+            DocumentAccess.update_for_document(self)
 
     def _fill_search_field(self):
         data = [
             self.get_type_display(),
             self.get_status_display(),
             str(self.pk),
+            # displayed as the document number, the search matches word prefixes only
+            self.short_id,
             str(self.document_number),
             self.consignment_ref_doc_number,
             self.importing_country.name,
             str(self.fta),
             str(self.exporter),
+            self.importer_name,
         ]
         self.search_field = "\n".join(data)
         return
@@ -469,7 +594,11 @@ class Document(models.Model):
     def is_api_created(self):
         return bool(self.raw_certificate_data.get("certificateOfOrigin"))
 
-    def get_rendered_edi3_document(self):
+    def get_rendered_edi3_document(self, lazy_attachments=False):
+        """
+        lazy_attachments=True leaves the PDF attachment as Base64File
+        (see utils/jsonstream.py) so it's encoded only when written somewhere
+        """
         from trade_portal.edi3.certificates import Un20200831CoORenderer
 
         if self.raw_certificate_data.get("certificateOfOrigin"):
@@ -482,7 +611,10 @@ class Document(models.Model):
             if pdf_attach:
                 try:
                     data["certificateOfOrigin"]["attachedFile"] = {
-                        "file": b64encode(pdf_attach.file.read()).decode("utf-8"),
+                        "file": (
+                            Base64File(pdf_attach.file) if lazy_attachments
+                            else b64encode(pdf_attach.file.read()).decode("utf-8")
+                        ),
                         "encodingCode": "base64",
                         "mimeCode": pdf_attach.mimetype(),
                     }
@@ -507,7 +639,7 @@ class Document(models.Model):
             return None
         else:
             # if came here - then just render it as usual
-            return Un20200831CoORenderer().render(self)
+            return Un20200831CoORenderer().render(self, lazy_attachments=lazy_attachments)
 
     @property
     def is_incoming(self):
@@ -520,6 +652,86 @@ class Document(models.Model):
         return self.files.filter(filename__endswith=".pdf").first()
 
 
+class DocumentAccess(models.Model):
+    """
+    Trader organisations which can see the document (being its importer or exporter)
+
+    Updated on the document, its exporter and the organisation save (the rules are
+    documents_q and orgs_q below, only traders have the rows; deleting the exporter
+    deletes its documents and so the rows),
+    the check_document_access command compares the rows to the rules and fixes them
+    """
+    org = models.ForeignKey("users.Organisation", models.CASCADE, related_name="document_access")
+    document = models.ForeignKey(Document, models.CASCADE, related_name="access")
+
+    class Meta:
+        unique_together = ("org", "document")
+
+    def __str__(self):
+        return f"{self.org} can see {self.document}"
+
+    @staticmethod
+    def documents_q(org):
+        """
+        Documents the trader organisation can see
+        """
+        q = models.Q(pk__in=[])
+        if not org.is_trader:
+            return q
+        if org.name:
+            q |= models.Q(importer_name=org.name) | models.Q(exporter__name=org.name)
+        if org.business_id:
+            q |= models.Q(importer_name=org.business_id) | models.Q(exporter__clear_business_id=org.business_id)
+        return q
+
+    @staticmethod
+    def orgs_q(document):
+        """
+        Organisations which can see the document, the same rule as documents_q
+        """
+        q = models.Q(pk__in=[])
+        if document.importer_name:
+            q |= models.Q(name=document.importer_name) | models.Q(business_id=document.importer_name)
+        if document.exporter:
+            if document.exporter.name:
+                q |= models.Q(name=document.exporter.name)
+            if document.exporter.clear_business_id:
+                q |= models.Q(business_id=document.exporter.clear_business_id)
+        return q
+
+    @classmethod
+    def update_for_document(cls, document):
+        from trade_portal.users.models import Organisation
+
+        wanted = set(
+            Organisation.objects.filter(cls.orgs_q(document), is_trader=True).values_list("pk", flat=True)
+        )
+        cls._sync(cls.objects.filter(document=document), "org_id", wanted, document_id=document.pk)
+
+    @classmethod
+    def update_for_org(cls, org):
+        wanted = set(Document.objects.filter(cls.documents_q(org)).values_list("pk", flat=True))
+        cls._sync(cls.objects.filter(org=org), "document_id", wanted, org_id=org.pk)
+
+    @classmethod
+    def _sync(cls, existing_qs, field, wanted, **common):
+        """
+        Make the existing rows (all having the common values) have the wanted values of the field
+        Return the number of rows created and deleted
+        """
+        existing = set(existing_qs.values_list(field, flat=True))
+        stale = existing - wanted
+        if stale:
+            existing_qs.filter(**{f"{field}__in": stale}).delete()
+        missing = wanted - existing
+        if missing:
+            cls.objects.bulk_create(
+                [cls(**common, **{field: value}) for value in missing],
+                ignore_conflicts=True,
+            )
+        return len(missing), len(stale)
+
+
 class DocumentHistoryItem(models.Model):
     document = models.ForeignKey(Document, models.CASCADE, related_name="history")
     created_at = models.DateTimeField(default=timezone.now)
@@ -631,6 +843,24 @@ class DocumentFile(models.Model):
     def mimetype(self):
         return mimetypes.guess_type(self.filename, strict=False)[0]
 
+    def update_metadata(self, key, value):
+        """
+        Sets the single metadata key without overwriting the rest of it,
+        which may be updated by other tasks meanwhile
+        """
+        self.metadata[key] = value
+        if self._state.adding:
+            return
+        with transaction.atomic():
+            current = (
+                DocumentFile.objects.select_for_update()
+                .filter(pk=self.pk).values_list("metadata", flat=True).first()
+            )
+            if current is None:
+                return
+            current[key] = value
+            DocumentFile.objects.filter(pk=self.pk).update(metadata=current)
+
     def get_size_display(self):
         def sizeof_fmt(num, suffix="B"):
             for unit in ["", "Ki", "Mi", "Gi", "Ti", "Pi", "Ei", "Zi"]:
@@ -1,7 +1,71 @@
+from functools import lru_cache
+
 from django.conf import settings
 
 from intergov_client import IntergovClient
 from intergov_client.auth import DjangoCachedCognitoOIDCAuth, DumbAuth
+from trade_portal.utils.monitoring import statsd_counter, statsd_timing
+
+
+def report_igl_call(call_name, seconds, status_code):
+    """
+    Latency of each node API call, so it's visible how much it costs per document
+    """
+    statsd_timing(f"igl.{call_name}", seconds)
+    if status_code is None or status_code >= 500:
+        statsd_counter(f"igl.{call_name}.errors", 1)
+
+
+@lru_cache(maxsize=None)
+def get_ig_auth_class():
+    if settings.IGL_OAUTH_WELLKNOWN_URL:
+        ig_token_url = DjangoCachedCognitoOIDCAuth.resolve_wellknown_to_token_url(
+            settings.IGL_OAUTH_WELLKNOWN_URL
+        )
+        return DjangoCachedCognitoOIDCAuth(
+            token_url=ig_token_url,
+            client_id=settings.IGL_OAUTH_CLIENT_ID,
+            client_secret=settings.IGL_OAUTH_CLIENT_SECRET,
+            scope=settings.IGL_OAUTH_SCOPES,
+            timeout=(settings.IGL_HTTP_CONNECT_TIMEOUT, settings.IGL_HTTP_READ_TIMEOUT),
+            metrics_callback=report_igl_call,
+        )
+    return DumbAuth()
+
+
+@lru_cache(maxsize=None)
+def get_ig_client() -> IntergovClient:
+    """
+    The client is shared within the process so the connections it keeps alive
+    are reused by all services and tasks
+    """
+    return IntergovClient(
+        country=settings.ICL_APP_COUNTRY,
+        endpoints=settings.IGL_APIS,
+        auth_class=get_ig_auth_class(),
+        timeout=(settings.IGL_HTTP_CONNECT_TIMEOUT, settings.IGL_HTTP_READ_TIMEOUT),
+        pool_sizes=settings.IGL_HTTP_POOL_SIZES,
+        retries=settings.IGL_HTTP_RETRIES,
+        metrics_callback=report_igl_call,
+    )
+
+
+def get_async_ig_client(concurrency: int = None):
+    """
+    Must be created (and closed) inside the event loop it's used in,
+    so it's never shared like the sync one
+    """
+    from intergov_client.aio import AsyncIntergovClient
+
+    return AsyncIntergovClient(
+        country=settings.ICL_APP_COUNTRY,
+        endpoints=settings.IGL_APIS,
+        auth_class=get_ig_auth_class(),
+        timeout=(settings.IGL_HTTP_CONNECT_TIMEOUT, settings.IGL_HTTP_READ_TIMEOUT),
+        pool_size=concurrency or settings.IGL_ASYNC_CONCURRENCY,
+        retries=settings.IGL_HTTP_RETRIES,
+        metrics_callback=report_igl_call,
+    )
 
 
 class BaseIgService:
@@ -16,21 +80,4 @@ class BaseIgService:
         self.ig_client = ig_client
 
     def _get_ig_client(self) -> IntergovClient:
-        if settings.IGL_OAUTH_WELLKNOWN_URL:
-            ig_token_url = DjangoCachedCognitoOIDCAuth.resolve_wellknown_to_token_url(
-                settings.IGL_OAUTH_WELLKNOWN_URL
-            )
-            ig_auth_class = DjangoCachedCognitoOIDCAuth(
-                token_url=ig_token_url,
-                client_id=settings.IGL_OAUTH_CLIENT_ID,
-                client_secret=settings.IGL_OAUTH_CLIENT_SECRET,
-                scope=settings.IGL_OAUTH_SCOPES,
-            )
-        else:
-            ig_auth_class = DumbAuth()
-        ig_client = IntergovClient(
-            country=settings.ICL_APP_COUNTRY,
-            endpoints=settings.IGL_APIS,
-            auth_class=ig_auth_class,
-        )
-        return ig_client
+        return get_ig_client()
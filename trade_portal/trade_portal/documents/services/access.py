@@ -0,0 +1,31 @@
+"""
+Which documents the organisation can see, shared by the UI and the API
+
+Traders see the documents they are the importer or the exporter of, which is
+materialised as DocumentAccess rows (see the model for how they are kept up to date),
+so the list is a single indexed join instead of matching names on every request.
+"""
+from trade_portal.documents.models import Document, DocumentAccess
+
+
+def visible_documents(qs, org):
+    """
+    Filter the documents queryset down to the documents the organisation can see
+    """
+    if org and org.is_regulator:
+        # regulator can see everything
+        return qs
+    elif org and org.is_chambers:
+        # chambers can see only their own documents
+        return qs.filter(created_by_org=org)
+    elif org and org.is_trader:
+        return qs.filter(pk__in=DocumentAccess.objects.filter(org=org).values("document_id"))
+    return Document.objects.none()
+
+
+def legacy_visible_documents(qs, org):
+    """
+    The same as visible_documents for traders, but matching the documents by the rule
+    directly; used to check and benchmark the materialised rows
+    """
+    return qs.filter(DocumentAccess.documents_q(org))
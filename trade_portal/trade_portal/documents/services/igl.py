@@ -147,11 +147,12 @@ class IGLService(BaseIgService):
         except Exception as e:
             logger.exception(e)
 
-    def update_message_by_sender_ref(self, sender_ref: str) -> bool:
+    def update_message_by_sender_ref(self, sender_ref: str, msg_body: dict = None) -> bool:
         """
         We received some light notification about the message updated,
         so now need to determine what the `cred` is, find that message and get
         it's status
+        msg_body may be passed if it's already retrieved (see drain_igl_messages)
         """
         if ":" not in sender_ref:
             # wrong format, must be provided
@@ -167,7 +168,8 @@ class IGLService(BaseIgService):
             )
             raise self.retry()  # exc=exc
         # 1. retrieve message from the intergov
-        msg_body = self.ig_client.retrieve_message(sender_ref)
+        if msg_body is None:
+            msg_body = self.ig_client.retrieve_message(sender_ref)
         # 2. update status in the local database
         if not msg_body:
             logger.error(
@@ -204,7 +206,7 @@ class IGLService(BaseIgService):
         if result:
             logger.info("Re-subscribed to predicate message.*")
 
-    def store_message_by_ping_body(self, ping_body: dict) -> bool:
+    def store_message_by_ping_body(self, ping_body: dict, msg_body: dict = None) -> bool:
         # Once new message notification arrives we have message sender ref
         # and have to retrieve it
         # Example of the body:
@@ -214,8 +216,9 @@ class IGLService(BaseIgService):
         # }
         sender_ref = ping_body["sender_ref"]
 
-        # 1. retrieve it
-        msg_body = self.ig_client.retrieve_message(sender_ref)
+        # 1. retrieve it (unless it's already retrieved in bulk)
+        if msg_body is None:
+            msg_body = self.ig_client.retrieve_message(sender_ref)
         # 2. handle it locally (attaching to some document, etc)
         if not msg_body:
             logger.error(
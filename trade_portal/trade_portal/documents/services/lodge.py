@@ -1,21 +1,23 @@
 """
 Things related to the CoO packaging, notarizing and sending to the upstream
 """
-import json
 import logging
 
 from django.conf import settings
-from django.core.files.base import ContentFile
+from django.core.files.base import ContentFile, File
 from django.core.files.storage import default_storage
+from django.utils import timezone
 
 from trade_portal.documents.models import (
     Document,
     DocumentHistoryItem,
+    OaDetails,
 )
 from trade_portal.documents.services.encryption import AESCipher
 from trade_portal.documents.services.igl import IGLService
 from trade_portal.documents.services.notarize import NotaryService
-from trade_portal.documents.services.oa import OaApiRestClient, OaV2Renderer
+from trade_portal.documents.services.oa import OaNativeClient, OaV2Renderer, get_oa_client
+from trade_portal.utils.jsonstream import JsonReader
 
 logger = logging.getLogger(__name__)
 
@@ -23,7 +25,7 @@ logger = logging.getLogger(__name__)
 class DocumentService:
     def __init__(self, oa_client=None, *args, **kwargs):
         if not oa_client:
-            oa_client = OaApiRestClient()
+            oa_client = get_oa_client()
         self.oa_client = oa_client
         self.ig_client = kwargs.pop("ig_client", None)
         super().__init__(*args, **kwargs)
@@ -31,14 +33,136 @@ class DocumentService:
     def issue(self, document: Document) -> bool:
         """
         Does all issue/OA notarize/IGL message sending work
-        This procedure is a good candidate for refactoring to smaller clients, services and functions
+        The same steps are available separately (wrap, encrypt, notarize, send_igl_message)
+        so they can be run as different pipeline stages (see tasks.py)
         """
-        from trade_portal.documents.tasks import document_oa_verify
+        document.verification_status = Document.V_STATUS_PENDING
+        document.status = Document.STATUS_NOT_SENT
+        document.save()
+
+        # steps 2-3. render and wrap the OA document
+        oa_wrapped_body = self.wrap(document)
+        if oa_wrapped_body is None:
+            return False
+
+        # now the OA document contains attachment (binary, if any) and CoO EDI3 document
+        # and it's prepared for the notarisation and further steps
+
+        # step4. encrypt and publish ciphertext
+        self.encrypt(document, oa_wrapped_body)
+
+        # step5. Notarize the document
+        self.notarize(document, oa_wrapped_body)
+
+        # and now goes the standard Intergov node communication
+        self.send_igl_message(document, oa_wrapped_body)
+        return True
+
+    def wrap(self, document: Document):
+        """
+        Render the OA document and wrap it, either using external api for wrapping documents
+        or natively, depending on the OA_WRAP_ENGINE setting.
+        Returns the wrapped document body or None if it has failed (and the document is marked so)
+        """
+        oa_doc = self._render_oa_document(document)
+        try:
+            oa_doc_wrapped_resp = self.oa_client.wrap_document(oa_doc)
+            self._save_wrapped_document(document, oa_doc_wrapped_resp)
+        except Exception as e:
+            self._mark_wrap_failed(document, e)
+            return None
+        return oa_doc_wrapped_resp.content.decode("utf-8")
 
+    def encrypt(self, document: Document, oa_wrapped_body: str = None):
+        if oa_wrapped_body is None:
+            oa_wrapped_body = self._read_wrapped_document(document)
+        document.oa.save_ciphertext(
+            *self._aes_encrypt(oa_wrapped_body, document.oa.key)
+        )
+        DocumentHistoryItem.objects.create(
+            type="text",
+            document=document,
+            message="OA document encrypted and ciphertext saved",
+        )
+
+    def notarize(self, document: Document, oa_wrapped_body: str = None) -> bool:
+        if oa_wrapped_body is None:
+            oa_wrapped_body = self._read_wrapped_document(document)
+        is_notarized = NotaryService().notarize_file(oa_wrapped_body)
+        self._handle_notarize_result(document, is_notarized)
+        return is_notarized
+
+    def send_igl_message(self, document: Document, oa_wrapped_body: str = None):
+        if oa_wrapped_body is None:
+            oa_wrapped_body = self._read_wrapped_document(document)
+        return IGLService(
+            ig_client=self.ig_client
+        ).send_igl_message(
+            document, oa_wrapped_body, document.oa.merkle_root
+        )
+
+    def queue_for_batch_issue(self, document: Document) -> int:
+        """
+        Instead of issuing the document right now leave it for the issue_document_batch task,
+        which wraps multiple documents under the single merkle root so they are notarized
+        by a single document store transaction.
+        Returns the number of documents waiting in the queue
+        """
         document.verification_status = Document.V_STATUS_PENDING
         document.status = Document.STATUS_NOT_SENT
         document.save()
+        document.oa.issue_queued_at = timezone.now()
+        document.oa.save()
+        DocumentHistoryItem.objects.create(
+            type="text",
+            document=document,
+            message="The document is queued for the batch issue",
+        )
+        return OaDetails.objects.filter(issue_queued_at__isnull=False).count()
+
+    def issue_batch(self, documents: list) -> list:
+        """
+        The same as issue() but for multiple documents at once: all of them are wrapped
+        together (so they share the merkleRoot and have different proofs) and sent
+        to the notary service in a single notification. The IGL messages are not sent here,
+        each document continues from its own IGL stage (see lodge_igl_stage)
+        Returns the list of documents issued
+        """
+        for document in documents:
+            document.verification_status = Document.V_STATUS_PENDING
+            document.status = Document.STATUS_NOT_SENT
+            document.save()
+
+        oa_docs = [self._render_oa_document(document) for document in documents]
+
+        # step 3: the OA API has no batch endpoint so documents are always wrapped natively here
+        # unless the configured client knows how to do it
+        oa_client = self.oa_client if hasattr(self.oa_client, "wrap_documents") else OaNativeClient()
+        try:
+            wrapped_responses = oa_client.wrap_documents(oa_docs)
+        except Exception as e:
+            for document in documents:
+                self._mark_wrap_failed(document, e)
+            return []
+
+        issued = []
+        for document, oa_doc_wrapped_resp in zip(documents, wrapped_responses):
+            try:
+                self._save_wrapped_document(document, oa_doc_wrapped_resp)
+            except Exception as e:
+                self._mark_wrap_failed(document, e)
+                continue
+            oa_wrapped_body = oa_doc_wrapped_resp.content.decode("utf-8")
+            self.encrypt(document, oa_wrapped_body)
+            issued.append((document, oa_wrapped_body))
 
+        # step5. Notarize all documents by a single message to the notary service
+        is_notarized = NotaryService().notarize_files([body for _, body in issued]) if issued else False
+        for document, oa_wrapped_body in issued:
+            self._handle_notarize_result(document, is_notarized)
+        return [document for document, _ in issued]
+
+    def _render_oa_document(self, document: Document) -> dict:
         subject = "{}.{}.{}".format(
             settings.ICL_APP_COUNTRY.upper(),
             (document.created_by_org.business_id).replace(".", "-"),
@@ -48,82 +172,88 @@ class DocumentService:
         # step 2. Render the OAv2 doc as JSON dict
         oa_doc = OaV2Renderer().render_oa_v2_document(document, subject)
         # step 2. Append EDI3 document, merging it to the OA root level
-        oa_doc.update(document.get_rendered_edi3_document())
+        # the attachment is kept as a file reference and base64-encoded by chunks
+        # each time the document is written (to the storage, to the wrap API)
+        oa_doc.update(document.get_rendered_edi3_document(lazy_attachments=True))
 
+        oa_doc_file = JsonReader(oa_doc)
         DocumentHistoryItem.objects.create(
             type="text",
             document=document,
-            message=f"OA document has been generated, size: {len(json.dumps(oa_doc))}b",
+            message=f"OA document has been generated, size: {len(oa_doc_file)}b",
             related_file=default_storage.save(
                 f"incoming/{document.id}/oa-doc.json",
-                ContentFile(json.dumps(oa_doc, indent=2).encode("utf-8")),
+                File(oa_doc_file),
             ),
         )
+        return oa_doc
 
-        # step 3, slow: wrap OA document using external api for wrapping documents
-        # TODO: think about replacing by native solution (won't give much performance increase)
-        # https://github.com/Open-Attestation/open-attestation/blob/master/src/2.0/wrap.ts#L25
-        try:
-            oa_doc_wrapped_resp = self.oa_client.wrap_document(oa_doc)
-            if oa_doc_wrapped_resp.status_code != 200:
-                # this is not common to have API answering non-200
-                logger.warning("Received %s for oa doc wrap step", oa_doc_wrapped_resp)
-                raise Exception(oa_doc_wrapped_resp.json())
-            else:
-                # OA document is wrapped correctly
-                oa_doc_wrapped = oa_doc_wrapped_resp.json()
-                wrapped_doc_merkle_root = oa_doc_wrapped.get("signature", {}).get("merkleRoot")
-                if not wrapped_doc_merkle_root:
-                    raise Exception("Empty merkleRoot for " + oa_doc_wrapped_resp.content.decode("utf-8"))
-                DocumentHistoryItem.objects.create(
-                    type="text",
-                    document=document,
-                    message=f"OA document has been wrapped, new size: {len(oa_doc_wrapped_resp.content)}b",
-                    related_file=default_storage.save(
-                        f"incoming/{document.id}/oa-doc-wrapped.json",
-                        ContentFile(oa_doc_wrapped_resp.content),
-                    ),
-                )
-        except Exception as e:
-            logger.exception(e)
-            DocumentHistoryItem.objects.create(
-                is_error=True,
-                type="error",
-                document=document,
-                message="Error: OA document wrap failed",
-                object_body=str(e),
-            )
-            document.status = Document.STATUS_FAILED
-            document.verification_status = Document.V_STATUS_ERROR
-            document.workflow_status = Document.WORKFLOW_STATUS_NOT_ISSUED  # Error?
-            document.save()
-            return False
-
-        # now the OA document contains attachment (binary, if any) and CoO EDI3 document
-        # and it's prepared for the notarisation and further steps
-        oa_wrapped_body = oa_doc_wrapped_resp.content.decode("utf-8")
-
-        # step4. encrypt and publish ciphertext
-        # oa_wrapped_body
-        (
-            document.oa.iv_base64,
-            document.oa.tag_base64,
-            document.oa.ciphertext,
-        ) = self._aes_encrypt(oa_wrapped_body, document.oa.key)
+    def _save_wrapped_document(self, document: Document, oa_doc_wrapped_resp):
+        """
+        Raises exception if the wrap response is not something we can issue
+        """
+        if oa_doc_wrapped_resp.status_code != 200:
+            # this is not common to have API answering non-200
+            logger.warning("Received %s for oa doc wrap step", oa_doc_wrapped_resp)
+            raise Exception(oa_doc_wrapped_resp.json())
+        # OA document is wrapped correctly
+        signature = oa_doc_wrapped_resp.json().get("signature", {})
+        if not signature.get("merkleRoot"):
+            raise Exception("Empty merkleRoot for " + oa_doc_wrapped_resp.content.decode("utf-8"))
+        history_item = DocumentHistoryItem.objects.create(
+            type="text",
+            document=document,
+            message=f"OA document has been wrapped, new size: {len(oa_doc_wrapped_resp.content)}b",
+            related_file=default_storage.save(
+                f"incoming/{document.id}/oa-doc-wrapped.json",
+                ContentFile(oa_doc_wrapped_resp.content),
+            ),
+        )
+        # so the further steps can read it without the wrapping result at hands
+        document.oa.oa_file = history_item.related_file.name
+        document.oa.merkle_root = signature["merkleRoot"]
+        document.oa.target_hash = signature.get("targetHash") or ""
+        document.oa.proof = signature.get("proof") or []
         document.oa.save()
+
+    def _mark_wrap_failed(self, document: Document, e: Exception):
+        logger.exception(e)
         DocumentHistoryItem.objects.create(
-            type="text",
+            is_error=True,
+            type="error",
             document=document,
-            message="OA document encrypted and ciphertext saved",
+            message="Error: OA document wrap failed",
+            object_body=str(e),
         )
+        document.status = Document.STATUS_FAILED
+        document.verification_status = Document.V_STATUS_ERROR
+        document.workflow_status = Document.WORKFLOW_STATUS_NOT_ISSUED  # Error?
+        document.save()
 
-        # step5. Notarize the document
-        if NotaryService().notarize_file(oa_wrapped_body):
+    def _read_wrapped_document(self, document: Document) -> str:
+        oa_file = document.oa.get_OA_file()
+        if not oa_file:
+            raise Exception("The document has not been wrapped yet")
+        oa_file.open("rb")
+        try:
+            return oa_file.read().decode("utf-8")
+        finally:
+            oa_file.close()
+
+    def _handle_notarize_result(self, document: Document, is_notarized: bool):
+        from trade_portal.documents.tasks import document_oa_verify
+
+        if is_notarized:
             DocumentHistoryItem.objects.create(
                 type="text",
                 document=document,
                 message="OA document has been sent to the notary service",
             )
+            # from now on it's checked by verify_pending_documents, even if the verification
+            # below is lost or fails, and given up after OA_VERIFY_PENDING_MAX_SECONDS
+            if not document.verification_started_at:
+                document.verification_started_at = timezone.now()
+                document.save(update_fields=["verification_started_at"])
             # Calling this is not strictly required and is used just to ensure the verification went fine
             document_oa_verify.apply_async(args=[document.pk], countdown=30)
         else:
@@ -136,14 +266,7 @@ class DocumentService:
             )
             # think about retrying it?
             document.verification_status = Document.V_STATUS_ERROR
-
-        # and now goes the standard Intergov node communication
-        IGLService(
-            ig_client=self.ig_client
-        ).send_igl_message(
-            document, oa_wrapped_body, wrapped_doc_merkle_root
-        )
-        return True
+            document.save()
 
     def _aes_encrypt(self, opentext, key):
         cipher = AESCipher(key)
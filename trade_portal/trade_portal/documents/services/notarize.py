@@ -47,6 +47,14 @@ class NotaryService:
         Accepts file content as string (containing rendered OA JSON, file up to several MB)
         Puts it to the place from which notarisation worker will read it and do its complicated work
         """
+        return self.notarize_files([document_body])
+
+    def notarize_files(self, document_bodies: list):
+        """
+        The same as notarize_file but for multiple files at once, which is used for
+        documents wrapped together (sharing the merkle root): all of them are announced
+        in a single notification so the worker issues the merkle root once
+        """
         if getattr(settings, "IS_UNITTEST", False) is True:
             raise EnvironmentError("This procedure must not be called from unittest")
 
@@ -56,25 +64,27 @@ class NotaryService:
             )
             return False
 
-        t0 = time.time()
-
         s3res = boto3.resource("s3", **self._get_aws_creds()).Bucket(
             settings.OA_UNPROCESSED_BUCKET_NAME
         )
 
-        body = document_body.encode("utf-8")
-        doc_key = hashlib.sha1(body).hexdigest().lower()
-        content_length = len(body)
+        keys = []
+        for document_body in document_bodies:
+            t0 = time.time()
+            body = document_body.encode("utf-8")
+            doc_key = hashlib.sha1(body).hexdigest().lower()
+            content_length = len(body)
 
-        date = str(timezone.now().date())
-        key = f"{date}/{doc_key}.json"
-        s3res.Object(key).put(Body=body, ContentLength=content_length)
+            date = str(timezone.now().date())
+            key = f"{date}/{doc_key}.json"
+            s3res.Object(key).put(Body=body, ContentLength=content_length)
+            keys.append(key)
 
-        logger.info("The file %s to be notarized has been uploaded in %ss", key, round(time.time() - t0, 6))
-        self._send_manual_notification(key)
+            logger.info("The file %s to be notarized has been uploaded in %ss", key, round(time.time() - t0, 6))
+        self._send_manual_notification(*keys)
         return True
 
-    def _send_manual_notification(self, key: str):
+    def _send_manual_notification(self, *keys: str):
         """
         If the bucket itself doesn't send these notifications for some reason
         We forge it so worker is aware. Another side effect is that we can
@@ -103,9 +113,57 @@ class NotaryService:
                                 "object": {"key": key},
                             }
                         }
+                        for key in keys
                     ]
                 }
             )
         )
-        logger.info("Sent notification about file %s to be notarized", key)
+        logger.info("Sent notification about files %s to be notarized", ", ".join(keys))
         return True
+
+    def consume_issued_events(
+        self, handler, wait_seconds: int = 0, max_messages: int = 1000, time_budget: float = 240,
+    ) -> int:
+        """
+        Read the "issued" events published by the worker (see OA_ISSUED_EVENTS_QUEUE_URL),
+        passing each of them to the handler, until the queue is empty, max_messages are read
+        or time_budget seconds are spent; waiting for wait_seconds (up to 20) for the first ones.
+        The event stays in the queue if the handler fails, so it's tried again later.
+        Returns the number of events handled
+        """
+        if not settings.OA_ISSUED_EVENTS_QUEUE_URL:
+            return 0
+
+        issued_events_queue = boto3.resource(
+            "sqs",
+            **self._get_aws_creds(region=settings.AWS_REGION)
+        ).Queue(
+            settings.OA_ISSUED_EVENTS_QUEUE_URL
+        )
+        deadline = time.monotonic() + time_budget
+        handled = received = 0
+        while received < max_messages and time.monotonic() < deadline:
+            messages = issued_events_queue.receive_messages(
+                WaitTimeSeconds=min(wait_seconds, 20),
+                MaxNumberOfMessages=min(max_messages - received, 10),
+            )
+            if not messages:
+                break
+            received += len(messages)
+            for message in messages:
+                try:
+                    event = json.loads(message.body)
+                except ValueError:
+                    logger.warning("Ignoring the invalid issued event %s", message.body)
+                else:
+                    try:
+                        handler(event)
+                    except Exception as e:
+                        # left in the queue, visible again after its visibility timeout
+                        logger.exception(e)
+                        continue
+                    handled += 1
+                message.delete()
+            # the rest is read without waiting
+            wait_seconds = 0
+        return handled
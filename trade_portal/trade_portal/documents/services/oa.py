@@ -1,9 +1,13 @@
 import datetime
+import json
 
 import requests
 from django.conf import settings
+from django.utils.functional import cached_property
 
 from trade_portal.documents.models import Document
+from trade_portal.documents.services import oa_wrap
+from trade_portal.utils.jsonstream import JsonReader
 
 
 class OaApiRestClient:
@@ -15,17 +19,59 @@ class OaApiRestClient:
     def wrap_document(self, oa_doc):
         if getattr(settings, "IS_UNITTEST", False) is True:
             raise EnvironmentError("This procedure must not be called from unittest")
+        # streamed, so the attachments (if rendered lazily) are not kept in memory as base64
         return requests.post(
             settings.OA_WRAP_API_URL + "/document/wrap",
-            json={
+            data=JsonReader({
                 "document": oa_doc,
                 "params": {
                     "version": "https://schema.openattestation.com/2.0/schema.json",
                 },
-            },
+            }),
+            headers={"Content-Type": "application/json"},
         )
 
 
+class OaNativeWrapResponse:
+    """
+    Minimal requests.Response lookalike so the native wrapper can be used
+    by the code written for the OA API client without changes
+    """
+
+    def __init__(self, wrapped_document: dict):
+        self.status_code = 200
+        self._json = wrapped_document
+
+    @cached_property
+    def content(self) -> bytes:
+        # serialised on first use, so a wrapped batch does not hold every document twice
+        return json.dumps(self._json).encode("utf-8")
+
+    def json(self):
+        return self._json
+
+
+class OaNativeClient:
+    """
+    Wraps documents in-process (see oa_wrap.py), not doing any HTTP requests
+    """
+
+    def wrap_document(self, oa_doc):
+        return OaNativeWrapResponse(oa_wrap.wrap_document(oa_doc))
+
+    def wrap_documents(self, oa_docs: list) -> list:
+        return [OaNativeWrapResponse(wrapped) for wrapped in oa_wrap.wrap_documents(oa_docs)]
+
+
+def get_oa_client():
+    """
+    Return the wrapping client configured for this installation
+    """
+    if getattr(settings, "OA_WRAP_ENGINE", "api") == "native":
+        return OaNativeClient()
+    return OaApiRestClient()
+
+
 class OaV2Renderer:
 
     def render_oa_v2_document(self, document: Document, subject: str) -> dict:
@@ -0,0 +1,196 @@
+"""
+Native (in-process) implementation of the OpenAttestation v2 document wrapping
+
+This is a port of the open-attestation JS library wrap procedure:
+https://github.com/Open-Attestation/open-attestation/blob/master/src/2.0/wrap.ts
+https://github.com/Open-Attestation/open-attestation/blob/master/src/2.0/digest.ts
+https://github.com/Open-Attestation/open-attestation/blob/master/src/shared/merkle/merkle.ts
+
+Please note the JSON schema validation done by the JS wrapper is not reproduced here,
+so the caller is responsible for passing documents of a correct format.
+The result must stay byte-compatible with the JS implementation (it's checked by
+the remote verifier), so any change here must be covered by parity tests.
+"""
+import json
+import math
+import uuid
+
+from Crypto.Hash import keccak
+
+from trade_portal.utils.jsonstream import Base64File
+
+OA_V2_SCHEMA_ID = "https://schema.openattestation.com/2.0/schema.json"
+OA_V2_SIGNATURE_TYPE = "SHA3MerkleProof"
+
+
+def keccak256_hex(data) -> str:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return keccak.new(digest_bits=256, data=data).hexdigest()
+
+
+def _js_stringify(value) -> str:
+    """
+    JSON.stringify() equivalent for the values we have after salting
+    (no spaces, non-ascii characters are kept as is)
+    """
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def _js_number_to_string(value) -> str:
+    """
+    String(number) equivalent, so 1.0 becomes "1" and 1e-07 becomes "1e-7"
+    """
+    if isinstance(value, int):
+        return str(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "Infinity" if value > 0 else "-Infinity"
+    if value.is_integer() and abs(value) < 1e21:
+        return str(int(value))
+    result = repr(value)
+    if "e" in result:
+        mantissa, exponent = result.split("e")
+        sign = "-" if exponent.startswith("-") else "+"
+        result = f"{mantissa}e{sign}{exponent.lstrip('+-').lstrip('0') or '0'}"
+    return result
+
+
+def _primitive_to_typed_string(value) -> str:
+    if value is None:
+        return "null:null"
+    if isinstance(value, bool):
+        return f"boolean:{'true' if value else 'false'}"
+    if isinstance(value, (int, float)):
+        return f"number:{_js_number_to_string(value)}"
+    if isinstance(value, str):
+        return f"string:{value}"
+    raise ValueError(f"Parsing error, value is not of primitive type: {value!r}")
+
+
+def salt_data(data):
+    """
+    Replace every primitive value of the document by "{uuid}:{type}:{value}"
+    """
+    if isinstance(data, list):
+        return [salt_data(item) for item in data]
+    if isinstance(data, dict):
+        return {key: salt_data(value) for key, value in data.items()}
+    if isinstance(data, Base64File):
+        # the salted value must be hashed, so there is no sense to keep it lazy
+        data = data.read_base64()
+    return f"{uuid.uuid4()}:{_primitive_to_typed_string(data)}"
+
+
+def flatten(data, prefix=None, output=None) -> dict:
+    """
+    Same as the "flat" npm package does: nested keys are joined by dots
+    and empty objects/lists are kept as values
+    """
+    if output is None:
+        output = {}
+    items = enumerate(data) if isinstance(data, list) else data.items()
+    for key, value in items:
+        new_key = f"{prefix}.{key}" if prefix is not None else str(key)
+        if isinstance(value, (dict, list)) and len(value):
+            flatten(value, new_key, output)
+        else:
+            output[new_key] = value
+    return output
+
+
+def digest_document(document: dict) -> str:
+    """
+    Return the target hash (hex) of the wrapped or the salted document
+    """
+    hashed_data = list(document.get("privacy", {}).get("obfuscatedData", []))
+    for key, value in flatten(document.get("data", {})).items():
+        hashed_data.append(keccak256_hex(_js_stringify({key: value})))
+    return keccak256_hex(_js_stringify(sorted(hashed_data)))
+
+
+def _combine_hashes(first: bytes, second: bytes) -> bytes:
+    if not second:
+        return first
+    if not first:
+        return second
+    return bytes.fromhex(keccak256_hex(b"".join(sorted((first, second)))))
+
+
+class MerkleTree:
+    """
+    Binary merkle tree over sorted-pair keccak256 hashes, as OA builds it
+    """
+
+    def __init__(self, elements: list):
+        self.elements = list(elements)
+        self.layers = self._get_layers(self.elements)
+
+    @classmethod
+    def _get_layers(cls, elements):
+        if not elements:
+            return [[b""]]
+        layers = [elements]
+        while len(layers[-1]) > 1:
+            layer = layers[-1]
+            layers.append(
+                [
+                    _combine_hashes(layer[i], layer[i + 1] if i + 1 < len(layer) else None)
+                    for i in range(0, len(layer), 2)
+                ]
+            )
+        return layers
+
+    def get_root(self) -> bytes:
+        return self.layers[-1][0]
+
+    def get_proof(self, element: bytes) -> list:
+        index = self.elements.index(element)
+        proof = []
+        for layer in self.layers:
+            pair_index = index - 1 if index % 2 else index + 1
+            if pair_index < len(layer):
+                proof.append(layer[pair_index])
+            index = index // 2
+        return proof
+
+
+def check_proof(target_hash: str, proof: list, merkle_root: str) -> bool:
+    """
+    Return True if the proof leads from the target hash to the merkle root
+    """
+    current = bytes.fromhex(target_hash)
+    for sibling in proof:
+        current = _combine_hashes(current, bytes.fromhex(sibling))
+    return current.hex() == merkle_root
+
+
+def wrap_documents(documents: list) -> list:
+    """
+    Wrap (salt, hash and sign with the merkle proof) all given documents
+    under the single merkle root, returning the list of wrapped documents
+    in the same order
+    """
+    salted_documents = [
+        {"version": OA_V2_SCHEMA_ID, "data": salt_data(document)}
+        for document in documents
+    ]
+    target_hashes = [digest_document(document) for document in salted_documents]
+    tree = MerkleTree([bytes.fromhex(target_hash) for target_hash in target_hashes])
+    merkle_root = tree.get_root().hex()
+
+    wrapped = []
+    for document, target_hash in zip(salted_documents, target_hashes):
+        document["signature"] = {
+            "type": OA_V2_SIGNATURE_TYPE,
+            "targetHash": target_hash,
+            "proof": [p.hex() for p in tree.get_proof(bytes.fromhex(target_hash))],
+            "merkleRoot": merkle_root,
+        }
+        wrapped.append(document)
+    return wrapped
+
+
+def wrap_document(document: dict) -> dict:
+    return wrap_documents([document])[0]
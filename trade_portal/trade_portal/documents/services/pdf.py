@@ -0,0 +1,178 @@
+"""
+Single place where uploaded PDFs are parsed to find out what they are
+
+Page size (for the QR code positioning), encryption (we can't watermark such files),
+images (rasterised documents) and other things are needed by different services
+at different moments; instead of each of them parsing the PDF again it's done once
+and the result is cached in the DocumentFile.metadata
+"""
+import hashlib
+import io
+import logging
+import time
+
+from trade_portal.documents.models import DocumentFile
+
+logger = logging.getLogger(__name__)
+
+# points per mm, the same as reportlab.lib.units.mm
+MM = 72 / 25.4
+# don't let the PDF with thousands of pictures to bloat the metadata
+MAX_IMAGES_LISTED = 100
+
+
+class PdfInspector:
+    """
+    Parses the DocumentFile PDF (the original one, before any watermarks) once
+    and caches the result in docfile.metadata["pdf"]:
+        {
+            "version": 1,
+            "file": "name of the file inspected",
+            "sha256": "content hash",
+            "size": bytes,
+            "parseable": bool,
+            "encrypted": bool,
+            "pages": int,
+            "page_sizes": [[width_pt, height_pt], ...],
+            "images": [{"page": 0, "name": "/Im0", "width": 100, "height": 100, "filter": "/DCTDecode"}, ...],
+            "error": "why it's not parseable",
+            "inspected_in": seconds,
+        }
+    The cache is valid while the inspected file is the same (the name changes when the file does)
+    """
+
+    VERSION = 1
+    METADATA_KEY = "pdf"
+
+    def __init__(self, docfile: DocumentFile):
+        self.docfile = docfile
+        self._reader = None
+        self._content = None
+
+    @property
+    def source(self):
+        return self.docfile.original_file or self.docfile.file
+
+    def is_cached(self) -> bool:
+        info = self.docfile.metadata.get(self.METADATA_KEY)
+        return bool(info) and info.get("version") == self.VERSION and info.get("file") == self.source.name
+
+    def inspect(self, force: bool = False) -> dict:
+        if not force and self.is_cached():
+            return self.docfile.metadata[self.METADATA_KEY]
+
+        t0 = time.time()
+        info = self._inspect()
+        info["inspected_in"] = round(time.time() - t0, 4)
+        self.docfile.update_metadata(self.METADATA_KEY, info)
+        return info
+
+    @property
+    def content(self) -> bytes:
+        if self._content is None:
+            self.source.open("rb")
+            try:
+                self.source.seek(0)
+                self._content = self.source.read()
+            finally:
+                self.source.close()
+        return self._content
+
+    @property
+    def reader(self):
+        """
+        Parsed PDF, for the code which needs more than cached info (like writing it);
+        parsed at most once per inspector instance
+        """
+        from PyPDF2 import PdfFileReader
+
+        if self._reader is None:
+            self._reader = PdfFileReader(io.BytesIO(self.content))
+        return self._reader
+
+    def _inspect(self) -> dict:
+        info = {
+            "version": self.VERSION,
+            "file": self.source.name,
+            "sha256": hashlib.sha256(self.content).hexdigest(),
+            "size": len(self.content),
+            "parseable": False,
+            "encrypted": False,
+            "pages": 0,
+            "page_sizes": [],
+            "images": [],
+        }
+        try:
+            reader = self.reader
+            info["encrypted"] = bool(reader.isEncrypted)
+            if reader.isEncrypted:
+                # some of them may be opened with the empty password, but we can't
+                # update them anyway and decrypting is slow, so not trying
+                raise Exception("file has not been decrypted")
+            info["pages"] = reader.getNumPages()
+            for page_number in range(info["pages"]):
+                page = reader.getPage(page_number)
+                box = page.mediaBox
+                info["page_sizes"].append([
+                    round(float(box[2] - box[0]), 2),
+                    round(float(box[3] - box[1]), 2),
+                ])
+                if len(info["images"]) < MAX_IMAGES_LISTED:
+                    info["images"] += self._page_images(page, page_number)
+            info["images"] = info["images"][:MAX_IMAGES_LISTED]
+            info["parseable"] = True
+        except Exception as e:
+            logger.info("Unable to parse %s: %s", self.docfile, e)
+            info["error"] = str(e)
+        return info
+
+    def _page_images(self, page, page_number) -> list:
+        images = []
+        try:
+            self._collect_images(page, page_number, images, depth=0)
+        except Exception as e:
+            # weird resources don't make the document unparseable
+            logger.info("Unable to list images of %s page %s: %s", self.docfile, page_number, e)
+        return images
+
+    def _collect_images(self, container, page_number, images, depth):
+        resources = container.get("/Resources")
+        xobjects = resources.getObject().get("/XObject") if resources else None
+        if not xobjects:
+            return
+        for name, xobject in xobjects.getObject().items():
+            xobject = xobject.getObject()
+            if xobject.get("/Subtype") == "/Form" and depth < 3:
+                # images are often wrapped into forms (scanned documents especially)
+                self._collect_images(xobject, page_number, images, depth + 1)
+            if xobject.get("/Subtype") != "/Image":
+                continue
+            image_filter = xobject.get("/Filter")
+            if isinstance(image_filter, list):
+                # the last filter is the image format (the ones before are unpacked)
+                image_filter = image_filter[-1] if image_filter else None
+            images.append({
+                "page": page_number,
+                "name": str(name),
+                "width": int(xobject.get("/Width", 0)),
+                "height": int(xobject.get("/Height", 0)),
+                "filter": str(image_filter) if image_filter else None,
+            })
+
+    # shortcuts for the cached info, each inspects the file if needed
+
+    def first_page_size_mm(self):
+        """
+        (width, height) of the first page in mm or None if the PDF can't be read
+        """
+        info = self.inspect()
+        if not info["parseable"] or not info["page_sizes"]:
+            return None
+        width, height = info["page_sizes"][0]
+        return round(width / MM, 2), round(height / MM, 2)
+
+    def first_page_size_pt(self):
+        info = self.inspect()
+        if not info["parseable"] or not info["page_sizes"]:
+            return None
+        return tuple(info["page_sizes"][0])
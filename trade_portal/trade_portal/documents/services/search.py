@@ -0,0 +1,70 @@
+"""
+Documents free-text search, shared by the UI list and the API
+
+Document.search_field (filled on save) is converted to the search_vector column by the
+database trigger (see the migration adding it) and has a GIN index, so the search doesn't
+scan the table. The words are matched by their prefixes ("AU-12" finds "AU-12345"), the
+"simple" configuration is used because most of the values are numbers, codes and names.
+
+Run the rebuild_document_search command after changing what search_field contains.
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F
+
+SEARCH_CONFIG = "simple"
+
+# the same characters the parser splits words on (roughly), so the query words
+# are matched against the same words the vector has
+WORD_RE = re.compile(r"[^\W_]+", re.UNICODE)
+MAX_QUERY_WORDS = 10
+
+
+def build_search_query(text: str):
+    """
+    Return SearchQuery matching documents having all the words (as prefixes)
+    or None if there is nothing to search for
+    """
+    tokens = [token for token in (text or "").lower().split() if WORD_RE.search(token)][:MAX_QUERY_WORDS]
+    if not tokens:
+        return None
+    return SearchQuery(
+        " & ".join(_token_query(token) for token in tokens),
+        config=SEARCH_CONFIG,
+        search_type="raw",
+    )
+
+
+def _token_query(token: str) -> str:
+    words = WORD_RE.findall(token)
+    query = " & ".join(_word_query(word) for word in words)
+    if words == [token]:
+        return query
+    # the parser keeps the numbers like "INV/2020/001" or "CO.2020.15" as single words,
+    # so the token is matched as typed too (quoted, the parser splits it the same way)
+    quoted = token.replace("\\", "\\\\").replace("'", "''")
+    return f"('{quoted}':* | ({query}))"
+
+
+def _word_query(word: str) -> str:
+    if word.isdigit():
+        # the parser keeps the dash before numbers ("AU-12345" has the "-12345" word)
+        return f"({word}:* | -{word}:*)"
+    return f"{word}:*"
+
+
+def search_documents(qs, text: str, rank: bool = True):
+    """
+    Filter the documents queryset by the free-text query, the best matches
+    first (and then the newest) if rank is set
+    """
+    query = build_search_query(text)
+    if query is None:
+        return qs
+    qs = qs.filter(search_vector=query)
+    if rank:
+        qs = qs.annotate(
+            search_rank=SearchRank(F("search_vector"), query),
+        ).order_by("-search_rank", "-created_at")
+    return qs
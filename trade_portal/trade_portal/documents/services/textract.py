@@ -1,4 +1,3 @@
-import io
 import logging
 import os
 import subprocess
@@ -35,27 +34,23 @@ class MetadataExtractService:
 
     @classmethod
     def extract_docfile_tesseract(cls, docfile):
-        # pdf2image pypdf2
         from pdf2image import convert_from_bytes
-        from PyPDF2 import PdfFileWriter, PdfFileReader
+        from trade_portal.documents.services.pdf import PdfInspector
 
-        # import time
+        inspector = PdfInspector(docfile)
+        if not inspector.inspect()["parseable"]:
+            logger.info("Not extracting metadata from unparseable %s", docfile)
+            return {}
 
-        # First we get only the first page of the document
-        incoming_pdf = PdfFileReader(docfile.file)
-        first_page_document = PdfFileWriter()
-        first_page_document_file = io.BytesIO()
-        first_page_document.addPage(incoming_pdf.getPage(0))
-        first_page_document.write(first_page_document_file)
-        first_page_document_file.seek(0)
-
-        # convert to PNG
+        # convert the first page to PNG (poppler renders only that page)
         with tempfile.TemporaryDirectory(prefix="ocr_data_") as tmp_dir:
             images = convert_from_bytes(
-                first_page_document_file.read(),
+                inspector.content,
                 dpi=300,
                 fmt="png",
                 transparent=False,
+                first_page=1,
+                last_page=1,
             )
             first_image = images[0]
             first_image.convert("RGB")
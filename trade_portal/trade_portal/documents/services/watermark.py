@@ -2,11 +2,14 @@
 Misc utilities to work with DocumentFile PDFs as images:
 watermarking them, rendering to PNG and getting media info
 """
+import hashlib
 import io
 import logging
+import os
 import time
 
 from constance import config
+from django.conf import settings
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
 
@@ -15,6 +18,7 @@ from trade_portal.documents.models import (
     DocumentFile,
     DocumentHistoryItem,
 )
+from trade_portal.documents.services.pdf import PdfInspector
 
 logger = logging.getLogger(__name__)
 
@@ -59,18 +63,21 @@ class DocumentWatermarkService:
         from reportlab.lib.utils import ImageReader
         from reportlab.lib.units import mm
         from PyPDF2 import PdfFileWriter, PdfFileReader
+        from PyPDF2.utils import PdfReadError
 
         logging.info("Adding a watermark for %s", docfile)
         qrcode_image = PIL.Image.open(io.BytesIO(qrcode_image))
 
-        # Read the original PDF first to detemine it's page size (the first page)
-        orig_doc = PdfFileReader(docfile.original_file or docfile.file)
-        orig_doc_first_page_size = orig_doc.getPage(0).mediaBox
-
-        orig_doc_pagesize = (
-            float(orig_doc_first_page_size[2] - orig_doc_first_page_size[0]),
-            float(orig_doc_first_page_size[3] - orig_doc_first_page_size[1]),
-        )
+        # the page size (the first page) is usually known since the file upload
+        inspector = PdfInspector(docfile)
+        pdf_info = inspector.inspect()
+        if pdf_info["encrypted"]:
+            # protected from updates
+            raise PdfReadError("file has not been decrypted")
+        if not pdf_info["parseable"]:
+            raise PdfReadError(f"Unable to parse the PDF: {pdf_info.get('error')}")
+        orig_doc_pagesize = inspector.first_page_size_pt()
+        orig_doc = inspector.reader
 
         # Prepare the PDF document containing only QR code
         qrcode_stream = io.BytesIO()
@@ -143,45 +150,86 @@ class DocumentFileImageService:
         Or -1, -1 if the document is encrypted (which doesn't mean it can't be read, but can't be updated)
         Or 0, 0 if the document can't be parsed (not a PDF or some internal format issue)
         """
-        from PyPDF2 import PdfFileReader
-        from reportlab.lib.units import mm
-
-        try:
-            # Read the original PDF first to detemine it's page size (the first page)
-            orig_doc = PdfFileReader(docfile.original_file or docfile.file)
-            orig_doc_first_page_size = orig_doc.getPage(0).mediaBox
-        except Exception as e:
-            if "file has not been decrypted" in str(e):
-                return -1, -1
-            else:
-                logger.exception(e)
-                return 0, 0
-        return (
-            round(
-                float(orig_doc_first_page_size[2] - orig_doc_first_page_size[0]) / mm,
-                2
-            ),
-            round(
-                float(orig_doc_first_page_size[3] - orig_doc_first_page_size[1]) / mm,
-                2
-            )
-        )
+        inspector = PdfInspector(docfile)
+        if inspector.inspect()["encrypted"]:
+            return -1, -1
+        return inspector.first_page_size_mm() or (0, 0)
 
-    def get_first_page_as_png(self, source, page_number=0):
+    def get_first_page_as_png(self, source, dpi: int = None) -> bytes:
         """
-        Uses opencv library and works better with encrypted/write-protected PDFs
+        Renders only the first page, at settings.DOCUMENT_PREVIEW_DPI
+        but never bigger than settings.DOCUMENT_PREVIEW_MAX_SIZE_PX
+        source is either a file or bytes
         """
-        import tempfile
-        import cv2
         from pdf2image import convert_from_bytes
 
-        images = convert_from_bytes(source.read())
+        content = source if isinstance(source, bytes) else source.read()
+        images = convert_from_bytes(
+            content,
+            dpi=dpi or settings.DOCUMENT_PREVIEW_DPI,
+            first_page=1,
+            last_page=1,
+        )
+        image = images[0].convert("RGB")
+        image.thumbnail((settings.DOCUMENT_PREVIEW_MAX_SIZE_PX, settings.DOCUMENT_PREVIEW_MAX_SIZE_PX))
+        png_content = io.BytesIO()
+        image.save(png_content, "PNG")
+        return png_content.getvalue()
 
-        png_content = None
-        with tempfile.NamedTemporaryFile(suffix=".ppm") as incoming_ppm_image:
-            # it saves the file physically but there must be other way to do so
-            with tempfile.NamedTemporaryFile(suffix=".png") as tmp_png_file:
-                images[0].save(incoming_ppm_image.name)
-                cv2.imwrite(tmp_png_file.name, cv2.imread(incoming_ppm_image.name))
-                png_content = open(tmp_png_file.name, "rb").read()
-        return png_content
+    def get_preview(self, docfile: DocumentFile, original: bool = False) -> dict:
+        """
+        Returns {"file": storage name of the first page PNG, "etag": "..."}
+        rendering it if it's not rendered yet for the current file
+        (usually it's done in advance, see fill_document_metadata)
+        """
+        source = docfile.original_file if original else docfile.file
+        preview = (docfile.metadata.get("previews") or {}).get(source.name)
+        if preview:
+            return preview
+        return self.render_preview(docfile, original=original)
+
+    def render_preview(self, docfile: DocumentFile, original: bool = False) -> dict:
+        source = docfile.original_file if original else docfile.file
+        inspector = PdfInspector(docfile)
+        if source.name == inspector.source.name:
+            content_hash = inspector.inspect()["sha256"]
+            content = None
+        else:
+            # watermarked file
+            source.open("rb")
+            try:
+                content = source.read()
+            finally:
+                source.close()
+            content_hash = hashlib.sha256(content).hexdigest()
+
+        dpi = self._preview_dpi(inspector)
+        # keyed by the content so the same file is never rendered twice
+        # (like the original one and the file before watermarking)
+        preview_name = f"{os.path.dirname(source.name)}/previews/{content_hash}-{dpi}.png"
+        if not default_storage.exists(preview_name):
+            t0 = time.time()
+            png_content = self.get_first_page_as_png(
+                content if content is not None else inspector.content, dpi=dpi
+            )
+            preview_name = default_storage.save(preview_name, ContentFile(png_content))
+            logger.info("Rendered %s preview in %ss", docfile, round(time.time() - t0, 4))
+
+        preview = {"file": preview_name, "etag": f"{content_hash[:32]}-{dpi}"}
+        # previews of the files replaced are not needed anymore
+        previews = {
+            name: value
+            for name, value in (docfile.metadata.get("previews") or {}).items()
+            if name in (docfile.file.name, docfile.original_file.name)
+        }
+        previews[source.name] = preview
+        docfile.update_metadata("previews", previews)
+        return preview
+
+    def _preview_dpi(self, inspector: PdfInspector) -> int:
+        # lower DPI for large pages, so they are not rendered just to be downscaled
+        dpi = settings.DOCUMENT_PREVIEW_DPI
+        page_size = inspector.first_page_size_pt()
+        if page_size and max(page_size) > 0:
+            dpi = min(dpi, int(settings.DOCUMENT_PREVIEW_MAX_SIZE_PX * 72 / max(page_size)))
+        return dpi
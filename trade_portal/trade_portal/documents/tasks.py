@@ -3,11 +3,15 @@ import logging
 import time
 
 from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
 from PyPDF2.utils import PdfReadError
 
 from trade_portal.documents.models import (
     Document,
     DocumentHistoryItem,
+    OaDetails,
 )
 from trade_portal.documents.services.lodge import DocumentService
 from trade_portal.documents.services.igl import IGLService
@@ -17,31 +21,90 @@ from trade_portal.documents.services.watermark import (
     DocumentFileImageService,
 )
 from trade_portal.oa_verify.services import OaVerificationService
+from trade_portal.utils.monitoring import statsd_gauge
 from config import celery_app
 
 logger = logging.getLogger(__name__)
 
 
-@celery_app.task(
-    ignore_result=True,
-    max_retries=3,
-    interval_start=10,
-    interval_step=10,
-    interval_max=50,
-    time_limit=300,
-    soft_time_limit=290,
-)
+@celery_app.task(ignore_result=True)
 def lodge_document(document_id=None):
     """
-    TODO: split to 2 tasks if we want to be able to retry issuing without re-watermaking
-    or leave as is to have the whole process atomic
+    Start (or resume from the stage saved in document.lodge_stage) the issue pipeline:
+    watermark -> wrap -> encrypt -> notarize -> IGL message.
+    Each stage is a separate task (having its own queue, see CELERY_TASK_ROUTES)
+    which enqueues the next one when finished; failed stage is retried alone.
+    In the batch mode (OA_BATCH_ISSUE_SIZE) the watermark stage is followed by the batch
+    stage instead, wrap, encrypt and notarize are done for the whole batch by issue_document_batch
+    and then each document goes on from its IGL stage.
     """
     doc = Document.objects.get(pk=document_id)
     DocumentHistoryItem.objects.create(
         document=doc, message="Starting the issue step..."
     )
+    if doc.lodge_stage in ("", Document.LODGE_STAGE_DONE):
+        doc.lodge_stage = Document.LODGE_STAGE_WATERMARK
+        doc.save()
+    LODGE_STAGE_TASKS[doc.lodge_stage].apply_async([doc.pk])
+
+
+def _run_lodge_stage(task, document_id, stage, stage_handler):
+    """
+    Run the stage handler if the document is at the given stage, move the cursor forward
+    and enqueue the next stage. The handler returns the next stage
+    or None if the process must be stopped (the document is marked as failed by the handler)
+    or is continued by something else (the batch issue).
+    """
+    doc = Document.objects.select_related("oa").get(pk=document_id)
+    if doc.lodge_stage != stage:
+        # the stage has been done already - most likely a duplicate message
+        logger.info("Document %s is at the %s stage, skipping %s", doc, doc.lodge_stage, stage)
+        return
+    try:
+        t0 = time.time()
+        next_stage = stage_handler(doc)
+        logger.info("Lodge stage %s for %s done in %ss", stage, doc, round(time.time() - t0, 4))
+    except Exception as e:
+        if task.request.retries < task.max_retries:
+            logger.warning("Lodge stage %s for %s failed, retrying: %s", stage, doc, e)
+            raise task.retry(exc=e)
+        DocumentHistoryItem.objects.create(
+            is_error=True,
+            type="error",
+            document=doc,
+            message=f"Unable to issue the document: exception on the {stage} stage",
+            object_body=str(e),
+        )
+        if getattr(settings, "CELERY_TASK_ALWAYS_EAGER", False) is True:
+            # for local setups it's handy to raise exception
+            raise
+        logger.exception(e)
+        if doc.status == Document.STATUS_PENDING:
+            logger.info("Marking document %s as failed", doc)
+            doc.status = Document.STATUS_FAILED
+            doc.save()
+        return
+
+    if next_stage is None:
+        return
+    doc.lodge_stage = next_stage
+    doc.save()
+    if next_stage == Document.LODGE_STAGE_DONE:
+        _lodge_finished(doc)
+    else:
+        LODGE_STAGE_TASKS[next_stage].apply_async([doc.pk])
+
+
+def _lodge_finished(doc):
+    DocumentHistoryItem.objects.create(
+        is_error=False,
+        type="message",
+        document=doc,
+        message="The document issue process is finished",
+    )
 
-    # step1. Watermark things to be watermarked
+
+def _watermark_stage(doc):
     try:
         DocumentWatermarkService().watermark_document(doc)
     except PdfReadError as e:
@@ -73,36 +136,203 @@ def lodge_document(document_id=None):
         doc.verification_status = Document.V_STATUS_FAILED
         doc.save()
         doc.files.filter(is_watermarked=False).update(is_watermarked=None)  # so they are not "processing" anymore
-        return  # for any watermarking error we don't continue the process
+        return None  # for any watermarking error we don't continue the process
+
+    if settings.OA_BATCH_ISSUE_SIZE > 1:
+        return Document.LODGE_STAGE_BATCH
+    return Document.LODGE_STAGE_WRAP
+
+
+def _batch_stage(doc):
+    # will be issued together with other documents by issue_document_batch,
+    # which moves the document to the done stage
+    queued_count = DocumentService().queue_for_batch_issue(doc)
+    if queued_count >= settings.OA_BATCH_ISSUE_SIZE:
+        # no need to wait for the periodic task, the batch is full already
+        issue_document_batch.apply_async()
+    return None
+
+
+def _wrap_stage(doc):
+    doc.verification_status = Document.V_STATUS_PENDING
+    doc.status = Document.STATUS_NOT_SENT
+    doc.save()
+    if DocumentService().wrap(doc) is None:
+        return None
+    return Document.LODGE_STAGE_ENCRYPT
+
+
+def _encrypt_stage(doc):
+    DocumentService().encrypt(doc)
+    return Document.LODGE_STAGE_NOTARIZE
+
+
+def _notarize_stage(doc):
+    # failed notarisation doesn't stop the process, just marks the verification status
+    DocumentService().notarize(doc)
+    return Document.LODGE_STAGE_IGL
+
+
+def _igl_stage(doc):
+    if doc.nodemessage_set.filter(is_outbound=True).exists():
+        # retry after the message has been posted already, don't send a duplicate
+        return Document.LODGE_STAGE_DONE
+    DocumentService().send_igl_message(doc)
+    return Document.LODGE_STAGE_DONE
+
+
+@celery_app.task(
+    bind=True,
+    ignore_result=True,
+    max_retries=3,
+    default_retry_delay=10,
+    time_limit=300,
+    soft_time_limit=290,
+)
+def lodge_watermark_stage(self, document_id):
+    _run_lodge_stage(self, document_id, Document.LODGE_STAGE_WATERMARK, _watermark_stage)
+
+
+@celery_app.task(
+    bind=True,
+    ignore_result=True,
+    max_retries=3,
+    default_retry_delay=10,
+    time_limit=120,
+    soft_time_limit=110,
+)
+def lodge_batch_stage(self, document_id):
+    _run_lodge_stage(self, document_id, Document.LODGE_STAGE_BATCH, _batch_stage)
+
+
+@celery_app.task(
+    bind=True,
+    ignore_result=True,
+    max_retries=3,
+    default_retry_delay=20,
+    time_limit=300,
+    soft_time_limit=290,
+)
+def lodge_wrap_stage(self, document_id):
+    _run_lodge_stage(self, document_id, Document.LODGE_STAGE_WRAP, _wrap_stage)
+
+
+@celery_app.task(
+    bind=True,
+    ignore_result=True,
+    max_retries=3,
+    default_retry_delay=10,
+    time_limit=120,
+    soft_time_limit=110,
+)
+def lodge_encrypt_stage(self, document_id):
+    _run_lodge_stage(self, document_id, Document.LODGE_STAGE_ENCRYPT, _encrypt_stage)
+
+
+@celery_app.task(
+    bind=True,
+    ignore_result=True,
+    max_retries=5,
+    default_retry_delay=30,
+    time_limit=120,
+    soft_time_limit=110,
+)
+def lodge_notarize_stage(self, document_id):
+    _run_lodge_stage(self, document_id, Document.LODGE_STAGE_NOTARIZE, _notarize_stage)
+
+
+@celery_app.task(
+    bind=True,
+    ignore_result=True,
+    max_retries=5,
+    default_retry_delay=30,
+    time_limit=120,
+    soft_time_limit=110,
+)
+def lodge_igl_stage(self, document_id):
+    _run_lodge_stage(self, document_id, Document.LODGE_STAGE_IGL, _igl_stage)
+
+
+LODGE_STAGE_TASKS = {
+    Document.LODGE_STAGE_WATERMARK: lodge_watermark_stage,
+    Document.LODGE_STAGE_BATCH: lodge_batch_stage,
+    Document.LODGE_STAGE_WRAP: lodge_wrap_stage,
+    Document.LODGE_STAGE_ENCRYPT: lodge_encrypt_stage,
+    Document.LODGE_STAGE_NOTARIZE: lodge_notarize_stage,
+    Document.LODGE_STAGE_IGL: lodge_igl_stage,
+}
+
+
+@celery_app.task(
+    bind=True,
+    ignore_result=True,
+    max_retries=3,
+    default_retry_delay=60,
+    time_limit=900,
+    soft_time_limit=890,
+)
+def issue_document_batch(self, oa_ids=None):
+    """
+    Issue documents queued by lodge_document (batch mode, see OA_BATCH_ISSUE_SIZE)
+    under a single merkle root. Called periodically and once the batch is full;
+    the failed batch is retried with the same documents (oa_ids), which are marked
+    as failed once the retries are exhausted. The issued documents are moved to the IGL
+    stage, so the messages are sent (and retried) for every document alone
+    """
+    if oa_ids is None:
+        with transaction.atomic():
+            # claiming the queued documents so parallel calls don't issue them twice
+            oa_ids = list(
+                OaDetails.objects.select_for_update(skip_locked=True).filter(
+                    issue_queued_at__isnull=False
+                ).order_by("issue_queued_at").values_list("pk", flat=True)[:settings.OA_BATCH_ISSUE_SIZE]
+            )
+            OaDetails.objects.filter(pk__in=oa_ids).update(issue_queued_at=None)
+    if not oa_ids:
+        return
 
-    # step2. Issue things to be issued
+    documents = list(
+        Document.objects.filter(oa__in=oa_ids).select_related("oa", "created_by_org").order_by("oa__created_at")
+    )
     try:
         t0 = time.time()
-        DocumentService().issue(doc)
+        issued = DocumentService().issue_batch(documents)
         issue_time_spent = round(time.time() - t0, 4)
     except Exception as e:
-        DocumentHistoryItem.objects.create(
-            is_error=True,
-            type="error",
-            document=doc,
-            message="Unable to issue the document: exception",
-            object_body=str(e),
-        )
-        if getattr(settings, "CELERY_TASK_ALWAYS_EAGER", False) is True:
-            # for local setups it's handy to raise exception
-            raise
+        if self.request.retries < self.max_retries:
+            logger.warning("Batch issue of %s documents failed, retrying: %s", len(documents), e)
+            raise self.retry(kwargs={"oa_ids": oa_ids}, exc=e)
         logger.exception(e)
-        if doc.status == Document.STATUS_PENDING:
+        for doc in documents:
+            DocumentHistoryItem.objects.create(
+                is_error=True,
+                type="error",
+                document=doc,
+                message="Unable to issue the document: exception on the batch stage",
+                object_body=str(e),
+            )
             logger.info("Marking document %s as failed", doc)
+            doc.workflow_status = Document.WORKFLOW_STATUS_NOT_ISSUED
             doc.status = Document.STATUS_FAILED
+            doc.verification_status = Document.V_STATUS_FAILED
             doc.save()
+        if getattr(settings, "CELERY_TASK_ALWAYS_EAGER", False) is True:
+            raise
     else:
-        DocumentHistoryItem.objects.create(
-            is_error=False,
-            type="message",
-            document=doc,
-            message=f"The document issued in {issue_time_spent}s",
-        )
+        for doc in issued:
+            DocumentHistoryItem.objects.create(
+                is_error=False,
+                type="message",
+                document=doc,
+                message=f"The document issued in a batch of {len(documents)} in {issue_time_spent}s",
+            )
+            doc.lodge_stage = Document.LODGE_STAGE_IGL
+            doc.save()
+            lodge_igl_stage.apply_async([doc.pk])
+
+    if len(oa_ids) >= settings.OA_BATCH_ISSUE_SIZE:
+        # there might be more of them waiting
+        issue_document_batch.apply_async()
 
 
 @celery_app.task(
@@ -255,21 +485,36 @@ def fill_document_metadata(document_id=None):
                 docfile.metadata["width_mm"] = x
                 docfile.metadata["height_mm"] = y
             docfile.save()  # fields=("metadata",)
+
+            # so the QR code positioning UI doesn't wait for it
+            try:
+                DocumentFileImageService().render_preview(docfile)
+            except Exception as e:
+                logger.warning("Unable to render %s preview: %s", docfile, e)
     return
 
 
-@celery_app.task(bind=True, ignore_result=True, max_retries=80)  # around 2 hours of retries
-def document_oa_verify(self, document_id, do_retries=True):
+@celery_app.task(ignore_result=True)
+def document_oa_verify(document_id):
     """
     When a new document is sent by us
     Or received from remote party
     We try to parse some OA document from it and verify it
     Changing the verification status
+
+    If it's not valid yet (the notarisation takes a while) it's left pending for
+    verify_pending_documents, which checks such documents in bulk
     """
     document = Document.objects.get(pk=document_id)
-    logger.info(
-        "Trying to verify document %s, attempt %s", document, self.request.retries
-    )
+    _verify_document(document)
+
+
+def _verify_document(document: Document):
+    """
+    Verify the document once and update its verification status;
+    return the verifier response or None if there is nothing to verify
+    """
+    logger.info("Trying to verify document %s", document)
     t0 = time.time()
     vc = document.get_vc()
     if not vc:
@@ -284,12 +529,13 @@ def document_oa_verify(self, document_id, do_retries=True):
             document=document,
             message="Unable to verify document: no VC can be retrieved; it's either invalid or of non-OA format",
         )
-        return
+        return None
     else:
         # this is definitely OA, report that we have started the verification
         # which will either end in `valid` status or `failed` if we give up doing that
         if document.verification_status == Document.V_STATUS_NOT_STARTED:
             document.verification_status = Document.V_STATUS_PENDING
+            document.verification_started_at = timezone.now()
             document.save()
             DocumentHistoryItem.objects.create(
                 type="OA",
@@ -297,7 +543,9 @@ def document_oa_verify(self, document_id, do_retries=True):
                 message="Verification started...",
             )
 
-    verify_response = OaVerificationService().verify_json_tt_document(vc.read())
+    # the status is expected to change (until the document is notarized), so the cached one is not used
+    verify_response = OaVerificationService().verify_json_tt_document(vc.read(), use_cache=False)
+    document.verification_checked_at = timezone.now()
     if verify_response.get("status") == "valid":
         document.verification_status = Document.V_STATUS_VALID
         document.save()
@@ -307,7 +555,12 @@ def document_oa_verify(self, document_id, do_retries=True):
             message="The document OA credential is valid",
             object_body=f"Spent {round(time.time() - t0, 6)}s"
         )
-        return
+    elif verify_response.get("verifier_unavailable"):
+        # not the document problem, the sweeper tries again later
+        logger.warning("Verifier is unavailable, document %s verification postponed", document)
+        if document.verification_status == Document.V_STATUS_PENDING and not document.verification_started_at:
+            document.verification_started_at = timezone.now()
+        document.save()
     elif verify_response.get("status") == "error":
         document.verification_status = Document.V_STATUS_ERROR
         document.save()
@@ -323,37 +576,167 @@ def document_oa_verify(self, document_id, do_retries=True):
             message=f"Unable to verify document: {verify_response.get('error_message')}",
             object_body=f"Spent {round(time.time() - t0, 6)}s"
         )
-        return
-    if do_retries:
-        if self.request.retries < self.max_retries:
-            is_eager = getattr(settings, "CELERY_TASK_ALWAYS_EAGER", False)
-            if self.request.retries < 10:
-                retry_delay = 30  # seconds
-            else:
-                retry_delay = 120  # seconds
+    else:
+        if document.verification_status != Document.V_STATUS_PENDING:
+            # re-verification of the failed one, give it the time again
+            document.verification_status = Document.V_STATUS_PENDING
+            document.verification_started_at = timezone.now()
+        elif not document.verification_started_at:
+            # pending since the issue has started, the sweeper takes it from now
+            document.verification_started_at = timezone.now()
+        logger.info("The document %s is not valid yet, leaving it pending", document)
+        document.save()
+    return verify_response
 
-            if is_eager is True:
-                logger.warning("Not retrying eager verification task")
-            else:
-                logger.info(
-                    "Retrying the document %s verification task (retry %s, delay %s)",
-                    document,
-                    self.request.retries,
-                    retry_delay
-                )
-                self.retry(countdown=retry_delay)
-        else:
-            # max retries but still not valid - mark as failed
-            document.verification_status = Document.V_STATUS_FAILED
-            document.save()
-            DocumentHistoryItem.objects.create(
-                is_error=True,
-                type="error",
-                document=document,
-                message=f"Unable to verify the document after {self.request.retries} attempts",
-            )
+
+def _is_issued(verify_response: dict) -> bool:
+    """
+    The document status (issuance) fragments are the same for all documents
+    having the same merkle root, if any of them is valid the root is issued
+    """
+    return any(
+        fragment.get("type") == "DOCUMENT_STATUS" and fragment.get("status") == "VALID"
+        for fragment in verify_response.get("verify_result") or []
+        if isinstance(fragment, dict)
+    )
+
+
+@celery_app.task(
+    ignore_result=True,
+    time_limit=900,
+    soft_time_limit=890,
+)
+def verify_pending_documents():
+    """
+    Check the documents waiting for their issuance confirmation (instead of each of them
+    retrying its verification on its own); called periodically, see OA_VERIFY_SWEEP_INTERVAL_SECONDS
+
+    A batch of documents issued together shares the merkle root, so a single document
+    of it is verified first (the least recently checked one) and only when the root
+    is confirmed issued the rest of them are verified. Documents pending longer than
+    OA_VERIFY_PENDING_MAX_SECONDS are marked as failed.
+    """
+    now = timezone.now()
+    # the documents still being issued (pending too, but not notarized or verified yet) are not touched
+    pending = Document.objects.filter(
+        verification_status=Document.V_STATUS_PENDING,
+        verification_started_at__isnull=False,
+    )
+
+    expired_before = now - datetime.timedelta(seconds=settings.OA_VERIFY_PENDING_MAX_SECONDS)
+    for document in pending.filter(verification_started_at__lt=expired_before):
+        document.verification_status = Document.V_STATUS_FAILED
+        document.save()
+        DocumentHistoryItem.objects.create(
+            is_error=True,
+            type="error",
+            document=document,
+            message=(
+                "Unable to verify the document after "
+                f"{settings.OA_VERIFY_PENDING_MAX_SECONDS // 60} minutes"
+            ),
+        )
+
+    groups = {}
+    for document in pending.filter(
+        verification_started_at__gte=expired_before,
+    ).select_related("oa").order_by(
+        F("verification_checked_at").asc(nulls_first=True), "created_at",
+    )[:settings.OA_VERIFY_SWEEP_SIZE]:
+        merkle_root = document.oa.merkle_root if document.oa else ""
+        groups.setdefault(merkle_root or document.pk, []).append(document)
+
+    verifications = 0
+    for key, documents in groups.items():
+        representative, rest = documents[0], documents[1:]
+        try:
+            verify_response = _verify_document(representative)
+        except Exception as e:
+            # the group is not the first one to check anymore, so it doesn't block the rest
+            logger.exception(e)
+            _mark_checked(documents, now)
+            continue
+        verifications += 1
+        if verify_response and verify_response.get("verifier_unavailable"):
+            logger.warning("Verifier is unavailable, the pending documents are checked later")
+            break
+        if not rest:
+            continue
+        if verify_response is None or not _is_issued(verify_response):
+            # no need to ask about the same root again
+            _mark_checked(rest, now)
+            continue
+        for document in rest:
+            try:
+                _verify_document(document)
+            except Exception as e:
+                logger.exception(e)
+                _mark_checked([document], now)
+            verifications += 1
+    logger.info(
+        "Checked %s pending documents in %s groups using %s verifications",
+        sum(len(documents) for documents in groups.values()), len(groups), verifications,
+    )
+    statsd_gauge("documents.verification_pending", pending.count())
+
+
+def _mark_checked(documents, now):
+    Document.objects.filter(pk__in=[d.pk for d in documents]).update(verification_checked_at=now)
+
+
+@celery_app.task(
+    ignore_result=True,
+    time_limit=300,
+    soft_time_limit=290,
+)
+def consume_oa_issued_events():
+    """
+    Mark the documents valid as soon as the worker tells they are issued (instead of
+    the verification finding that out); the sweeper still checks the documents
+    whose events were lost. Called periodically, see OA_ISSUED_EVENTS_POLL_SECONDS
+    """
+    from trade_portal.documents.services.notarize import NotaryService
+
+    # waiting for the events until the next call; the default reading limits are
+    # well within the task time limit, whatever is left is read by the next call
+    handled = NotaryService().consume_issued_events(
+        handle_oa_issued_event, wait_seconds=max(settings.OA_ISSUED_EVENTS_POLL_SECONDS - 2, 0),
+    )
+    if handled:
+        logger.info("Handled %s issued events", handled)
+
+
+def handle_oa_issued_event(event: dict):
+    """
+    The event format: {"type": "issued", "merkleRoot", "transactionHash", "blockNumber", "keys"},
+    transactionHash and blockNumber are empty if the root had been issued before
+    """
+    merkle_root = event.get("merkleRoot")
+    if event.get("type") != "issued" or not merkle_root:
+        logger.warning("Ignoring unsupported issued event %s", event)
+        return
+    if event.get("transactionHash"):
+        details = f"Transaction {event['transactionHash']}, block {event.get('blockNumber')}"
     else:
-        logger.info("not scheduling any retries because started directly")
+        details = "The merkle root had been issued before"
+    now = timezone.now()
+    documents = Document.objects.filter(
+        oa__merkle_root=merkle_root,
+        verification_status__in=(Document.V_STATUS_NOT_STARTED, Document.V_STATUS_PENDING),
+    )
+    for document in documents:
+        document.verification_status = Document.V_STATUS_VALID
+        document.verification_checked_at = now
+        document.save()
+        DocumentHistoryItem.objects.create(
+            type="OA",
+            document=document,
+            message="The document OA credential has been issued",
+            object_body=details,
+        )
+    # the public verifier may have the "not issued" response cached
+    OaVerificationService.invalidate_cached_result(merkle_root)
+    logger.info("Merkle root %s issued (%s)", merkle_root, details)
 
 
 @celery_app.task(ignore_result=True)
@@ -0,0 +1,147 @@
+"""
+The documents list queries (UI and API) are checked to use the indexes
+
+The table is seeded and analysed, the sequential scans are disabled (so they are
+planned only when there is no index to use instead) and the plans of the real
+filter combinations are checked to have no sequential scans.
+
+The exporter and importer name filters (case-insensitive substrings) can't use
+the indexes and are not checked.
+"""
+import datetime
+import random
+
+import pytest
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.request import Request
+
+from trade_portal.document_api.views import CertificateViewSet, PaginationBy10, encode_cursor
+from trade_portal.documents.models import Document, DocumentAccess, Party
+from trade_portal.documents.views.documents import DocumentListView
+from trade_portal.users.models import Organisation
+from trade_portal.users.tests.factories import UserFactory
+
+SEEDED_DOCUMENTS = 3000
+
+UI_FILTERS = [
+    {},
+    {"vstatus": Document.V_STATUS_VALID},
+    {"type_filter": Document.TYPE_PREF_COO},
+    {"created_after": "01/03/2020", "created_before": "31/03/2020"},
+    {"vstatus": Document.V_STATUS_FAILED, "type_filter": Document.TYPE_NONPREF_COO, "created_after": "01/03/2020"},
+    {"q": "AU-12"},
+    {"q": "Trader", "vstatus": Document.V_STATUS_VALID},
+]
+API_FILTERS = [
+    {},
+    {"verificationStatus": Document.V_STATUS_PENDING},
+    {"messageStatus": Document.STATUS_NOT_SENT},
+    {"importingCountry": "CN"},
+    {"exporter": "10000000007"},
+    {"createdDateAfter": "2020-03-01", "createdDateBefore": "2020-03-31"},
+    {"messageStatus": Document.STATUS_NOT_SENT, "createdDateAfter": "2020-03-01"},
+    {"q": "AU-12"},
+]
+
+
+@pytest.fixture
+def seeded_documents(docapi_env):
+    rnd = random.Random(42)
+    orgs = {
+        "regulator": Organisation.objects.create(name="Regulator org", is_regulator=True),
+        "chambers": Organisation.objects.create(name="Chambers org", is_chambers=True),
+        "trader": Organisation.objects.create(name="Trader 7", business_id="10000000007", is_trader=True),
+    }
+    chambers = [orgs["chambers"]] + [Organisation.objects.create(name=f"Chambers {i}") for i in range(20)]
+    parties = Party.objects.bulk_create([
+        Party(name=f"Trader {i}", business_id=f"abr.gov.au:abn::{10000000000 + i}",
+              clear_business_id=f"{10000000000 + i}")
+        for i in range(200)
+    ])
+    started = timezone.now() - datetime.timedelta(days=1000)
+    documents = Document.objects.bulk_create([
+        Document(
+            created_at=started + datetime.timedelta(hours=i * 8),
+            created_by_org=rnd.choice(chambers),
+            type=rnd.choice([Document.TYPE_PREF_COO, Document.TYPE_NONPREF_COO]),
+            document_number=f"AU-{i}",
+            importing_country=rnd.choice(["CN", "SG", "ID", "NZ", "TH", "VN", "MY", "JP", "KR", "IN"]),
+            importer_name=f"Trader {rnd.randint(0, 300)}",
+            exporter=rnd.choice(parties),
+            status=rnd.choice([code for code, name in Document.MESSAGE_STATUS_CHOICES]),
+            verification_status=rnd.choice([code for code, name in Document.V_STATUS_CHOICES]),
+            workflow_status=rnd.choice([code for code, name in Document.WORKFLOW_STATUS_CHOICES]),
+            search_field=f"AU-{i}\nTrader {i % 300}",
+        )
+        for i in range(SEEDED_DOCUMENTS)
+    ])
+    DocumentAccess.update_for_org(orgs["trader"])
+    with connection.cursor() as cursor:
+        # the documents are created bypassing the trigger
+        cursor.execute("UPDATE documents_document SET search_vector = to_tsvector('simple', search_field)")
+        cursor.execute("ANALYZE documents_document, documents_party, documents_documentaccess")
+    assert len(documents) == SEEDED_DOCUMENTS
+    return orgs
+
+
+def _sequential_scans(sql):
+    with connection.cursor() as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+        plan = cursor.fetchone()[0]
+    scans = []
+    nodes = [plan[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if node["Node Type"] == "Seq Scan":
+            scans.append(node["Relation Name"])
+        nodes.extend(node.get("Plans", []))
+    return scans
+
+
+def _check_plans(qs, paginate=None):
+    # the page and the count of all the documents found, like the paginators do
+    with CaptureQueriesContext(connection) as queries:
+        if paginate:
+            paginate(qs)
+        else:
+            list(qs[:25])
+            qs.count()
+    for query in queries:
+        assert not _sequential_scans(query["sql"]), query["sql"]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("org_kind", ["regulator", "chambers", "trader"])
+def test_documents_list_plans(seeded_documents, org_kind):
+    user = UserFactory(is_staff=True)
+    for filters in UI_FILTERS:
+        request = RequestFactory().get("/documents/", filters)
+        request.user = user
+        request.session = {"current_org_id": seeded_documents[org_kind].pk}
+        view = DocumentListView()
+        view.setup(request)
+        _check_plans(view.get_queryset())
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("org_kind", ["regulator", "chambers", "trader"])
+def test_documents_api_plans(seeded_documents, org_kind):
+    for filters in API_FILTERS:
+        view = CertificateViewSet()
+        view.setup(Request(RequestFactory().get("/api/documents/v0/CertificatesOfOrigin/", filters)))
+        view.current_org = seeded_documents[org_kind]
+        _check_plans(view.get_queryset())
+
+    # the next page by cursor
+    middle = Document.objects.order_by("created_at")[SEEDED_DOCUMENTS // 2]
+    cursor = encode_cursor(middle.created_at, middle.pk)
+    for filters in API_FILTERS:
+        request = Request(RequestFactory().get("/api/documents/v0/CertificatesOfOrigin/", dict(filters, cursor=cursor)))
+        view = CertificateViewSet()
+        view.setup(request)
+        view.current_org = seeded_documents[org_kind]
+        _check_plans(view.get_queryset(), lambda qs: PaginationBy10().paginate_queryset(qs, request))
@@ -0,0 +1,96 @@
+import importlib
+import io
+
+import pytest
+from django.apps import apps
+from django.core.management import call_command
+
+from trade_portal.documents.models import Document, DocumentAccess
+from trade_portal.documents.services.access import legacy_visible_documents, visible_documents
+from trade_portal.documents.tests.factories import DocumentFactory, PartyFactory
+from trade_portal.users.models import Organisation
+
+
+@pytest.mark.django_db
+def test_document_access(docapi_env):
+    trader = Organisation.objects.create(name="Wine Imports", business_id="11111111111", is_trader=True)
+    imported = DocumentFactory(importer_name="Wine Imports")
+    exported = DocumentFactory(exporter=PartyFactory(name="Other name", clear_business_id="11111111111"))
+    other = DocumentFactory(importer_name="Beef Traders")
+    qs = Document.objects.all()
+
+    assert set(visible_documents(qs, trader)) == {imported, exported}
+    assert set(legacy_visible_documents(qs, trader)) == {imported, exported}
+    assert set(visible_documents(qs, Organisation(is_regulator=True))) == {imported, exported, other}
+    assert not visible_documents(qs, None).exists()
+
+    # the document changes
+    other.importer_name = "11111111111"
+    other.save()
+    imported.importer_name = "Somebody else"
+    imported.save()
+    assert set(visible_documents(qs, trader)) == {exported, other}
+
+    # the exporter changes
+    exported.exporter.clear_business_id = "22222222222"
+    exported.exporter.save()
+    assert set(visible_documents(qs, trader)) == {other}
+
+    # the organisation changes
+    trader.business_id = "22222222222"
+    trader.save()
+    assert set(visible_documents(qs, trader)) == {exported}
+
+
+@pytest.mark.django_db
+def test_check_document_access(docapi_env):
+    trader = Organisation.objects.create(name="Wine Imports", is_trader=True)
+    document = DocumentFactory(importer_name="Wine Imports")
+    call_command("check_document_access", stdout=io.StringIO())
+
+    DocumentAccess.objects.all().delete()
+    with pytest.raises(SystemExit):
+        call_command("check_document_access", stdout=io.StringIO(), stderr=io.StringIO())
+    call_command("check_document_access", fix=True, stdout=io.StringIO())
+    assert list(visible_documents(Document.objects.all(), trader)) == [document]
+    call_command("check_document_access", stdout=io.StringIO())
+
+
+@pytest.mark.django_db
+def test_document_access_exporter_deleted(docapi_env):
+    trader = Organisation.objects.create(name="Wine Exports", is_trader=True)
+    document = DocumentFactory(exporter=PartyFactory(name="Wine Exports"))
+    assert list(visible_documents(Document.objects.all(), trader)) == [document]
+
+    document.exporter.delete()
+    assert not DocumentAccess.objects.filter(org=trader).exists()
+    assert not visible_documents(Document.objects.all(), trader).exists()
+
+
+@pytest.mark.django_db
+def test_document_access_not_trader(docapi_env):
+    org = Organisation.objects.create(name="Wine Imports", is_trader=True)
+    DocumentFactory(importer_name="Wine Imports")
+    assert DocumentAccess.objects.filter(org=org).exists()
+
+    org.is_trader = False
+    org.save()
+    assert not DocumentAccess.objects.filter(org=org).exists()
+
+    # the documents saved meanwhile don't give it the rows either
+    DocumentFactory(importer_name="Wine Imports")
+    assert not DocumentAccess.objects.filter(org=org).exists()
+    call_command("check_document_access", stdout=io.StringIO())
+
+
+@pytest.mark.django_db
+def test_document_access_migration(docapi_env):
+    migration = importlib.import_module("trade_portal.documents.migrations.0044_document_access")
+    trader = Organisation.objects.create(name="Wine Imports", is_trader=True)
+    chamber = Organisation.objects.create(name="Wine Imports", is_chambers=True)
+    document = DocumentFactory(importer_name="Wine Imports")
+    DocumentAccess.objects.all().delete()
+
+    migration.fill_document_access(apps, None)
+    assert list(DocumentAccess.objects.filter(org=trader).values_list("document", flat=True)) == [document.pk]
+    assert not DocumentAccess.objects.filter(org=chamber).exists()
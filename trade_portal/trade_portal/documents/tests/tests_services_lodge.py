@@ -2,7 +2,7 @@ import json
 from unittest import mock
 
 import pytest
-from trade_portal.documents.models import Document, DocumentHistoryItem
+from trade_portal.documents.models import Document, DocumentHistoryItem, OaDetails
 from trade_portal.documents.services.lodge import DocumentService
 from trade_portal.documents.tests.factories import DocumentFactory
 
@@ -81,3 +81,62 @@ def test_document_service(notary_service_mock, oa_task_mock, docapi_env, ERROR_C
             Document.V_STATUS_ERROR,
             Document.WORKFLOW_STATUS_ISSUED
         )
+
+
+@pytest.mark.django_db
+@mock.patch("trade_portal.documents.tasks.document_oa_verify.apply_async")
+@mock.patch("trade_portal.documents.services.notarize.NotaryService.notarize_files")
+def test_document_service_batch(notary_service_mock, oa_task_mock, docapi_env):
+    from trade_portal.documents.services.oa_wrap import check_proof
+
+    notary_service_mock.return_value = True
+    # the API client has no batch wrapping so the native one is used
+    oa_client = mock.MagicMock(spec=["wrap_document"])
+    s = DocumentService(ig_client=mock.MagicMock(), oa_client=oa_client)
+    docs = [DocumentFactory() for i in range(3)]
+
+    issued = s.issue_batch(docs)
+
+    assert issued == docs
+    assert oa_client.wrap_document.call_count == 0
+    assert notary_service_mock.call_count == 1
+    assert len(notary_service_mock.call_args[0][0]) == 3
+    assert oa_task_mock.call_count == 3
+
+    merkle_roots = set()
+    for doc in docs:
+        doc.oa.refresh_from_db()
+        assert doc.verification_status == Document.V_STATUS_PENDING
+        assert doc.oa.ciphertext_file and doc.oa.get_ciphertext()
+        assert doc.oa.proof
+        assert check_proof(doc.oa.target_hash, doc.oa.proof, doc.oa.merkle_root)
+        merkle_roots.add(doc.oa.merkle_root)
+    assert len(merkle_roots) == 1
+
+
+@pytest.mark.django_db
+@mock.patch("trade_portal.documents.services.lodge.DocumentService.send_igl_message")
+@mock.patch("trade_portal.documents.services.lodge.DocumentService.issue_batch")
+def test_issue_document_batch_task(issue_batch_mock, igl_mock, docapi_env, settings):
+    from trade_portal.documents.tasks import issue_document_batch
+
+    settings.OA_BATCH_ISSUE_SIZE = 2
+    docs = [DocumentFactory() for i in range(3)]
+    for doc in docs:
+        DocumentService(oa_client=mock.MagicMock()).queue_for_batch_issue(doc)
+    issue_batch_mock.side_effect = lambda documents: documents
+
+    with mock.patch("trade_portal.documents.tasks.issue_document_batch.apply_async") as next_batch_mock:
+        issue_document_batch()
+        # the batch was full, so there might be more documents waiting
+        assert next_batch_mock.call_count == 1
+    assert [d.pk for d in issue_batch_mock.call_args[0][0]] == [d.pk for d in docs[:2]]
+
+    issue_document_batch()
+    assert [d.pk for d in issue_batch_mock.call_args[0][0]] == [docs[2].pk]
+
+    issue_document_batch()
+    assert issue_batch_mock.call_count == 2
+    assert not OaDetails.objects.filter(issue_queued_at__isnull=False).exists()
+    # the messages are sent by the documents' own IGL stage
+    assert igl_mock.call_count == 3
@@ -0,0 +1,103 @@
+import base64
+import json
+import os
+
+from trade_portal.documents.services import oa_wrap
+from trade_portal.documents.services.encryption import AESCipher
+from trade_portal.documents.services.oa import OaNativeClient
+
+# documents wrapped by the JS open-attestation library, used for parity checks
+OA_ASSETS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))),
+    "oa_verify", "tests", "assets"
+)
+
+
+def _read_js_wrapped_documents():
+    simple = json.loads(open(os.path.join(OA_ASSETS_PATH, "simple-oa.json"), "rb").read())
+
+    # CoO with PDF attached, issued by the trade portal and stored encrypted
+    encrypted = json.loads(
+        open(os.path.join(
+            OA_ASSETS_PATH, "trade-get-resp-1f4abad2-adaf-4704-834c-fe2b26db5a63.json"
+        ), "rb").read()
+    )["document"]
+    cleartext_b64 = AESCipher(
+        "BCE7AC1B7BAFA6D2FB18775F63D770A293757D19E5A58A013478F4A73712A09B"
+    ).decrypt(encrypted["iv"], encrypted["tag"], encrypted["cipherText"])
+    coo = json.loads(base64.b64decode(cleartext_b64))
+    return [simple, coo]
+
+
+def test_digest_parity_with_js_wrapper():
+    for wrapped in _read_js_wrapped_documents():
+        assert oa_wrap.digest_document(wrapped) == wrapped["signature"]["targetHash"]
+        assert oa_wrap.check_proof(
+            wrapped["signature"]["targetHash"],
+            wrapped["signature"]["proof"],
+            wrapped["signature"]["merkleRoot"],
+        )
+
+
+def test_salt_data():
+    salted = oa_wrap.salt_data({
+        "s": "a:b", "i": 1, "f": 1.5, "whole": 2.0, "b": False, "n": None,
+        "l": [True, {"x": "y"}], "empty": {}, "empty_list": [],
+    })
+    values = oa_wrap.flatten(salted)
+    assert [v.split(":", 1)[1] for k, v in sorted(values.items()) if isinstance(v, str)] == [
+        "boolean:false",
+        "number:1.5",
+        "number:1",
+        "boolean:true",
+        "string:y",
+        "null:null",
+        "string:a:b",
+        "number:2",
+    ]
+    assert values["empty"] == {}
+    assert values["empty_list"] == []
+    assert len(salted["s"].split(":")[0]) == len("6cdb27f1-a46e-4dea-b1af-3b3faf7d983d")
+
+
+def test_wrap_document():
+    doc = {"version": "open-attestation/2.0", "name": "Привет", "issuers": [{"name": "x"}]}
+    wrapped = oa_wrap.wrap_document(doc)
+
+    assert wrapped["version"] == oa_wrap.OA_V2_SCHEMA_ID
+    assert wrapped["signature"]["type"] == "SHA3MerkleProof"
+    assert wrapped["signature"]["proof"] == []
+    assert wrapped["signature"]["targetHash"] == wrapped["signature"]["merkleRoot"]
+    assert oa_wrap.digest_document(wrapped) == wrapped["signature"]["targetHash"]
+    assert wrapped["data"]["issuers"][0]["name"].endswith(":string:x")
+
+    # salts differ each time
+    assert oa_wrap.wrap_document(doc)["signature"]["merkleRoot"] != wrapped["signature"]["merkleRoot"]
+
+
+def test_wrap_documents_batch():
+    docs = [{"id": str(i)} for i in range(5)]
+    wrapped = oa_wrap.wrap_documents(docs)
+
+    assert len(wrapped) == 5
+    merkle_roots = {w["signature"]["merkleRoot"] for w in wrapped}
+    assert len(merkle_roots) == 1
+    for original, w in zip(docs, wrapped):
+        assert w["data"]["id"].endswith(":string:" + original["id"])
+        assert w["signature"]["proof"]
+        assert oa_wrap.check_proof(
+            w["signature"]["targetHash"], w["signature"]["proof"], w["signature"]["merkleRoot"]
+        )
+    # the odd element is promoted to the next layer without hashing
+    assert len(wrapped[-1]["signature"]["proof"]) == 1
+    assert not oa_wrap.check_proof(
+        wrapped[0]["signature"]["targetHash"], wrapped[1]["signature"]["proof"], merkle_roots.pop()
+    )
+
+
+def test_native_client():
+    resp = OaNativeClient().wrap_document({"name": "test"})
+    assert resp.status_code == 200
+    assert "content" not in resp.__dict__  # not serialised until used
+    assert json.loads(resp.content) == resp.json()
+    assert resp.json()["signature"]["merkleRoot"]
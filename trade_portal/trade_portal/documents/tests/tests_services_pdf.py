@@ -0,0 +1,118 @@
+import os
+from unittest import mock
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import Client
+from django.urls import reverse
+
+from trade_portal.documents.models import DocumentFile
+from trade_portal.documents.services.pdf import PdfInspector
+from trade_portal.documents.services.watermark import DocumentFileImageService
+from trade_portal.documents.tests.factories import DocumentFactory
+
+ASSETS = os.path.join(os.path.dirname(__file__), "assets")
+OA_VERIFY_ASSETS = os.path.join(os.path.dirname(__file__), "..", "..", "oa_verify", "tests", "assets")
+
+
+def _docfile(path=None, content=None, filename="document.pdf"):
+    if path:
+        with open(path, "rb") as f:
+            content = f.read()
+    return DocumentFile.objects.create(
+        doc=DocumentFactory(),
+        file=ContentFile(content, name=filename),
+        filename=filename,
+    )
+
+
+@pytest.mark.django_db
+def test_pdf_inspector(docapi_env):
+    docfile = _docfile(os.path.join(ASSETS, "A5.pdf"))
+
+    info = PdfInspector(docfile).inspect()
+    assert info["parseable"] and not info["encrypted"]
+    assert info["pages"] == len(info["page_sizes"]) == 1
+    assert len(info["sha256"]) == 64
+    assert PdfInspector(docfile).first_page_size_mm() == (148.0, 209.97)
+
+    # cached in the database, so the file is not parsed again
+    docfile.refresh_from_db()
+    assert docfile.metadata["pdf"] == info
+    with mock.patch("PyPDF2.PdfFileReader") as reader_mock:
+        assert DocumentFileImageService().get_first_page_size_mm(docfile) == (148.0, 209.97)
+    assert reader_mock.call_count == 0
+
+    # but it is if the file has changed
+    docfile.original_file = ContentFile(b"not a pdf at all", name="document.pdf")
+    docfile.save()
+    info = PdfInspector(docfile).inspect()
+    assert not info["parseable"] and info["error"]
+    assert DocumentFileImageService().get_first_page_size_mm(docfile) == (0, 0)
+
+
+@pytest.mark.django_db
+def test_pdf_inspector_protected_and_images(docapi_env):
+    docfile = _docfile(os.path.join(OA_VERIFY_ASSETS, "protected-from-update-with-qr.pdf"))
+    assert PdfInspector(docfile).inspect()["encrypted"]
+    assert DocumentFileImageService().get_first_page_size_mm(docfile) == (-1, -1)
+
+    docfile = _docfile(os.path.join(OA_VERIFY_ASSETS, "cert-AANZFTA-rasterised.pdf"))
+    info = PdfInspector(docfile).inspect()
+    assert info["parseable"]
+    assert info["images"]
+    assert {"page", "name", "width", "height", "filter"} <= set(info["images"][0].keys())
+
+
+@pytest.mark.django_db
+@mock.patch("trade_portal.documents.services.watermark.DocumentFileImageService.get_first_page_as_png")
+def test_document_preview_cache(render_mock, docapi_env):
+    render_mock.return_value = b"PNG content"
+    docfile = _docfile(os.path.join(ASSETS, "A5.pdf"))
+    service = DocumentFileImageService()
+
+    preview = service.render_preview(docfile)
+    assert render_mock.call_count == 1
+    assert preview["file"].startswith(docfile.file.name.rsplit("/", 1)[0] + "/previews/")
+    assert default_storage.open(preview["file"]).read() == b"PNG content"
+
+    # rendered once per file content
+    docfile.refresh_from_db()
+    assert service.get_preview(docfile) == preview
+    assert service.get_preview(docfile, original=True) == preview
+    assert render_mock.call_count == 1
+    assert service.render_preview(docfile) == preview
+    assert render_mock.call_count == 1
+
+    # served with the ETag, so the positioning UI doesn't download it again
+    client = Client()
+    client.force_login(docapi_env["u1"])
+    url = reverse("documents:file-download", args=[docfile.doc.pk, docfile.pk]) + "?as_png=1&original=1"
+    resp = client.get(url)
+    assert resp.status_code == 200
+    assert resp.content == b"PNG content"
+    assert resp["ETag"] == f'"{preview["etag"]}"'
+    assert client.get(url, HTTP_IF_NONE_MATCH=resp["ETag"]).status_code == 304
+
+    # and again when the file is changed
+    with open(os.path.join(OA_VERIFY_ASSETS, "no-qr-code.pdf"), "rb") as f:
+        docfile.file = ContentFile(f.read(), name="document.altered.pdf")
+    docfile.save()
+    new_preview = service.get_preview(docfile)
+    assert render_mock.call_count == 2
+    assert new_preview["etag"] != preview["etag"]
+    docfile.refresh_from_db()
+    assert set(docfile.metadata["previews"].keys()) == {docfile.file.name, docfile.original_file.name}
+
+
+@pytest.mark.django_db
+def test_document_preview_no_original_file(docapi_env):
+    docfile = _docfile(os.path.join(ASSETS, "A5.pdf"))
+    DocumentFile.objects.filter(pk=docfile.pk).update(original_file="")
+
+    client = Client()
+    client.force_login(docapi_env["u1"])
+    url = reverse("documents:file-download", args=[docfile.doc.pk, docfile.pk])
+    assert client.get(url + "?as_png=1&original=1").status_code == 404
+    assert client.get(url + "?original=1").status_code == 404
@@ -0,0 +1,69 @@
+import io
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+
+from trade_portal.documents.models import Document
+from trade_portal.documents.services.search import build_search_query, search_documents
+from trade_portal.documents.tests.factories import DocumentFactory
+
+
+def test_build_search_query():
+    assert build_search_query("") is None
+    assert build_search_query(" -- ") is None
+
+
+@pytest.mark.django_db
+def test_search_documents(docapi_env):
+    wine = DocumentFactory(document_number="AU-12345", importer_name="Singapore Wine Imports")
+    beef = DocumentFactory(document_number="AU-67890", importer_name="Beef Traders")
+    qs = Document.objects.all()
+
+    # the vector is kept up to date by the database, whatever way the document is saved
+    assert list(search_documents(qs, "AU-123")) == [wine]
+    assert list(search_documents(qs, "wine sing")) == [wine]
+    assert list(search_documents(qs, beef.short_id)) == [beef]
+    assert set(search_documents(qs, "au")) == {wine, beef}
+    assert not search_documents(qs, "wine beef").exists()
+    assert search_documents(qs, "").count() == 2
+
+    # the parser keeps the numbers with slashes and dots as single words
+    invoice = DocumentFactory(document_number="INV/2020/001", consignment_ref_doc_number="CO.2020.15")
+    assert list(search_documents(qs, "INV/2020/001")) == [invoice]
+    assert list(search_documents(qs, "inv/2020")) == [invoice]
+    assert list(search_documents(qs, "CO.2020.15")) == [invoice]
+    assert list(search_documents(qs, "co.2020.15. inv")) == [invoice]
+    assert not search_documents(qs, "INV/2020/002").exists()
+    invoice.delete()
+
+    Document.objects.filter(pk=beef.pk).update(search_field="Wine Wine Wine")
+    assert list(search_documents(qs, "wine")) == [beef, wine]
+    # the search field is filled again for all documents
+    call_command("rebuild_document_search", chunk_size=1, stdout=io.StringIO())
+    assert list(search_documents(qs, "wine")) == [wine]
+
+
+@pytest.mark.django_db
+def test_search_documents_views(docapi_env, client):
+    from rest_framework.test import APIClient
+
+    wine = DocumentFactory(document_number="AU-12345", importer_name="Singapore Wine Imports")
+    DocumentFactory(document_number="AU-67890", importer_name="Beef Traders")
+
+    client.force_login(docapi_env["u1"])
+    resp = client.get(reverse("documents:list"), {"q": "wine"})
+    assert resp.status_code == 200
+    assert [doc.pk for doc in resp.context["object_list"]] == [wine.pk]
+
+    api = APIClient()
+    api.credentials(HTTP_AUTHORIZATION=f'Token {docapi_env["t1"].access_token}')
+    resp = api.get("/api/documents/v0/CertificatesOfOrigin/", {"q": "AU-123"})
+    assert resp.status_code == 200
+    assert [doc["id"] for doc in resp.json()["results"]] == [str(wine.pk)]
+
+    invoice = DocumentFactory(document_number="INV/2020/001")
+    resp = client.get(reverse("documents:list"), {"q": "INV/2020/001"})
+    assert [doc.pk for doc in resp.context["object_list"]] == [invoice.pk]
+    resp = api.get("/api/documents/v0/CertificatesOfOrigin/", {"q": "INV/2020/001"})
+    assert [doc["id"] for doc in resp.json()["results"]] == [str(invoice.pk)]
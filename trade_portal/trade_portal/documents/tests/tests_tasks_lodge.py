@@ -0,0 +1,144 @@
+import os
+from unittest import mock
+
+import pytest
+from django.core.files.base import ContentFile
+
+from trade_portal.documents.models import Document, DocumentFile
+from trade_portal.documents.tasks import issue_document_batch, lodge_document
+from trade_portal.documents.tests.factories import DocumentFactory
+
+
+@pytest.mark.django_db
+@mock.patch("trade_portal.documents.services.lodge.DocumentService.send_igl_message")
+@mock.patch("trade_portal.documents.services.lodge.DocumentService.notarize")
+@mock.patch("trade_portal.documents.services.lodge.DocumentService.encrypt")
+@mock.patch("trade_portal.documents.services.lodge.DocumentService.wrap")
+@mock.patch("trade_portal.documents.services.watermark.DocumentWatermarkService.watermark_document")
+def test_lodge_document_pipeline(watermark_mock, wrap_mock, encrypt_mock, notarize_mock, igl_mock, docapi_env):
+    doc = DocumentFactory()
+    wrap_mock.return_value = "{}"
+    encrypt_mock.side_effect = [Exception("Temporary failure")] * 4 + [None]
+
+    lodge_document(doc.pk)
+
+    # the encrypt stage has failed all retries, so the process stops there
+    doc.refresh_from_db()
+    assert doc.lodge_stage == Document.LODGE_STAGE_ENCRYPT
+    assert (watermark_mock.call_count, wrap_mock.call_count, encrypt_mock.call_count) == (1, 1, 4)
+    assert notarize_mock.call_count == 0
+    assert doc.history.filter(is_error=True, message__contains="encrypt").exists()
+
+    # and is resumed from the failed stage only
+    lodge_document(doc.pk)
+
+    doc.refresh_from_db()
+    assert doc.lodge_stage == Document.LODGE_STAGE_DONE
+    assert (watermark_mock.call_count, wrap_mock.call_count, encrypt_mock.call_count) == (1, 1, 5)
+    assert notarize_mock.call_count == 1
+    assert igl_mock.call_count == 1
+
+
+@pytest.mark.django_db
+@mock.patch("trade_portal.documents.services.lodge.DocumentService.encrypt")
+@mock.patch("trade_portal.documents.services.lodge.DocumentService.wrap")
+@mock.patch("trade_portal.documents.services.watermark.DocumentWatermarkService.watermark_document")
+def test_lodge_document_wrap_failed(watermark_mock, wrap_mock, encrypt_mock, docapi_env):
+    doc = DocumentFactory()
+    wrap_mock.return_value = None  # the service has marked the document failed
+
+    lodge_document(doc.pk)
+
+    doc.refresh_from_db()
+    assert doc.lodge_stage == Document.LODGE_STAGE_WRAP
+    assert wrap_mock.call_count == 1
+    assert encrypt_mock.call_count == 0
+
+
+@pytest.mark.django_db
+@mock.patch("trade_portal.documents.services.lodge.DocumentService.wrap")
+def test_lodge_document_encrypted_pdf(wrap_mock, docapi_env):
+    doc = DocumentFactory()
+    path = os.path.join(
+        os.path.dirname(__file__), "..", "..", "oa_verify", "tests", "assets", "protected-from-update-with-qr.pdf"
+    )
+    with open(path, "rb") as f:
+        DocumentFile.objects.create(doc=doc, file=ContentFile(f.read(), name="document.pdf"), filename="document.pdf")
+
+    lodge_document(doc.pk)
+
+    doc.refresh_from_db()
+    assert doc.status == Document.STATUS_FAILED
+    assert doc.verification_status == Document.V_STATUS_FAILED
+    assert doc.lodge_stage == Document.LODGE_STAGE_WATERMARK
+    assert doc.files.get().is_watermarked is None
+    assert doc.history.filter(is_error=True, message__contains="encrypted PDF").exists()
+    assert wrap_mock.call_count == 0
+
+
+@pytest.mark.django_db
+@mock.patch("trade_portal.documents.services.lodge.DocumentService.send_igl_message")
+@mock.patch("trade_portal.documents.services.lodge.DocumentService.issue_batch")
+@mock.patch("trade_portal.documents.services.watermark.DocumentWatermarkService.watermark_document")
+def test_lodge_document_batch(watermark_mock, issue_batch_mock, igl_mock, docapi_env, settings):
+    settings.OA_BATCH_ISSUE_SIZE = 2
+    docs = [DocumentFactory() for i in range(2)]
+
+    lodge_document(docs[0].pk)
+
+    # waits for the batch, the process is not finished yet
+    docs[0].refresh_from_db()
+    assert docs[0].lodge_stage == Document.LODGE_STAGE_BATCH
+    assert docs[0].oa.issue_queued_at
+    assert not docs[0].history.filter(message__contains="process is finished").exists()
+
+    # the batch has failed all retries
+    issue_batch_mock.side_effect = Exception("Notary is unavailable")
+    issue_document_batch.apply()
+    assert issue_batch_mock.call_count == 4
+    docs[0].refresh_from_db()
+    assert docs[0].lodge_stage == Document.LODGE_STAGE_BATCH
+    assert (docs[0].status, docs[0].verification_status) == (Document.STATUS_FAILED, Document.V_STATUS_FAILED)
+    assert docs[0].history.filter(is_error=True, message__contains="batch stage").exists()
+
+    # and is issued when resumed, along with the next document filling the batch
+    issue_batch_mock.side_effect = lambda documents: documents
+    lodge_document(docs[0].pk)
+    lodge_document(docs[1].pk)
+    assert [d.pk for d in issue_batch_mock.call_args[0][0]] == [d.pk for d in docs]
+    for doc in docs:
+        doc.refresh_from_db()
+        assert doc.lodge_stage == Document.LODGE_STAGE_DONE
+        assert doc.history.filter(message__contains="process is finished").exists()
+    assert igl_mock.call_count == 2
+
+
+@pytest.mark.django_db
+@mock.patch("trade_portal.documents.services.lodge.DocumentService.send_igl_message")
+@mock.patch("trade_portal.documents.services.lodge.DocumentService.issue_batch")
+@mock.patch("trade_portal.documents.services.watermark.DocumentWatermarkService.watermark_document")
+def test_lodge_document_batch_igl_failed(watermark_mock, issue_batch_mock, igl_mock, docapi_env, settings):
+    settings.OA_BATCH_ISSUE_SIZE = 2
+    docs = [DocumentFactory() for i in range(2)]
+    issue_batch_mock.side_effect = lambda documents: documents
+    igl_mock.side_effect = [None] + [Exception("IGL is unavailable")] * 6 + [None]
+
+    lodge_document(docs[0].pk)
+    lodge_document(docs[1].pk)
+
+    # the second message has failed all retries, the batch isn't issued again
+    # and the first message isn't sent again
+    assert issue_batch_mock.call_count == 1
+    assert [call[0][0].pk for call in igl_mock.call_args_list] == [docs[0].pk] + [docs[1].pk] * 6
+    for doc in docs:
+        doc.refresh_from_db()
+    assert docs[0].lodge_stage == Document.LODGE_STAGE_DONE
+    assert docs[1].lodge_stage == Document.LODGE_STAGE_IGL
+    assert docs[1].history.filter(is_error=True, message__contains="igl stage").exists()
+
+    # resumed from the IGL stage only
+    lodge_document(docs[1].pk)
+    docs[1].refresh_from_db()
+    assert docs[1].lodge_stage == Document.LODGE_STAGE_DONE
+    assert issue_batch_mock.call_count == 1
+    assert igl_mock.call_count == 8
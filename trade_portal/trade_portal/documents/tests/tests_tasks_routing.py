@@ -0,0 +1,53 @@
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from config import celery_app
+from config.celery_app import on_task_prerun, on_task_publish
+
+
+@pytest.mark.parametrize("task_name,queue", [
+    ("trade_portal.documents.tasks.fill_document_metadata", "cpu-pdf"),
+    ("trade_portal.documents.tasks.lodge_watermark_stage", "lodge-watermark"),
+    ("trade_portal.documents.tasks.lodge_igl_stage", "lodge-igl"),
+    ("trade_portal.documents.tasks.update_message_by_sender_ref", "network-igl"),
+    ("trade_portal.websub_receiver.tasks.subscribe_to_new_messages", "network-igl"),
+    ("trade_portal.documents.tasks.document_oa_verify", "verification"),
+    ("trade_portal.oa_verify.tasks.verify_job", "verification"),
+    ("trade_portal.users.tasks.notify_role_requested", "notifications"),
+    ("trade_portal.documents.tasks.canary_task", "canary"),
+    ("trade_portal.monitoring.tasks.resolve_geoloc_ip", "celery"),
+])
+def test_task_routes(task_name, queue):
+    route = celery_app.amqp.router.route({}, task_name)
+    assert route["queue"].name == queue
+
+
+@mock.patch("trade_portal.utils.monitoring.statsd_timing")
+def test_task_latency_by_queue(timing_mock):
+    headers = {}
+    on_task_publish(headers=headers)
+    assert time.time() - headers["published_at"] < 1
+
+    request = SimpleNamespace(
+        published_at=headers["published_at"] - 5,
+        headers=None,
+        delivery_info={"routing_key": "cpu-pdf"},
+        eta=None,
+    )
+    on_task_prerun(task=SimpleNamespace(request=request))
+    name, seconds = timing_mock.call_args[0]
+    assert name == "celery.latency.cpu-pdf"
+    assert 5 <= seconds < 6
+
+    # the countdown is not the waiting
+    timing_mock.reset_mock()
+    request.eta = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(headers["published_at"] - 1))
+    on_task_prerun(task=SimpleNamespace(request=request))
+    assert 1 <= timing_mock.call_args[0][1] < 2
+
+    timing_mock.reset_mock()
+    on_task_prerun(task=SimpleNamespace(request=SimpleNamespace(published_at=None, headers={}, eta=None)))
+    assert timing_mock.call_count == 0
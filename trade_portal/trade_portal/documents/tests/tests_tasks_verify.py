@@ -0,0 +1,209 @@
+import datetime
+import json
+from unittest import mock
+
+import pytest
+from django.core.files.base import ContentFile
+from django.utils import timezone
+
+from trade_portal.documents.models import Document
+from trade_portal.documents.services.lodge import DocumentService
+from trade_portal.documents.services.notarize import NotaryService
+from trade_portal.documents.tasks import (
+    consume_oa_issued_events,
+    document_oa_verify,
+    verify_pending_documents,
+)
+from trade_portal.documents.tests.factories import DocumentFactory
+
+NOT_ISSUED = {
+    "status": "invalid",
+    "verify_result": [
+        {"type": "DOCUMENT_INTEGRITY", "name": "OpenAttestationHash", "status": "VALID"},
+        {"type": "DOCUMENT_STATUS", "name": "OpenAttestationEthereumDocumentStoreStatus", "status": "INVALID"},
+    ],
+    "verify_result_rotated": {},
+}
+ISSUED = {
+    "status": "valid",
+    "verify_result": [
+        {"type": "DOCUMENT_INTEGRITY", "name": "OpenAttestationHash", "status": "VALID"},
+        {"type": "DOCUMENT_STATUS", "name": "OpenAttestationEthereumDocumentStoreStatus", "status": "VALID"},
+    ],
+    "verify_result_rotated": {},
+}
+
+
+def _issued_document(merkle_root):
+    doc = DocumentFactory()
+    doc.oa.oa_file = ContentFile(b'{"data": {}}', name="oa-doc-wrapped.json")
+    doc.oa.merkle_root = merkle_root
+    doc.oa.save()
+    return doc
+
+
+@pytest.mark.django_db
+@mock.patch("trade_portal.oa_verify.services.OaVerificationService.verify_json_tt_document")
+def test_pending_documents_sweep(verify_mock, docapi_env, settings):
+    batch = [_issued_document("a" * 64) for i in range(3)]
+    single = _issued_document("b" * 64)
+
+    # being issued (wrapped but not notarized) documents are not verified yet
+    Document.objects.filter(pk__in=[d.pk for d in batch]).update(verification_status=Document.V_STATUS_PENDING)
+    verify_pending_documents()
+    assert verify_mock.call_count == 0
+
+    # not notarized yet: left pending, no retries scheduled
+    verify_mock.return_value = NOT_ISSUED
+    for doc in batch + [single]:
+        document_oa_verify(doc.pk)
+    assert verify_mock.call_count == 4
+    assert Document.objects.filter(verification_status=Document.V_STATUS_PENDING).count() == 4
+
+    # a single verification per merkle root while it's not issued
+    verify_mock.reset_mock()
+    verify_pending_documents()
+    assert verify_mock.call_count == 2
+    assert Document.objects.filter(verification_status=Document.V_STATUS_PENDING).count() == 4
+
+    # the rest of the batch is verified once the root is issued
+    verify_mock.reset_mock()
+    verify_mock.return_value = ISSUED
+    verify_pending_documents()
+    assert verify_mock.call_count == 4
+    assert Document.objects.filter(verification_status=Document.V_STATUS_VALID).count() == 4
+    verify_mock.reset_mock()
+    verify_pending_documents()
+    assert verify_mock.call_count == 0
+
+    # nothing is changed while the verifier is down
+    doc = _issued_document("c" * 64)
+    verify_mock.return_value = {"status": "error", "verifier_unavailable": True}
+    document_oa_verify(doc.pk)
+    verify_pending_documents()
+    doc.refresh_from_db()
+    assert doc.verification_status == Document.V_STATUS_PENDING
+
+    # and the ones pending for too long are given up
+    Document.objects.filter(pk=doc.pk).update(
+        verification_started_at=timezone.now() - datetime.timedelta(seconds=settings.OA_VERIFY_PENDING_MAX_SECONDS + 1)
+    )
+    verify_mock.reset_mock()
+    verify_pending_documents()
+    assert verify_mock.call_count == 0
+    doc.refresh_from_db()
+    assert doc.verification_status == Document.V_STATUS_FAILED
+    assert doc.history.filter(is_error=True, message__contains="Unable to verify the document after").exists()
+
+
+@pytest.mark.django_db
+@mock.patch("trade_portal.oa_verify.services.OaVerificationService.invalidate_cached_result")
+@mock.patch("boto3.resource")
+def test_issued_events(boto_mock, invalidate_mock, docapi_env, settings):
+    settings.OA_ISSUED_EVENTS_QUEUE_URL = "http://localstack:10001/queue/issued-events"
+    batch = [_issued_document("a" * 64) for i in range(2)]
+    other = _issued_document("b" * 64)
+    Document.objects.update(verification_status=Document.V_STATUS_PENDING)
+
+    message = mock.MagicMock(body=json.dumps({
+        "type": "issued",
+        "merkleRoot": "a" * 64,
+        "transactionHash": "0x1234",
+        "blockNumber": 15,
+        "keys": ["2020-01-01/x.json", "2020-01-01/y.json"],
+    }))
+    invalid_message = mock.MagicMock(body="not json")
+    queue = boto_mock.return_value.Queue.return_value
+    queue.receive_messages.side_effect = [[message, invalid_message], []]
+
+    consume_oa_issued_events()
+
+    assert [c[1]["WaitTimeSeconds"] for c in queue.receive_messages.call_args_list] == [18, 0]
+    assert message.delete.call_count == 1
+    assert invalid_message.delete.call_count == 1
+    invalidate_mock.assert_called_once_with("a" * 64)
+    for doc in batch:
+        doc.refresh_from_db()
+        assert doc.verification_status == Document.V_STATUS_VALID
+        assert doc.history.filter(message__contains="issued", object_body__contains="0x1234").exists()
+    other.refresh_from_db()
+    assert other.verification_status == Document.V_STATUS_PENDING
+
+    # the failed event is left in the queue and the next ones are still handled
+    next_message = mock.MagicMock(body=json.dumps({"type": "issued", "merkleRoot": "b" * 64}))
+    queue.receive_messages.side_effect = [[message, next_message], []]
+    message.reset_mock()
+    with mock.patch(
+        "trade_portal.documents.tasks.Document.objects.filter",
+        side_effect=[Exception("DB is down"), Document.objects.none()],
+    ):
+        consume_oa_issued_events()
+    assert message.delete.call_count == 0
+    assert next_message.delete.call_count == 1
+
+
+@mock.patch("boto3.resource")
+def test_issued_events_bounded(boto_mock, settings):
+    settings.OA_ISSUED_EVENTS_QUEUE_URL = "http://localstack:10001/queue/issued-events"
+    queue = boto_mock.return_value.Queue.return_value
+    # the queue is never empty
+    queue.receive_messages.side_effect = lambda **kwargs: [
+        mock.MagicMock(body=json.dumps({"type": "issued"})) for i in range(kwargs["MaxNumberOfMessages"])
+    ]
+    handler = mock.MagicMock()
+
+    assert NotaryService().consume_issued_events(handler, max_messages=25) == 25
+    assert [c[1]["MaxNumberOfMessages"] for c in queue.receive_messages.call_args_list] == [10, 10, 5]
+
+    # and it's left for the next call when the time is over
+    queue.receive_messages.reset_mock()
+    with mock.patch("trade_portal.documents.services.notarize.time.monotonic", side_effect=[0, 0, 11]):
+        assert NotaryService().consume_issued_events(handler, time_budget=10) == 10
+    assert queue.receive_messages.call_count == 1
+
+
+@pytest.mark.django_db
+@mock.patch("trade_portal.documents.tasks.document_oa_verify.apply_async")
+@mock.patch("trade_portal.oa_verify.services.OaVerificationService.verify_json_tt_document")
+def test_pending_documents_sweep_verifier_unavailable(verify_mock, apply_mock, docapi_env, settings):
+    notarized = _issued_document("a" * 64)
+    pending = _issued_document("b" * 64)
+    Document.objects.update(verification_status=Document.V_STATUS_PENDING)
+
+    # the sweeper takes the document once it's notarized, whatever happens to its first verification
+    DocumentService()._handle_notarize_result(notarized, True)
+    assert apply_mock.call_count == 1
+    verify_pending_documents()
+    assert verify_mock.call_count == 1
+
+    # and when its first verification has found the verifier unavailable
+    verify_mock.return_value = {"status": "error", "verifier_unavailable": True}
+    document_oa_verify(pending.pk)
+    pending.refresh_from_db()
+    assert pending.verification_status == Document.V_STATUS_PENDING
+    assert pending.verification_started_at
+
+    Document.objects.update(
+        verification_started_at=timezone.now() - datetime.timedelta(seconds=settings.OA_VERIFY_PENDING_MAX_SECONDS + 1)
+    )
+    verify_pending_documents()
+    assert Document.objects.filter(verification_status=Document.V_STATUS_FAILED).count() == 2
+
+
+@pytest.mark.django_db
+@mock.patch("trade_portal.oa_verify.services.OaVerificationService.verify_json_tt_document")
+def test_pending_documents_sweep_error(verify_mock, docapi_env):
+    broken = _issued_document("a" * 64)
+    other = _issued_document("b" * 64)
+    Document.objects.update(verification_status=Document.V_STATUS_PENDING, verification_started_at=timezone.now())
+    Document.objects.filter(pk=other.pk).update(verification_checked_at=timezone.now())
+
+    # the document failing its verification (the least recently checked) doesn't stop the others
+    verify_mock.side_effect = [ValueError("Broken document"), ISSUED]
+    verify_pending_documents()
+    assert verify_mock.call_count == 2
+    other.refresh_from_db()
+    assert other.verification_status == Document.V_STATUS_VALID
+    broken.refresh_from_db()
+    assert broken.verification_status == Document.V_STATUS_PENDING
+    assert broken.verification_checked_at
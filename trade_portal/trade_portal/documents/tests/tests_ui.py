@@ -124,3 +124,23 @@ def test_document_file_download_view(normal_user, ftas):
     with open('/app/trade_portal/documents/tests/assets/A5.pdf', 'rb') as fp:
         # exactly the same file it returns
         assert fp.read() == nr.content
+
+
+@pytest.mark.django_db
+def test_documents_list_approximate_count(docapi_env, client, settings):
+    from trade_portal.documents.tests.factories import DocumentFactory
+
+    for i in range(3):
+        DocumentFactory()
+    client.force_login(docapi_env["u1"])
+
+    settings.APPROXIMATE_COUNT_FROM = 0
+    resp = client.get(reverse("documents:list"))
+    assert resp.context["table"].paginator.count == 3
+    assert not resp.context["table"].paginator.approximate
+
+    # the estimate, whatever it is for the tiny table
+    settings.APPROXIMATE_COUNT_FROM = 1
+    resp = client.get(reverse("documents:list"))
+    assert resp.context["table"].paginator.approximate
+    assert b"About " in resp.content
@@ -0,0 +1,74 @@
+import base64
+import json
+import os
+
+from django.core.files.base import ContentFile, File
+
+from trade_portal.documents.services import oa_wrap
+from trade_portal.utils.jsonstream import Base64File, JsonReader, iter_json, json_size
+
+
+def _documents(size):
+    content = os.urandom(size)
+    lazy = {
+        "name": "Привет", "list": [1, 2.5, None, True, {}],
+        "attachedFile": {"file": Base64File(ContentFile(content)), "mimeCode": "application/pdf"},
+    }
+    plain = dict(lazy, attachedFile={"file": base64.b64encode(content).decode("utf-8"), "mimeCode": "application/pdf"})
+    return lazy, plain
+
+
+def test_iter_json():
+    # sizes around the chunk border and the base64 padding
+    for size in (0, 1, 2, 3, 3 * 256 * 1024 - 1, 3 * 256 * 1024 + 1):
+        lazy, plain = _documents(size)
+        expected = json.dumps(plain)
+        assert "".join(iter_json(lazy)) == expected
+        assert json_size(lazy) == len(expected)
+
+
+def test_json_reader():
+    lazy, plain = _documents(100000)
+    expected = json.dumps(plain).encode("utf-8")
+
+    reader = JsonReader(lazy)
+    assert len(reader) == len(expected)
+    parts = []
+    while True:
+        part = reader.read(1000)
+        if not part:
+            break
+        parts.append(part)
+    assert b"".join(parts) == expected
+    assert reader.tell() == len(expected)
+
+    # may be read again, as storages do
+    reader.seek(0)
+    assert reader.read() == expected
+
+
+def test_native_wrap_of_lazy_attachment():
+    lazy, plain = _documents(1000)
+    wrapped = oa_wrap.wrap_document(lazy)
+    assert wrapped["data"]["attachedFile"]["file"].endswith(
+        ":string:" + plain["attachedFile"]["file"]
+    )
+    assert oa_wrap.digest_document(wrapped) == wrapped["signature"]["targetHash"]
+
+
+def test_base64_file_is_closed(tmp_path):
+    path = tmp_path / "attachment.pdf"
+    path.write_bytes(b"%PDF-1.4 content")
+    lazy = Base64File(File(open(path, "rb"), name=str(path)))
+
+    assert lazy.read_base64() == base64.b64encode(b"%PDF-1.4 content").decode("ascii")
+    assert lazy.file.closed
+    # reopened for the next write
+    assert lazy.read_base64() == base64.b64encode(b"%PDF-1.4 content").decode("ascii")
+    assert lazy.file.closed
+
+    # and when the reader stops in the middle
+    parts = lazy.iter_base64(chunk_size=3)
+    next(parts)
+    parts.close()
+    assert lazy.file.closed
@@ -0,0 +1,118 @@
+import base64
+import importlib
+import json
+from unittest import mock
+
+import pytest
+from django.apps import apps
+from django.test import Client
+from django.urls import reverse
+
+from trade_portal.documents.models import OaDetails
+from trade_portal.documents.services.encryption import AESCipher
+from trade_portal.documents.views.oa import _s3_object, parse_byte_range
+
+CLEARTEXT = '{"data": "some wrapped document"}'
+
+
+def _encrypted_oa(org):
+    oa = OaDetails.retrieve_new(for_org=org)
+    oa.save_ciphertext(*AESCipher(oa.key).encrypt_with_params_separate(CLEARTEXT))
+    return oa
+
+
+def test_parse_byte_range():
+    assert parse_byte_range("", 100) is None
+    assert parse_byte_range("bytes=0-9", 100) == (0, 9)
+    assert parse_byte_range("bytes=90-", 100) == (90, 99)
+    assert parse_byte_range("bytes=90-200", 100) == (90, 99)
+    assert parse_byte_range("bytes=-10", 100) == (90, 99)
+    assert parse_byte_range("bytes=0-1,5-6", 100) is None
+    with pytest.raises(ValueError):
+        parse_byte_range("bytes=100-", 100)
+
+
+def test_s3_object_key():
+    storage = mock.Mock(location="media")
+    with mock.patch("trade_portal.documents.views.oa.default_storage", storage):
+        _s3_object("oa/1/ciphertext.json")
+        storage.bucket.Object.assert_called_once_with("media/oa/1/ciphertext.json")
+        storage.location = ""
+        _s3_object("oa/1/ciphertext.json")
+        storage.bucket.Object.assert_called_with("oa/1/ciphertext.json")
+
+
+@pytest.mark.django_db
+def test_oa_ciphertext_retrieve(docapi_env, settings):
+    settings.OA_CIPHERTEXT_REDIRECT = False
+    oa = _encrypted_oa(docapi_env["u1"].direct_orgs[0])
+    assert oa.ciphertext == ""
+    assert oa.ciphertext_file.name == f"oa/{oa.id}/ciphertext.json"
+    url = reverse("oa-cyphertext-retrieve", kwargs={"key": oa.id})
+    client = Client()
+
+    resp = client.get(url)
+    assert resp.status_code == 200
+    body = b"".join(resp.streaming_content)
+    assert int(resp["Content-Length"]) == len(body)
+    document = json.loads(body)["document"]
+    assert document["iv"] == oa.iv_base64
+    assert document["cipherText"] == oa.get_ciphertext()
+    assert resp["ETag"] == oa.ciphertext_etag
+    assert resp["Cache-Control"] == "public, no-cache"
+    assert resp["Access-Control-Allow-Origin"] == "*"
+
+    resp = client.get(url, HTTP_IF_NONE_MATCH=oa.ciphertext_etag)
+    assert resp.status_code == 304
+
+    resp = client.get(url, HTTP_RANGE="bytes=0-9")
+    assert resp.status_code == 206
+    assert b"".join(resp.streaming_content) == body[:10]
+    assert resp["Content-Range"] == f"bytes 0-9/{len(body)}"
+
+    resp = client.get(url, HTTP_RANGE=f"bytes={len(body)}-")
+    assert resp.status_code == 416
+
+    resp = client.get(url, {"key": oa.key})
+    # the encrypted content is base64-encoded document
+    assert base64.b64decode(json.loads(resp.content)["document"]["cleartext"]).decode("utf-8") == CLEARTEXT
+
+    settings.OA_CIPHERTEXT_REDIRECT = True
+    resp = client.get(url)
+    assert resp.status_code == 302
+    assert f"oa/{oa.id}/ciphertext.json" in resp.url
+
+    assert client.get(reverse("oa-cyphertext-retrieve", kwargs={"key": "unknown"})).status_code == 404
+
+
+@pytest.mark.django_db
+def test_oa_ciphertext_retrieve_not_encrypted(docapi_env):
+    oa = OaDetails.retrieve_new(for_org=docapi_env["u1"].direct_orgs[0])
+    resp = Client().get(reverse("oa-cyphertext-retrieve", kwargs={"key": oa.id}))
+    assert resp.status_code == 200
+    assert resp["Cache-Control"] == "no-store"
+
+
+@pytest.mark.django_db
+def test_oa_ciphertext_migration(docapi_env):
+    migration = importlib.import_module(
+        "trade_portal.documents.migrations.0041_move_ciphertext_to_storage"
+    )
+    oa = OaDetails.retrieve_new(for_org=docapi_env["u1"].direct_orgs[0])
+    oa.iv_base64, oa.tag_base64, oa.ciphertext = AESCipher(oa.key).encrypt_with_params_separate(CLEARTEXT)
+    oa.save()
+    ciphertext = oa.ciphertext
+
+    # legacy rows are served from the database until moved
+    resp = Client().get(reverse("oa-cyphertext-retrieve", kwargs={"key": oa.id}))
+    assert json.loads(resp.content)["document"]["cipherText"] == ciphertext
+
+    migration.move_ciphertext_to_storage(apps, None)
+    oa.refresh_from_db()
+    assert oa.ciphertext == ""
+    assert oa.get_ciphertext() == ciphertext
+
+    migration.move_ciphertext_to_database(apps, None)
+    oa.refresh_from_db()
+    assert oa.ciphertext == ciphertext
+    assert not oa.ciphertext_file
@@ -4,6 +4,7 @@ import dateutil.parser
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin as Login, AccessMixin
 from django.core.exceptions import ObjectDoesNotExist
+from django.core.files.storage import default_storage
 from django.db.models import Q
 from django.http import HttpResponse, Http404
 from django.shortcuts import redirect
@@ -14,6 +15,7 @@ from django.views.generic import (
 )
 from django_tables2 import SingleTableView
 from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.utils.translation import gettext as _
 from django.utils.text import slugify
 from PyPDF2.utils import PdfReadError
@@ -22,42 +24,25 @@ from trade_portal.documents.forms import (
     ConsignmentSectionUpdateForm,
 )
 from trade_portal.documents.models import Document, DocumentFile
+from trade_portal.documents.services.access import visible_documents
+from trade_portal.documents.services.search import search_documents
 from trade_portal.documents.services.watermark import DocumentFileImageService
 from trade_portal.documents.tables import DocumentsTable
 from trade_portal.documents.tasks import document_oa_verify
 from trade_portal.monitoring.models import VerificationAttempt
+from trade_portal.utils.dates import date_range_filter
 from trade_portal.utils.monitoring import statsd_timer
+from trade_portal.utils.pagination import ApproximateCountPaginator
 
 logger = logging.getLogger(__name__)
 
+PREVIEW_CACHE_SECONDS = 60
+
 
 class DocumentQuerysetMixin(AccessMixin):
     def get_queryset(self):
-        qs = Document.objects.all()
         user = self.request.user
-        current_org = user.get_current_org(self.request.session)
-        if current_org and current_org.is_regulator:
-            # regulator can see everything
-            pass
-        elif current_org and current_org.is_chambers:
-            # chambers can see only their own documents
-            qs = qs.filter(created_by_org=current_org)
-        elif current_org and current_org.is_trader:
-            qs = (
-                qs.filter(
-                    importer_name__in=(
-                        current_org.name,
-                        current_org.business_id,
-                    )
-                )
-                | qs.filter(
-                    exporter__clear_business_id=current_org.business_id
-                ).exclude(exporter__clear_business_id="")
-                | qs.filter(exporter__name=current_org.name).exclude(exporter__name="")
-            )
-        else:
-            qs = Document.objects.none()
-
+        qs = visible_documents(Document.objects.all(), user.get_current_org(self.request.session))
         qs = qs.select_related("issuer", "exporter")
         return qs
 
@@ -84,6 +69,7 @@ class DocumentListView(Login, DocumentQuerysetMixin, SingleTableView, ListView):
     table_class = DocumentsTable
     table_pagination = {
         "per_page": 25,
+        "paginator_class": ApproximateCountPaginator,
     }
 
     @statsd_timer("view.DocumentListView.dispatch")
@@ -125,15 +111,17 @@ class DocumentListView(Login, DocumentQuerysetMixin, SingleTableView, ListView):
         except ValueError:
             created_before = None
 
-        if created_after:
-            qs = qs.filter(created_at__date__gte=created_after.date())
-        if created_before:
-            qs = qs.filter(created_at__date__lte=created_before.date())
+        qs = qs.filter(**date_range_filter(
+            "created_at",
+            after=created_after.date() if created_after else None,
+            before=created_before.date() if created_before else None,
+        ))
 
-        # filter by the free-text search field
+        # filter by the free-text search field, the best matches first
+        # (unless the table is sorted by some column)
         q = self.request.GET.get("q", "").strip() or None
         if q:
-            qs = qs.filter(search_field__icontains=q)
+            qs = search_documents(qs, q)
         return qs
 
     def get_context_data(self, *args, **kwargs):
@@ -175,7 +163,7 @@ class DocumentDetailView(Login, DocumentQuerysetMixin, DetailView):
         obj = self.get_object()
         if "refresh_oa_status" in request.POST:
             try:
-                document_oa_verify(obj.pk, do_retries=False)
+                document_oa_verify(obj.pk)
             except Exception as e:
                 logger.exception(e)
             messages.success(request, "The OA credential verification has been initiated")
@@ -249,12 +237,14 @@ class DocumentFileDownloadView(Login, DocumentQuerysetMixin, DetailView):
                 the_file = document.original_file
             else:
                 the_file = document.file
+            if not the_file:
+                # e.g. the original copy is not set for this file, nothing to serve
+                raise Http404()
 
             if self.request.GET.get("as_png"):
                 try:
-                    response = HttpResponse(
-                        DocumentFileImageService().get_first_page_as_png(the_file),
-                        content_type="image/png",
+                    response = self._png_preview_response(
+                        document, original=bool(self.request.GET.get("original"))
                     )
                 except PdfReadError as e:
                     # some PDF issue
@@ -294,6 +284,19 @@ class DocumentFileDownloadView(Login, DocumentQuerysetMixin, DetailView):
             raise Exception("Unkown document type")
         return response
 
+    def _png_preview_response(self, docfile, original=False):
+        preview = DocumentFileImageService().get_preview(docfile, original=original)
+        etag = f'"{preview["etag"]}"'
+        response = get_conditional_response(self.request, etag=etag)
+        if response is None:
+            with default_storage.open(preview["file"], "rb") as png_file:
+                response = HttpResponse(png_file.read(), content_type="image/png")
+        response["ETag"] = etag
+        # the same url may return other image when the file is changed (watermarked),
+        # so it's revalidated often, but that's cheap
+        patch_cache_control(response, private=True, max_age=PREVIEW_CACHE_SECONDS)
+        return response
+
 
 class DocumentHistoryFileDownloadView(Login, DocumentQuerysetMixin, DetailView):
     def get_object(self):
@@ -1,10 +1,94 @@
 import json
+import posixpath
+import re
 
-from django.http import HttpResponse, Http404
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import (
+    HttpResponse, Http404, HttpResponseRedirect, StreamingHttpResponse,
+)
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.views.generic import View
 
 from trade_portal.documents.models import OaDetails
 
+STREAM_CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_byte_range(header, size):
+    """
+    Returns (start, end) of the single byte range requested, both inclusive,
+    or None if there is no range (or it's not something we support, like multiple
+    ranges) so the whole file should be returned.
+    Raises ValueError if the range can't be satisfied
+    """
+    match = RANGE_RE.match(header or "")
+    if not match or match.groups() == ("", ""):
+        return None
+    start, end = match.groups()
+    if not start:
+        # the last N bytes
+        if not int(end):
+            raise ValueError("Empty suffix range")
+        return max(size - int(end), 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size:
+        raise ValueError("Range start is beyond the end of file")
+    if end < start:
+        return None
+    return start, end
+
+
+def _s3_object(name):
+    # S3-based storages (our case everywhere) allow to read the object by chunks
+    # without downloading it first, and support ranges natively
+    bucket = getattr(default_storage, "bucket", None)
+    if bucket is None:
+        return None
+    # names saved by the storage are relative to its location (AWS_LOCATION)
+    return bucket.Object(posixpath.join(default_storage.location, name))
+
+
+def open_storage_stream(name, byte_range=None):
+    """
+    Returns (iterator of the file content chunks, content length)
+    Opens the file immediately so missing file errors are raised here, not while streaming
+    """
+    s3_object = _s3_object(name)
+    if s3_object is not None:
+        params = {"Range": "bytes={}-{}".format(*byte_range)} if byte_range else {}
+        resp = s3_object.get(**params)
+        return resp["Body"].iter_chunks(STREAM_CHUNK_SIZE), resp["ContentLength"]
+
+    f = default_storage.open(name, "rb")
+    start, end = byte_range or (0, f.size - 1)
+    f.seek(start)
+
+    def _iter_file(remaining):
+        try:
+            while remaining > 0:
+                chunk = f.read(min(STREAM_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            f.close()
+    return _iter_file(end - start + 1), end - start + 1
+
+
+def presigned_url(name):
+    s3_object = _s3_object(name)
+    if s3_object is None:
+        return None
+    return s3_object.meta.client.generate_presigned_url(
+        "get_object",
+        Params={"Bucket": s3_object.bucket_name, "Key": s3_object.key},
+        ExpiresIn=settings.OA_CIPHERTEXT_REDIRECT_EXPIRY,
+    )
+
 
 class AllowCORSMixin(object):
     def add_access_control_headers(self, response):
@@ -20,34 +104,96 @@ class AllowCORSMixin(object):
 
 
 class OaCyphertextRetrieve(AllowCORSMixin, View):
+    """
+    The encrypted OA document the QR code points to. It's returned as it's saved
+    in the storage (see OaDetails.save_ciphertext), so it's streamed or the client
+    is redirected to the storage directly, without reading the content here.
+    """
+
     def get(self, *args, **kwargs):
         try:
-            obj = OaDetails.objects.get(id=self.kwargs["key"])
+            obj = OaDetails.objects.defer("ciphertext").get(id=self.kwargs["key"])
         except Exception:
             raise Http404()
 
-        result = {
-            "document": {
-                "cipherText": obj.ciphertext,
-                "iv": obj.iv_base64,  # "5O0HYHcYhTzB/Xmt",
-                "tag": obj.tag_base64,  # "Yo1q82WRHFQuKUSYHgnawQ==",
-                "type": "OPEN-ATTESTATION-TYPE-1",
-            }
-        }
-        # by default the ciphertext is base64-encoded
         if self.request.GET.get("key"):
-            from trade_portal.documents.services.encryption import AESCipher
+            response = self._cleartext_response(obj)
+        else:
+            response = get_conditional_response(self.request, etag=obj.ciphertext_etag)
+            if response is None:
+                response = self._ciphertext_response(obj)
+            response["ETag"] = obj.ciphertext_etag
+            if not response.has_header("Cache-Control"):
+                if obj.iv_base64:
+                    # changes when the document is encrypted again (relodged), so the caches
+                    # keep it but check the ETag every time
+                    patch_cache_control(response, public=True, no_cache=True)
+                else:
+                    # not encrypted yet
+                    patch_cache_control(response, no_store=True)
+        self.add_access_control_headers(response)
+        return response
+
+    def _ciphertext_response(self, obj):
+        if not obj.ciphertext_file:
+            # the row has not been moved to the storage yet
+            return HttpResponse(
+                json.dumps(
+                    obj.render_ciphertext_document(obj.iv_base64, obj.tag_base64, obj.ciphertext)
+                ),
+                content_type="application/json",
+            )
 
+        name = obj.ciphertext_file.name
+        if settings.OA_CIPHERTEXT_REDIRECT:
+            url = presigned_url(name)
+            if url:
+                response = HttpResponseRedirect(url)
+                # the presigned url expires, so it can't be cached for long
+                patch_cache_control(response, private=True, max_age=settings.OA_CIPHERTEXT_REDIRECT_EXPIRY // 2)
+                return response
+
+        byte_range = None
+        if self.request.META.get("HTTP_RANGE"):
+            try:
+                size = default_storage.size(name)
+            except Exception:
+                raise Http404()
             try:
-                cp = AESCipher(self.request.GET.get("key"))
-                result["document"]["cleartext"] = cp.decrypt(
-                    obj.iv_base64,
-                    obj.tag_base64,
-                    obj.ciphertext,
-                ).decode("utf-8")
-            except Exception as e:
-                result["document"]["cleartext_error"] = str(e)
+                byte_range = parse_byte_range(self.request.META["HTTP_RANGE"], size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response["Content-Range"] = f"bytes */{size}"
+                return response
+
+        try:
+            content, length = open_storage_stream(name, byte_range)
+        except Exception:
+            raise Http404()
+        response = StreamingHttpResponse(content, content_type="application/json")
+        response["Content-Length"] = str(length)
+        response["Accept-Ranges"] = "bytes"
+        if byte_range:
+            response.status_code = 206
+            response["Content-Range"] = "bytes {}-{}/{}".format(*byte_range, size)
+        return response
+
+    def _cleartext_response(self, obj):
+        from trade_portal.documents.services.encryption import AESCipher
+
+        ciphertext = obj.get_ciphertext()
+        result = obj.render_ciphertext_document(obj.iv_base64, obj.tag_base64, ciphertext)
+        # by default the ciphertext is base64-encoded
+        try:
+            cp = AESCipher(self.request.GET.get("key"))
+            result["document"]["cleartext"] = cp.decrypt(
+                obj.iv_base64,
+                obj.tag_base64,
+                ciphertext,
+            ).decode("utf-8")
+        except Exception as e:
+            result["document"]["cleartext_error"] = str(e)
 
         response = HttpResponse(json.dumps(result), content_type="application/json")
-        self.add_access_control_headers(response)
+        patch_cache_control(response, private=True, no_cache=True)
         return response
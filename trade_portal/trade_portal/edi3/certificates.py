@@ -15,7 +15,11 @@ logger = logging.getLogger(__name__)
 
 
 class Un20200831CoORenderer:
-    def render(self, doc):
+    def render(self, doc, lazy_attachments=False):
+        """
+        If lazy_attachments is set then the attached file is returned as Base64File
+        (see utils/jsonstream.py) and must be serialised by iter_json/JsonReader
+        """
         data = {
             "certificateOfOrigin": {
                 "id": doc.document_number,
@@ -193,7 +197,7 @@ class Un20200831CoORenderer:
         if pdf_attach:
             try:
                 data["certificateOfOrigin"]["attachedFile"] = {
-                    "file": base64.b64encode(pdf_attach.file.read()).decode("utf-8"),
+                    "file": self._render_attached_file(pdf_attach, lazy_attachments),
                     "encodingCode": "base64",
                     "mimeCode": pdf_attach.mimetype(),
                 }
@@ -201,3 +205,9 @@ class Un20200831CoORenderer:
                 logger.exception(e)
                 pass
         return data
+
+    def _render_attached_file(self, pdf_attach, lazy_attachments):
+        if lazy_attachments:
+            from trade_portal.utils.jsonstream import Base64File
+            return Base64File(pdf_attach.file)
+        return base64.b64encode(pdf_attach.file.read()).decode("utf-8")
@@ -0,0 +1,177 @@
+"""
+Verification jobs: the verification is done by the worker (consuming the "verification" queue)
+instead of the web request, which just saves what to verify and returns the job id
+for the page to wait for the result. Enabled by OA_VERIFY_ASYNC_JOBS.
+
+The job state is kept in the cache (for OA_VERIFY_JOB_SECONDS), uploaded files in the storage
+until they are verified; the task gets the file name as well, so the file is removed
+even if the job has expired before being processed.
+"""
+import logging
+import time
+import uuid
+
+from constance import config
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from trade_portal.documents.models import Document, OaDetails
+from trade_portal.monitoring.models import VerificationAttempt
+from trade_portal.oa_verify.services import OaVerificationService
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUS_PENDING = "pending"
+JOB_STATUS_DONE = "done"
+
+# the result parts rendered by the page (see document_provided.html), only they are cached;
+# the parsed OA document and its copies (oa_raw_data, ...) are not needed there
+JOB_RESULT_FIELDS = (
+    "status", "error_message", "doc_number", "issued_by",
+    "verify_result", "verify_result_rotated", "template_url",
+)
+JOB_RESULT_DOWNLOAD_FIELDS = ("attachments", "oa_base64")
+
+
+def run_verification(kind: str, value, filename: str = None) -> dict:
+    """
+    Verify the thing provided by user, kind is one of VerificationAttempt types:
+        file: the uploaded file object (filename is used to tell PDF from OA files, its name by default)
+        link: {"uri": ..., "key": ...} from the link query
+        QR: text of the QR code
+    Return the verification result dict (see OaVerificationService.verify_json_tt_document)
+    """
+    if kind == VerificationAttempt.TYPE_FILE:
+        if (filename or value.name).lower().endswith(".pdf"):
+            # PDF workflow
+            return OaVerificationService().verify_pdf_file(value)
+        # OA workflow - any other extension is considered to be OA (like .json or .tt)
+        return OaVerificationService().verify_json_tt_document(value.read())
+    elif kind == VerificationAttempt.TYPE_LINK:
+        try:
+            return OaVerificationService().verify_qr_code(query=value)
+        except Exception as e:
+            if str(e) == "Nonce cannot be empty":
+                return {
+                    "status": "error",
+                    "error_message": (
+                        "The query seems to be invalid or unsupported "
+                        "(most likely the document is not issued yet)"
+                    ),
+                }
+            logger.exception(e)
+            return {
+                "status": "error",
+                "error_message": f"The query seems to be invalid or unsupported ({str(e)})",
+            }
+    elif kind == VerificationAttempt.TYPE_QR:
+        try:
+            return OaVerificationService().verify_qr_code(code=value)
+        except Exception as e:
+            logger.exception(e)
+            return {
+                "status": "error",
+                "error_message": "The QR code seems to be invalid or unsupported",
+            }
+    raise ValueError(f"Unsupported verification kind {kind}")
+
+
+def find_verified_document(kind: str, value, verify_result: dict):
+    """
+    Return our local document which has been verified, if any
+    """
+    if kind == VerificationAttempt.TYPE_LINK:
+        local_oa_details = OaDetails.objects.filter(key=value["key"]).first()
+        if local_oa_details:
+            return Document.objects.filter(oa=local_oa_details).first()
+        return None
+    if verify_result.get("doc_number"):
+        return Document.objects.filter(document_number=verify_result.get("doc_number")).first()
+    return None
+
+
+def create_job(kind: str, value, attempt: VerificationAttempt = None) -> str:
+    """
+    Save what to verify and schedule the verification, returning the job id
+    """
+    from trade_portal.oa_verify.tasks import verify_job
+
+    job_id = uuid.uuid4().hex
+    job = {
+        "id": job_id,
+        "kind": kind,
+        "status": JOB_STATUS_PENDING,
+        "created_at": time.time(),
+        "attempt_id": attempt.pk if attempt else None,
+    }
+    if kind == VerificationAttempt.TYPE_FILE:
+        job["filename"] = value.name
+        job["file"] = default_storage.save(f"verify-jobs/{job_id}", value)
+    else:
+        job["value"] = value
+    cache.set(_cache_key(job_id), job, settings.OA_VERIFY_JOB_SECONDS)
+    # the attempt is linked to the document by the task
+    transaction.on_commit(lambda: verify_job.delay(job_id, job.get("file")))
+    return job_id
+
+
+def get_job(job_id: str):
+    """
+    Return the job dict or None if there is no such job (or it has expired)
+    The "result" key is present when the status is "done"
+    """
+    if not job_id or not job_id.isalnum():
+        return None
+    return cache.get(_cache_key(job_id))
+
+
+def process_job(job_id: str, file_name: str = None):
+    job = get_job(job_id)
+    if not job:
+        logger.warning("Verification job %s has expired before being processed", job_id)
+        if file_name:
+            default_storage.delete(file_name)
+        return
+    t0 = time.time()
+    try:
+        if job["kind"] == VerificationAttempt.TYPE_FILE:
+            with default_storage.open(job["file"], "rb") as value:
+                verify_result = run_verification(job["kind"], value, filename=job["filename"])
+        else:
+            verify_result = run_verification(job["kind"], job["value"])
+    except Exception as e:
+        logger.exception(e)
+        verify_result = {
+            "status": "error",
+            "error_message": "Unable to verify the document",
+        }
+    finally:
+        if job.get("file"):
+            default_storage.delete(job["file"])
+    logger.info("Verification job %s done in %ss", job_id, round(time.time() - t0, 4))
+
+    job["status"] = JOB_STATUS_DONE
+    job["result"] = _rendered_result(verify_result)
+    cache.set(_cache_key(job_id), job, settings.OA_VERIFY_JOB_SECONDS)
+
+    if job["attempt_id"]:
+        doc = find_verified_document(job["kind"], job.get("value"), verify_result)
+        if doc:
+            VerificationAttempt.objects.filter(pk=job["attempt_id"]).update(document=doc)
+
+
+def _rendered_result(verify_result: dict) -> dict:
+    fields = JOB_RESULT_FIELDS
+    if config.VERIFIER_SHOW_DOWNLOAD_TAB:
+        fields += JOB_RESULT_DOWNLOAD_FIELDS
+    result = {key: verify_result[key] for key in fields if key in verify_result}
+    if verify_result.get("unwrapped_file"):
+        # given to the renderer
+        result["unwrapped_file"] = {"data": verify_result["unwrapped_file"].get("data")}
+    return result
+
+
+def _cache_key(job_id: str) -> str:
+    return f"oa_verify_job_{job_id}"
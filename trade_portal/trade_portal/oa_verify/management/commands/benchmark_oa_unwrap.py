@@ -0,0 +1,90 @@
+import base64
+import json
+import os
+import time
+import tracemalloc
+import uuid
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+
+from trade_portal.oa_verify import unwrap
+
+
+def _wrapped_document(size_mb: int) -> bytes:
+    salt = str(uuid.uuid4())
+    attachment = base64.b64encode(os.urandom(size_mb * 1024 * 1024)).decode("utf-8")
+    return json.dumps({
+        "version": "https://schema.openattestation.com/2.0/schema.json",
+        "data": {
+            "certificateOfOrigin": {
+                "id": f"{salt}:string:AU-{size_mb}",
+                "isPreferential": f"{salt}:boolean:true",
+                "attachedFile": {
+                    "file": f"{salt}:string:{attachment}",
+                    "mimeCode": f"{salt}:string:application/pdf",
+                },
+            },
+            "lines": [{"number": f"{salt}:number:{i}"} for i in range(100)],
+        },
+        "signature": {"merkleRoot": "0" * 64},
+    }).encode("utf-8")
+
+
+def _legacy(file_content: bytes):
+    # the way the verified document used to be parsed (recursively, three times)
+    def unwrap_it(what):
+        if isinstance(what, str):
+            if what.count(":") >= 2:
+                uuidvalue, vtype, val = what.split(":", maxsplit=2)
+                if len(uuidvalue) == 36 and vtype == "string":
+                    return str(val)
+            return what
+        elif isinstance(what, list):
+            return [unwrap_it(x) for x in what]
+        elif isinstance(what, dict):
+            return {k: unwrap_it(v) for k, v in what.items()}
+        return what
+
+    json_content = json.loads(file_content)
+    unwrapped = unwrap_it(json.loads(file_content))
+    raw_data = json.loads(file_content)
+    return json_content, unwrapped, raw_data
+
+
+def _current(file_content: bytes):
+    json_content = unwrap.loads(file_content)
+    return json_content, unwrap.unwrap_document(json_content), json_content
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure time and peak memory to parse and unwrap the verified OA document "
+        "with attachments of different sizes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=str, default="1,10,50", help="Attachment sizes, MB")
+
+    def handle(self, *args, **kwargs):
+        procedures = [("legacy", _legacy, None), ("json", _current, None)]
+        if unwrap.orjson is not None:
+            procedures.append(("orjson", _current, unwrap.orjson))
+        else:
+            self.stdout.write("orjson is not installed, only the standard library is measured")
+
+        for size_mb in [int(size) for size in kwargs["sizes"].split(",")]:
+            file_content = _wrapped_document(size_mb)
+            for name, procedure, backend in procedures:
+                with mock.patch.object(unwrap, "orjson", backend):
+                    tracemalloc.start()
+                    t0 = time.perf_counter()
+                    result = procedure(file_content)
+                    spent = time.perf_counter() - t0
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                del result
+                self.stdout.write(
+                    f"{len(file_content) / 1024 / 1024:.1f}MB document, {name}: "
+                    f"{spent * 1000:.1f}ms, peak {peak / 1024 / 1024:.1f}MB"
+                )
@@ -0,0 +1,64 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from trade_portal.oa_verify.qrcodes import QrCodeExtractor, close_pool
+from trade_portal.oa_verify.services import PdfVerificationService
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "..", "..", "tests", "assets")
+
+
+class Command(BaseCommand):
+    help = (
+        "Extract QR codes from every PDF of the corpus and report time spent and the work done; "
+        "run with different limits (like --rasterise-pages 1000 --dpi 200 for the old behaviour) to compare"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--corpus", type=str, default=DEFAULT_CORPUS, help="Directory with PDF files")
+        parser.add_argument("--rounds", type=int, default=3)
+        parser.add_argument("--workers", type=int, default=settings.OA_VERIFY_QR_WORKERS)
+        parser.add_argument("--max-pages", type=int, default=settings.OA_VERIFY_QR_MAX_PAGES)
+        parser.add_argument("--rasterise-pages", type=int, default=settings.OA_VERIFY_QR_RASTERISE_PAGES)
+        parser.add_argument(
+            "--dpi", type=int, nargs="+", default=settings.OA_VERIFY_QR_RASTERISE_DPI,
+            help="Rasterisation resolutions, in order",
+        )
+        parser.add_argument("--time-budget", type=float, default=settings.OA_VERIFY_QR_TIME_BUDGET)
+
+    def handle(self, *args, **kwargs):
+        settings.OA_VERIFY_QR_WORKERS = kwargs["workers"]
+        settings.OA_VERIFY_QR_MAX_PAGES = kwargs["max_pages"]
+        settings.OA_VERIFY_QR_RASTERISE_PAGES = kwargs["rasterise_pages"]
+        settings.OA_VERIFY_QR_RASTERISE_DPI = kwargs["dpi"]
+        is_supported = PdfVerificationService(None).is_qr_of_supported_format
+
+        files = sorted(
+            os.path.join(kwargs["corpus"], name)
+            for name in os.listdir(kwargs["corpus"])
+            if name.lower().endswith(".pdf")
+        )
+        total = 0.0
+        for path in files:
+            with open(path, "rb") as f:
+                content = f.read()
+            codes, error = set(), None
+            t0 = time.perf_counter()
+            for i in range(kwargs["rounds"]):
+                extractor = QrCodeExtractor(content, is_supported, time_budget=kwargs["time_budget"])
+                try:
+                    codes = extractor.extract()
+                except Exception as e:
+                    error = e
+            spent = (time.perf_counter() - t0) / kwargs["rounds"]
+            total += spent
+            supported = [code for code in codes if is_supported(code)]
+            self.stdout.write(
+                f"{os.path.basename(path)} ({len(content) // 1024}KB): {spent * 1000:.1f}ms, "
+                f"{len(supported)} supported of {len(codes)} found, {extractor.stats}"
+                + (f", error: {error}" if error else "")
+            )
+        self.stdout.write(f"Total for {len(files)} files: {total * 1000:.1f}ms")
+        close_pool()
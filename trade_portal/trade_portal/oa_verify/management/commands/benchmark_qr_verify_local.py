@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from trade_portal.documents.models import OaDetails
+from trade_portal.oa_verify.services import OaVerificationService
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare reading our own document directly with downloading and decrypting it "
+        "(the way QR codes pointing to other portals are verified); the verifier itself is not called"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--oa", type=str, help="OaDetails id, the latest issued one by default")
+        parser.add_argument("--rounds", type=int, default=20)
+
+    def handle(self, *args, **kwargs):
+        if kwargs["oa"]:
+            oa = OaDetails.objects.filter(id=kwargs["oa"]).first()
+        else:
+            oa = OaDetails.objects.exclude(iv_base64="").order_by("-created_at").first()
+        if not oa or not oa.iv_base64:
+            raise CommandError("No issued OA document to benchmark with")
+
+        service = OaVerificationService()
+        results = {}
+        for name, func in (
+            ("local", service._get_local_document),
+            ("download", service._download_document),
+        ):
+            content = None
+            t0 = time.perf_counter()
+            for i in range(kwargs["rounds"]):
+                content = func(oa.uri, oa.key)
+            spent = (time.perf_counter() - t0) / kwargs["rounds"]
+            results[name] = content
+            self.stdout.write(f"{name}: {spent * 1000:.1f}ms per document")
+
+        if results["local"] is None:
+            self.stdout.write(f"{oa.uri} is not recognised as local, check BASE_URL")
+        elif results["local"] != results["download"]:
+            self.stdout.write("The local and downloaded documents differ")
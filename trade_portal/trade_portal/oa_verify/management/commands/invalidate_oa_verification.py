@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from trade_portal.oa_verify.services import OaVerificationService
+
+
+class Command(BaseCommand):
+    help = (
+        "Forget cached verification results of the documents with given merkle roots "
+        "(after they have been revoked, for example)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("merkle_roots", nargs="+", help="Merkle root of the wrapped document")
+
+    def handle(self, *args, **kwargs):
+        for merkle_root in kwargs["merkle_roots"]:
+            OaVerificationService.invalidate_cached_result(merkle_root)
+        self.stdout.write(f"Invalidated {len(kwargs['merkle_roots'])} verification results")
@@ -0,0 +1,295 @@
+"""
+QR codes extraction from the uploaded PDF files
+
+The verifier is public, so the uploaded PDF may be anything: huge scans, hundreds of pages
+or files made to be slow to render. Decoding and rendering is done in a small pool of
+separate processes with the CPU limit (the worker is killed if exceeds it) and the whole
+extraction has the wall time budget, after which whatever has been found is returned.
+
+The order is from cheap to expensive, stopping at the first page giving a supported code:
+    1. images embedded in the first OA_VERIFY_QR_MAX_PAGES pages, the same image
+       (like a logo on every page) is decoded only once
+    2. the first OA_VERIFY_QR_RASTERISE_PAGES pages rendered at each of the
+       OA_VERIFY_QR_RASTERISE_DPI resolutions, lowest first
+"""
+import atexit
+import hashlib
+import logging
+import multiprocessing
+import threading
+import time
+from io import BytesIO
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# QR code is at least 21x21 modules, smaller images are icons and lines
+MIN_IMAGE_SIDE = 21
+# forms inside forms inside forms are not worth walking further
+MAX_FORM_DEPTH = 3
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class QrExtractionTimeout(Exception):
+    pass
+
+
+def _init_worker(cpu_seconds):
+    # each worker does a single task (maxtasksperchild=1), so that's the limit for the task;
+    # the poppler process started by the rasterisation inherits it as well
+    import resource
+    if cpu_seconds:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # workers are started often (one per task), forking the threaded web process
+            # for each of them may copy the locks held by other threads and hang
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload([__name__, "PIL.Image"])
+            _pool = context.Pool(
+                processes=settings.OA_VERIFY_QR_WORKERS,
+                initializer=_init_worker,
+                initargs=(settings.OA_VERIFY_QR_CPU_SECONDS,),
+                maxtasksperchild=1,
+            )
+            atexit.register(close_pool)
+        return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.terminate()
+            _pool = None
+
+
+def decode_qr_codes(img) -> set:
+    from pyzbar.pyzbar import decode as pyzbar_decode
+
+    return {
+        decoded.data.decode("utf-8")
+        for decoded in pyzbar_decode(img)
+        if decoded.type == "QRCODE"
+    }
+
+
+def serialise_stream(xobject) -> bytes:
+    """
+    The PDF stream object as it's written to the file: the dictionary and the still
+    encoded content, so it's cheap to pass to the worker and to tell the images apart
+    """
+    from PyPDF2.generic import NameObject
+
+    for key in ("/Filter", "/DecodeParms"):
+        if key in xobject:
+            # the worker has no access to the rest of the document to follow the references
+            xobject[NameObject(key)] = xobject[key]
+    content = BytesIO()
+    xobject.writeToStream(content, None)
+    return content.getvalue()
+
+
+def decode_image(mode: str, size: tuple, image_filter: str, stream: bytes) -> set:
+    """
+    Worker task: unfilter the PDF image XObject (see serialise_stream) and decode it
+    """
+    from PIL import Image
+    from PyPDF2.generic import readObject
+
+    try:
+        # the last filter (the image format) is left by PyPDF2, the ones before are unpacked
+        data = readObject(BytesIO(stream), None).getData()
+        if image_filter in ("/DCTDecode", "/JPXDecode", "/CCITTFaxDecode"):
+            # the data is JPEG, jp2 or tiff already
+            img = Image.open(BytesIO(data))
+        elif image_filter in (None, "/FlateDecode"):
+            img = Image.frombytes(mode, size, data)
+        else:
+            logger.warning("Unsupported PDF image filter %s", image_filter)
+            return set()
+        return decode_qr_codes(img)
+    except Exception as e:
+        # just skip to the next image, there is a chance that we don't need that one anyway
+        logger.exception(e)
+        return set()
+
+
+def rasterise_page(pdf_content: bytes, page_number: int, dpi: int, timeout: int):
+    """
+    Worker task: render the single page (1-based) and decode it
+    Returns None if there is no such page in the document
+    """
+    from pdf2image import convert_from_bytes
+
+    images = convert_from_bytes(
+        pdf_content, dpi=dpi, first_page=page_number, last_page=page_number, timeout=timeout,
+    )
+    if not images:
+        return None
+    qrcodes = set()
+    for image in images:
+        qrcodes |= decode_qr_codes(image)
+    return qrcodes
+
+
+class QrCodeExtractor:
+    """
+    extractor = QrCodeExtractor(pdf_content, is_supported=PdfVerificationService.is_qr_of_supported_format)
+    codes = extractor.extract()
+
+    Returns the set of all codes found on the page where the first supported one is,
+    (so multiple codes on that page can be reported) or everything found if none are supported
+    """
+
+    def __init__(self, pdf_content: bytes, is_supported, time_budget: float = None):
+        self.pdf_content = pdf_content
+        self.is_supported = is_supported
+        if time_budget is None:
+            time_budget = settings.OA_VERIFY_QR_TIME_BUDGET
+        self.deadline = time.monotonic() + time_budget
+        self.stats = {
+            "stage": None,
+            "images_decoded": 0,
+            "images_duplicated": 0,
+            "pages_rasterised": 0,
+        }
+        self._seen_images = set()
+
+    def extract(self) -> set:
+        found = set()
+        try:
+            found |= self._extract_images()
+            if not self._has_supported(found):
+                found |= self._extract_rasterised()
+        except QrExtractionTimeout:
+            logger.warning("QR extraction time budget exceeded, %s", self.stats)
+        return found
+
+    def _has_supported(self, qrcodes) -> bool:
+        return any(self.is_supported(code) for code in qrcodes)
+
+    def _run(self, tasks) -> list:
+        """
+        Run [(func, args), ...] at once and return their results in the same order;
+        when there are no workers configured it's done in this process (tests, debugging)
+        """
+        if not settings.OA_VERIFY_QR_WORKERS:
+            return [func(*args) for func, args in tasks]
+        pool = get_pool()
+        pending = [pool.apply_async(func, args) for func, args in tasks]
+        results = []
+        for async_result in pending:
+            remaining = self.deadline - time.monotonic()
+            if remaining <= 0:
+                raise QrExtractionTimeout()
+            try:
+                results.append(async_result.get(timeout=remaining))
+            except multiprocessing.TimeoutError:
+                # the worker is not waited for, it dies when its CPU limit is exceeded
+                raise QrExtractionTimeout()
+        return results
+
+    def _extract_images(self) -> set:
+        """
+        Decode images embedded into the PDF page by page
+        (nothing is found if the file can't be parsed, like encrypted ones)
+        """
+        import PyPDF2
+
+        found = set()
+        try:
+            reader = PyPDF2.PdfFileReader(BytesIO(self.pdf_content))
+            pages_count = reader.numPages
+        except Exception as e:
+            # encrypted or broken, the rasterisation may still read it
+            logger.info("Unable to parse the PDF, it's going to be rasterised: %s", e)
+            return found
+
+        self.stats["stage"] = "images"
+        for page_number in range(min(pages_count, settings.OA_VERIFY_QR_MAX_PAGES)):
+            if time.monotonic() > self.deadline:
+                raise QrExtractionTimeout()
+            tasks = []
+            try:
+                self._collect_image_tasks(reader.getPage(page_number), tasks, depth=0)
+            except Exception as e:
+                # some parsing issue, the rest of the pages still may be read
+                logger.exception(e)
+            for qrcodes in self._run(tasks):
+                found |= qrcodes
+            if self._has_supported(found):
+                break
+        return found
+
+    def _collect_image_tasks(self, container, tasks, depth):
+        resources = container.get("/Resources")
+        xobjects = resources.getObject().get("/XObject") if resources else None
+        if not xobjects:
+            return
+        for xobject in xobjects.getObject().values():
+            try:
+                xobject = xobject.getObject()
+                if xobject.get("/Subtype") == "/Form":
+                    if depth < MAX_FORM_DEPTH:
+                        self._collect_image_tasks(xobject, tasks, depth + 1)
+                    continue
+                if xobject.get("/Subtype") != "/Image":
+                    continue
+                size = (int(xobject["/Width"]), int(xobject["/Height"]))
+                if min(size) < MIN_IMAGE_SIDE:
+                    continue
+                # decoded by the worker, the encoded stream is enough to tell the images apart
+                stream = serialise_stream(xobject)
+                image_hash = hashlib.sha1(stream).hexdigest()
+                if image_hash in self._seen_images:
+                    self.stats["images_duplicated"] += 1
+                    continue
+                self._seen_images.add(image_hash)
+
+                image_filter = xobject.get("/Filter")
+                if isinstance(image_filter, list):
+                    # the last filter is the image format (PyPDF2 unpacks the ones before)
+                    image_filter = image_filter[-1] if image_filter else None
+                mode = "RGB" if xobject.get("/ColorSpace") == "/DeviceRGB" else "P"
+                tasks.append((
+                    decode_image,
+                    (mode, size, str(image_filter) if image_filter else None, stream),
+                ))
+                self.stats["images_decoded"] += 1
+            except Exception as e:
+                # we won't read that image but there is a chance that we don't need it anyway
+                logger.exception(e)
+
+    def _extract_rasterised(self) -> set:
+        """
+        Render the first pages, lowest resolution first; the low resolution is often
+        enough for the QR codes (they are big) and is several times faster
+        """
+        self.stats["stage"] = "rasterisation"
+        found = set()
+        pages_count = settings.OA_VERIFY_QR_RASTERISE_PAGES
+        for dpi in settings.OA_VERIFY_QR_RASTERISE_DPI:
+            for page_number in range(1, pages_count + 1):
+                remaining = self.deadline - time.monotonic()
+                if remaining <= 0:
+                    raise QrExtractionTimeout()
+                (qrcodes,) = self._run([
+                    (rasterise_page, (self.pdf_content, page_number, dpi, int(remaining) + 1)),
+                ])
+                if qrcodes is None:
+                    # the document is shorter than the pages limit
+                    pages_count = page_number - 1
+                    break
+                self.stats["pages_rasterised"] += 1
+                found |= qrcodes
+                if self._has_supported(found):
+                    return found
+        return found
@@ -1,21 +1,28 @@
 import base64
+import hashlib
 import json
 import logging
+import re
 import time
 import urllib
-from io import BytesIO
+import uuid
 
-import PyPDF2
 import requests
 from django.conf import settings
-from PIL import Image
-from pyzbar.pyzbar import decode as pyzbar_decode
+from django.core.cache import cache
 
+from trade_portal.documents.models import OaDetails
 from trade_portal.documents.services.encryption import AESCipher
+from trade_portal.oa_verify import unwrap
+from trade_portal.oa_verify.qrcodes import QrCodeExtractor
+from trade_portal.utils.monitoring import statsd_counter, statsd_gauge, statsd_timing
 
 logger = logging.getLogger(__name__)
 
 
+HEALTH_CACHE_KEY = "oa_verify_api_health"
+
+
 class OaVerificationError(Exception):
     pass
 
@@ -25,10 +32,12 @@ class OaVerificationService:
     Object containing the code to verify JSON OA TT documents
     """
 
-    def verify_json_tt_document(self, file_content):
+    def verify_json_tt_document(self, file_content, use_cache=True):
         """
         Return verification result dict
         Accepting OA file body as cleartext bytes (already decrypted but not unwrapped)
+        The verifier response for the same file is cached for a while, use_cache=False
+        makes it asked again (when the status is expected to change, like just issued documents)
 
         Any other business-facing verification method (PDF upload, QR Code reading) ends
         in some TT document verification anyway
@@ -43,10 +52,8 @@ class OaVerificationService:
             * template_url - URL of the renderer to use in iframe which renders the document
             * attachments - list of binary (or text) attached files like PDFs
         """
-        result = {}
-
         try:
-            json_content = json.loads(file_content)
+            json_content = unwrap.loads(file_content)
         except (ValueError, TypeError):
             result = {
                 "status": "error",
@@ -60,46 +67,13 @@ class OaVerificationService:
                 # might be wrapped document number
                 doc_number = doc_number.split(":", maxsplit=2)[2]
 
-        self.kick_verify_api()
-
-        t0 = time.time()
-        try:
-            api_verify_resp = self._api_verify_tt_json_file(file_content)
-        except OaVerificationError as e:
-            logger.info("Document verification (api call), failed in %ss", round(time.time() - t0, 4))
-            result = {
-                "status": "error",
-                "error_message": str(e),
-            }
-        else:
-            logger.info("Document verification (api call), success in %ss", round(time.time() - t0, 4))
-            # the file has been verified and either valid or invalid, calculate the final status
-            result["status"] = "valid"
-            result["verify_result"] = api_verify_resp.copy()
-            result["verify_result_rotated"] = {}
-
-            valid_subjects_count = 0
-
-            for row in api_verify_resp:
-                if row["status"].lower() not in ("valid", "skipped"):
-                    result["status"] = "invalid"
-                if row["status"].lower() == "valid":
-                    valid_subjects_count += 1
-                result["verify_result_rotated"][row.get("name")] = row
-
-            if valid_subjects_count < 2 and result["status"] == "valid":
-                # although we didn't find any invalid/error subjects
-                # there weren't enough valid ones, so most of them are skipped probably
-                result["status"] = "error"
-                result["error_message"] = (
-                    "The document doesn't have at least 2 valid subjects. "
-                    "Most likely it's just not an OA document"
-                )
+        result = self._get_verify_status(file_content, json_content, use_cache=use_cache)
         if result["status"] == "valid":
             # worth further parsing only if the file is valid
             try:
-                result["unwrapped_file"] = self._unwrap_file(file_content)
-                result["oa_raw_data"] = json.loads(file_content)
+                # the file is parsed once, the unwrapped document shares everything but the values
+                result["unwrapped_file"] = self._unwrap_file(json_content)
+                result["oa_raw_data"] = json_content
                 result["oa_base64"] = base64.b64encode(file_content).decode("utf-8")
             except Exception as e:
                 logger.exception(e)
@@ -241,6 +215,18 @@ class OaVerificationService:
             # the url has been navigated, so we already have both uri and key
             uri, key = query["uri"], query["key"]
 
+        cleartext = self._get_local_document(uri, key)
+        if cleartext is None:
+            cleartext = self._download_document(uri, key)
+
+        logger.info("Unpacking document %s", uri)
+
+        return OaVerificationService().verify_json_tt_document(cleartext)
+
+    def _download_document(self, uri: str, key: str) -> bytes:
+        """
+        Download the encrypted document the QR code points to and decrypt it
+        """
         # this will contain fields cipherText, iv, tag, type
         logger.info("Retrieving document %s using key ending with %s", uri, str(key)[-5:])
 
@@ -259,26 +245,162 @@ class OaVerificationService:
             document_info["tag"],
             document_info["cipherText"],
         ).decode("utf-8")
-        cleartext = base64.b64decode(cleartext_b64)
+        return base64.b64decode(cleartext_b64)
 
-        logger.info("Unpacking document %s", uri)
+    def _get_local_document(self, uri: str, key: str):
+        """
+        If the uri points to this portal there is no need to download and decrypt
+        our own document, the wrapped file is read directly
+        Return None if it's not our document (or it can't be read so), the download
+        gives the same errors for the wrong key or not yet encrypted documents then
+        """
+        components = urllib.parse.urlparse(uri)
+        our_components = urllib.parse.urlparse(settings.BASE_URL)
+        if (components.scheme, components.netloc) != (our_components.scheme, our_components.netloc):
+            return None
+        match = re.match(r"^/oa/([0-9a-f-]{36})/?$", components.path)
+        if not match:
+            return None
+        oa = OaDetails.objects.defer("ciphertext").filter(id=match.group(1)).first()
+        if not oa or not oa.iv_base64 or not key or str(key).upper() != oa.key.upper():
+            return None
+        oa_file = oa.get_OA_file()
+        if not oa_file:
+            return None
+        logger.info("Reading local document %s", uri)
+        oa_file.open("rb")
+        try:
+            return oa_file.read()
+        finally:
+            oa_file.close()
 
-        return OaVerificationService().verify_json_tt_document(cleartext)
+    def _get_verify_status(self, file_content, json_content, use_cache=True):
+        """
+        Return the part of the result which depends on the verifier response:
+        status, verify_result, verify_result_rotated and error_message
+        Cached by the document merkle root and the file content hash, so other documents
+        of the same batch don't get that response
+        """
+        content_hash = hashlib.sha256(
+            file_content if isinstance(file_content, bytes) else file_content.encode("utf-8")
+        ).hexdigest()
+        cache_key = self._get_cache_key(json_content, content_hash)
+        if cache_key and use_cache:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                statsd_counter("oa_verify.cache.hit", 1)
+                return cached
+            statsd_counter("oa_verify.cache.miss", 1)
+
+        health = self.get_verify_api_health()
+        if health and not health["healthy"]:
+            # fail fast instead of waiting for timeouts, not cached because it's not about the document
+            return {
+                "status": "error",
+                "error_message": (
+                    "Verifier is temporary unavailable; please try again later. "
+                    "We are already aware of that issue and working on it."
+                ),
+                "verifier_unavailable": True,
+            }
+
+        result = {}
+        t0 = time.time()
+        try:
+            api_verify_resp = self._api_verify_tt_json_file(file_content)
+        except OaVerificationError as e:
+            logger.info("Document verification (api call), failed in %ss", round(time.time() - t0, 4))
+            result = {
+                "status": "error",
+                "error_message": str(e),
+            }
+        else:
+            logger.info("Document verification (api call), success in %ss", round(time.time() - t0, 4))
+            # the file has been verified and either valid or invalid, calculate the final status
+            result["status"] = "valid"
+            result["verify_result"] = api_verify_resp.copy()
+            result["verify_result_rotated"] = {}
+
+            valid_subjects_count = 0
+
+            for row in api_verify_resp:
+                if row["status"].lower() not in ("valid", "skipped"):
+                    result["status"] = "invalid"
+                if row["status"].lower() == "valid":
+                    valid_subjects_count += 1
+                result["verify_result_rotated"][row.get("name")] = row
+
+            if valid_subjects_count < 2 and result["status"] == "valid":
+                # although we didn't find any invalid/error subjects
+                # there weren't enough valid ones, so most of them are skipped probably
+                result["status"] = "error"
+                result["error_message"] = (
+                    "The document doesn't have at least 2 valid subjects. "
+                    "Most likely it's just not an OA document"
+                )
+
+        if cache_key:
+            # invalid documents may become valid soon (not notarized yet) and errors
+            # are mostly the verifier being unavailable, so they are kept for less time
+            if result["status"] == "valid":
+                timeout = settings.OA_VERIFY_CACHE_SECONDS
+            else:
+                timeout = settings.OA_VERIFY_CACHE_ERROR_SECONDS
+            if timeout:
+                cache.set(cache_key, result, timeout)
+        return result
+
+    @staticmethod
+    def _get_merkle_root(json_content):
+        try:
+            merkle_root = json_content["signature"]["merkleRoot"]
+        except (KeyError, TypeError):
+            return None
+        if not isinstance(merkle_root, str) or not merkle_root.isalnum() or len(merkle_root) > 128:
+            return None
+        return merkle_root.lower()
+
+    @classmethod
+    def _get_cache_key(cls, json_content, content_hash: str):
+        merkle_root = cls._get_merkle_root(json_content)
+        if not merkle_root:
+            return None
+        generation_key = f"oa_verify_generation_{merkle_root}"
+        generation = cache.get(generation_key)
+        if generation is None:
+            # a new one rather than a counter from zero, so results cached before the
+            # generation has been evicted are not returned again
+            cache.add(generation_key, uuid.uuid4().hex[:8], None)
+            generation = cache.get(generation_key)
+        return f"oa_verify_{merkle_root}_{generation}_{content_hash}"
+
+    @classmethod
+    def invalidate_cached_result(cls, merkle_root: str):
+        """
+        Revocation hook: call it when the status of the documents with that merkle root
+        changes (issued, revoked) so the next verification asks the verifier again.
+        Results for every document of the batch are dropped at once by starting a new generation
+        """
+        merkle_root = cls._get_merkle_root({"signature": {"merkleRoot": merkle_root}})
+        if merkle_root:
+            cache.set(f"oa_verify_generation_{merkle_root}", uuid.uuid4().hex[:8], None)
 
     def kick_verify_api(self):
         """
         Call the healthcheck API to ensure it's warm and ready
+        Done on schedule by the keep_verify_api_warm task, not before each verification;
+        the result is saved for the verifications to know if the API is available
         """
         if not settings.OA_VERIFY_API_HEALTHCHECK_URL:
             return False
         t0 = time.time()
         try:
-            kick_resp = requests.get(settings.OA_VERIFY_API_HEALTHCHECK_URL)
+            kick_resp = requests.get(settings.OA_VERIFY_API_HEALTHCHECK_URL, timeout=30)
         except Exception as e:
             logger.error(
                 "Verifier healthcheck temporary unavailable (%s)", str(e)
             )
-            return False
+            is_healthy = False
         else:
             if kick_resp.status_code != 200:
                 logger.warning(
@@ -286,14 +408,31 @@ class OaVerificationService:
                     kick_resp.status_code,
                     kick_resp.content
                 )
+            else:
+                logger.info(
+                    "Verifier healthcheck resp is %s, %ss",
+                    kick_resp.status_code,
+                    round(time.time() - t0, 4)
+                )
+            is_healthy = kick_resp.status_code == 200
 
         kick_timeout = time.time() - t0
-        logger.info(
-            "Verifier healthcheck resp is %s, %ss",
-            kick_resp.status_code,
-            round(kick_timeout, 4)
+        statsd_timing("oa_verify.healthcheck", kick_timeout)
+        statsd_gauge("oa_verify.available", 1 if is_healthy else 0)
+        cache.set(
+            HEALTH_CACHE_KEY,
+            {"healthy": is_healthy, "checked_at": time.time(), "latency": round(kick_timeout, 4)},
+            # the flag is forgotten if the checks stop, so verifications don't rely on stale one
+            settings.OA_VERIFY_WARM_INTERVAL_SECONDS * 3,
         )
-        return kick_resp.status_code == 200
+        return is_healthy
+
+    def get_verify_api_health(self):
+        """
+        Return the last healthcheck result {"healthy": bool, "checked_at": timestamp, "latency": seconds}
+        or None if it's unknown (checks are disabled or haven't been done recently)
+        """
+        return cache.get(HEALTH_CACHE_KEY)
 
     def _api_verify_tt_json_file(self, file_content):
         """
@@ -334,44 +473,12 @@ class OaVerificationService:
                 f"We are already aware of that issue and working on it."
             )
 
-    def _unwrap_file(self, content):
+    def _unwrap_file(self, wrapped):
         """
-        This is a reproduction of OA.unwrap() method and will stop working if
-        OA wrapping rules change in the future
-        But it's quick and written in Python, not JS
+        Accepting the parsed wrapped document, see unwrap.unwrap_document
+        It's quick and written in Python, not JS
         """
-
-        def unwrap_it(what):
-            if isinstance(what, str):
-                # wrapped something
-                if what.count(":") >= 2:
-                    uuidvalue, vtype, val = what.split(":", maxsplit=2)
-                    if len(uuidvalue) == len("6cdb27f1-a46e-4dea-b1af-3b3faf7d983d"):
-                        if vtype == "string":
-                            return str(val)
-                        elif vtype == "boolean":
-                            return True if val.lower() == "true" else False
-                        elif vtype == "number":
-                            return int(val)
-                        elif vtype == "null":
-                            return None
-                        elif vtype == "undefined":
-                            return None
-                    else:
-                        return what
-                else:
-                    # could be unwrapped already
-                    # (which means the document is invalid)
-                    return what
-            elif isinstance(what, list):
-                return [unwrap_it(x) for x in what]
-            elif isinstance(what, dict):
-                return {k: unwrap_it(v) for k, v in what.items()}
-            else:
-                return what
-
-        wrapped = json.loads(content)
-        return unwrap_it(wrapped)
+        return unwrap.unwrap_document(wrapped)
 
     def _parse_attachments(self, data, doc_number=None):
         """
@@ -407,19 +514,40 @@ class OaVerificationService:
         if not url:
             logger.warning("Unable to fetch renderer URL from OA file")
             return ""
+        return self.resolve_template_url(url)
 
+    @staticmethod
+    def resolve_template_url(url: str, use_cache: bool = True) -> str:
+        """
+        Return the url after all redirects; there are just few renderers used,
+        so the result is cached (and failures too, but for less time)
+        """
+        cache_key = "oa_template_url_" + hashlib.md5(url.encode("utf-8")).hexdigest()
+        if use_cache:
+            ret = cache.get(cache_key)
+            if ret is not None:
+                statsd_counter("oa_verify.template_url_cache.hit", 1)
+                return ret
+            statsd_counter("oa_verify.template_url_cache.miss", 1)
+
+        timeout = settings.OA_TEMPLATE_URL_ERROR_CACHE_SECONDS
         try:
-            url_resp = requests.get(url)
+            # only the final url is interesting, not the page itself
+            url_resp = requests.get(url, timeout=settings.OA_TEMPLATE_URL_TIMEOUT, stream=True)
+            url_resp.close()
         except Exception as e:
-            logger.exception(e)
+            logger.warning("Unable to resolve renderer URL %s: %s", url, e)
             ret = url
         else:
             if url_resp.status_code == 200:
                 ret = url_resp.url
+                timeout = settings.OA_TEMPLATE_URL_CACHE_SECONDS
             else:
                 ret = url
             if ret and not ret.startswith("http"):
                 ret = "https://" + ret
+        if timeout:
+            cache.set(cache_key, ret, timeout)
         return ret
 
 
@@ -438,40 +566,21 @@ class PdfVerificationService:
         """
         For the PDF with which this service has been initialized
         Tries to parse it
-        Retrieving all images and parsing them as QR codes
-        And if parsed - verify QR code format to be one of supported ones
-        And return the text from all the supported QR codes
+        Retrieving images and parsing them as QR codes (rendering the first pages
+        if there are none) until some codes of supported format are found
+        And return the text from all the supported QR codes on that page
 
         Seems to handle scanned PDFs well, but real usage will give us a lot of complex PDFs which
         are not supported - so just need to be considered as well
         """
-        qr_texts_found = set()
-
-        try:
-            reader = PyPDF2.PdfFileReader(self._pdf_binary)
-            pages_count = reader.numPages
-        except Exception as e:
-            logger.exception(e)
-            # try another library to rasterize that PDF and read QRs from images
-            qr_texts_found = self._try_rasterisation()
-        else:
-            # PDF can be parsed, do it
-            if pages_count > 20:
-                pages_count = 20  # performance
-            for page_num in range(0, pages_count):
-                page = reader.getPage(page_num)
-
-                if '/XObject' in page['/Resources']:
-                    xObject = page['/Resources']['/XObject'].getObject()
-                    qr_texts_found = qr_texts_found.union(self._parse_xobject(xObject))
-                else:
-                    # nothing to parse - no xobjects
-                    pass
-            if not qr_texts_found:
-                # try rasterisation in that case as well
-                qr_texts_found = self._try_rasterisation()
+        t0 = time.time()
+        self._pdf_binary.seek(0)
+        extractor = QrCodeExtractor(self._pdf_binary.read(), is_supported=self.is_qr_of_supported_format)
+        qr_texts_found = extractor.extract()
+        logger.info("QR codes extraction done in %ss, %s", round(time.time() - t0, 4), extractor.stats)
+        statsd_timing("oa_verify.qr_extraction", time.time() - t0)
 
-        # now qr_texts_found contains all texts of any format from the first page of that PDF
+        # now qr_texts_found contains all texts of any format from the first page having them
         # first - we filter out all which are not supported
         supported_qr_codes = []
         for qr_code in qr_texts_found:
@@ -479,72 +588,6 @@ class PdfVerificationService:
                 supported_qr_codes.append(qr_code)
         return supported_qr_codes or None
 
-    def _parse_xobject(self, xObject):
-        """
-        For given xObject
-        Tries to parse it as Image or, in case of Form, parses it recursively
-        """
-        qrtexts_in_that_xobject = set()
-        for obj in xObject:
-            try:
-                if xObject[obj]['/Subtype'] == '/Form':
-                    if '/XObject' in xObject[obj]['/Resources']:
-                        qrtexts_in_that_xobject = qrtexts_in_that_xobject.union(
-                            self._parse_xobject(xObject[obj]['/Resources']['/XObject'].getObject())
-                        )
-                elif xObject[obj]['/Subtype'] == '/Image':
-                    size = (xObject[obj]['/Width'], xObject[obj]['/Height'])
-                    data = xObject[obj].getData()  # already unfiltered
-                    if xObject[obj]['/ColorSpace'] == '/DeviceRGB':
-                        mode = "RGB"
-                    else:
-                        mode = "P"
-
-                    if '/Filter' in xObject[obj]:
-                        filters = xObject[obj]['/Filter']
-
-                        # we are interested only in last filter because PyPDF2 does all unpacking for us
-                        if isinstance(filters, list):
-                            the_filter = filters[-1]
-                        else:
-                            the_filter = filters
-
-                        # now we parse the image, assuming all filters were unfiltered
-                        if the_filter == '/FlateDecode':
-                            img = Image.frombytes(mode, size, data)
-                        elif the_filter == '/DCTDecode':
-                            # data is already JPEG
-                            img = Image.open(BytesIO(data))
-                        elif the_filter == '/JPXDecode':
-                            # data is already jp2 format
-                            img = Image.open(BytesIO(data))
-                        elif the_filter == '/CCITTFaxDecode':
-                            # data is already tiff format
-                            img = Image.open(BytesIO(data))
-                        else:
-                            # unsupported something, ignore that file
-                            logger.warning("Unsupported PDF image filter %s", the_filter)
-                            img = None
-                    else:
-                        img = Image.frombytes(mode, size, data)
-
-                    if img:
-                        qr_texts_in_this_image = self.parse_qr_code(img)
-                        if qr_texts_in_this_image:
-                            qrtexts_in_that_xobject = qrtexts_in_that_xobject.union(qr_texts_in_this_image)
-            except Exception as e:
-                # some parsing issue, just skip to the next xObject
-                # we won't read images from that block but at least there is a chance that we don't need it anyway
-                logger.exception(e)
-        return qrtexts_in_that_xobject
-
-    def parse_qr_code(self, img: Image):
-        decoded_texts = set()
-        for decoded in pyzbar_decode(img):
-            if decoded.type == "QRCODE":
-                decoded_texts.add(decoded.data.decode("utf-8"))
-        return decoded_texts or None
-
     def is_qr_of_supported_format(self, text: str) -> bool:
         if text.startswith("tradetrust://{") and text.endswith("}"):
             json_body = text[len("tradetrust://"):]
@@ -570,18 +613,3 @@ class PdfVerificationService:
             else:
                 return True  # http format
         return False
-
-    def _try_rasterisation(self):
-        """
-        Convert all pages to images and feeds them to QR code finder
-        This is used as last resort when usual PDF parsing wasn't able to find any codes
-        """
-        from pdf2image import convert_from_bytes
-        qrcodes = set()
-        self._pdf_binary.seek(0)
-        images = convert_from_bytes(self._pdf_binary.read())
-        for image in images:
-            this_page_codes = self.parse_qr_code(image)
-            if this_page_codes:
-                qrcodes = qrcodes.union(this_page_codes)
-        return qrcodes
@@ -0,0 +1,30 @@
+import logging
+
+from django.conf import settings
+
+from config import celery_app
+from trade_portal.oa_verify.services import OaVerificationService
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task(ignore_result=True, time_limit=60, soft_time_limit=50)
+def keep_verify_api_warm():
+    """
+    Call the verifier healthcheck on schedule so it's warm when the users need it
+    and its availability is known without asking it before each verification;
+    also resolves the known renderers urls so the verifications find them in the cache
+    """
+    OaVerificationService().kick_verify_api()
+    for url in settings.OA_TEMPLATE_URLS_PRERESOLVE:
+        OaVerificationService.resolve_template_url(url, use_cache=False)
+
+
+@celery_app.task(ignore_result=True, time_limit=150, soft_time_limit=120)
+def verify_job(job_id, file_name=None):
+    """
+    Verification requested by the verifier page user (OA_VERIFY_ASYNC_JOBS)
+    Routed to the "verification" queue, so the verification traffic is handled by its own workers
+    """
+    from trade_portal.oa_verify.jobs import process_job
+    process_job(job_id, file_name)
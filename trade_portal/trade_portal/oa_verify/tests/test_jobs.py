@@ -0,0 +1,109 @@
+from unittest import mock
+
+import pytest
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import Client
+from django.urls import reverse
+
+from trade_portal.monitoring.models import VerificationAttempt
+from trade_portal.oa_verify import jobs
+from trade_portal.oa_verify.jobs import get_job, process_job
+
+pytestmark = pytest.mark.django_db
+
+VERIFY_RESULT = {
+    "status": "error",
+    "error_message": "The document doesn't have at least 2 valid subjects.",
+    "doc_number": "",
+}
+
+
+@pytest.fixture
+def jobs_enabled(settings):
+    settings.OA_VERIFY_ASYNC_JOBS = True
+    with mock.patch("trade_portal.oa_verify.jobs.cache", LocMemCache("jobs-tests", {})):
+        yield settings
+
+
+@mock.patch("trade_portal.oa_verify.services.OaVerificationService.verify_qr_code")
+def test_verification_job_qrcode(verify_mock, jobs_enabled):
+    verify_mock.return_value = VERIFY_RESULT
+    client = Client()
+    url = reverse("oa-verify:verification")
+
+    resp = client.post(url, {"type": "qrcode", "qrcode": "tradetrust://{}"})
+    assert resp.status_code == 302
+    job_id = resp["Location"].split("?job=")[1]
+    # the request doesn't verify anything itself
+    assert verify_mock.call_count == 0
+    assert VerificationAttempt.objects.filter(type=VerificationAttempt.TYPE_QR).count() == 1
+
+    status_url = reverse("oa-verify:verification-job", args=[job_id])
+    assert client.get(status_url).json() == {"id": job_id, "status": "pending"}
+    resp = client.get(resp["Location"])
+    assert resp.context["verification_job"]["id"] == job_id
+    assert "verification_result" not in resp.context
+
+    process_job(job_id)
+    verify_mock.assert_called_once_with(code="tradetrust://{}")
+    assert client.get(status_url).json() == {"id": job_id, "status": "done"}
+    resp = client.get(f"{url}?job={job_id}")
+    assert resp.context["verification_result"] == VERIFY_RESULT
+
+    assert client.get(reverse("oa-verify:verification-job", args=["unknown"])).status_code == 404
+
+
+@mock.patch("trade_portal.oa_verify.services.OaVerificationService.verify_json_tt_document")
+def test_verification_job_file(verify_mock, jobs_enabled):
+    verify_mock.return_value = VERIFY_RESULT
+    client = Client()
+    resp = client.post(
+        reverse("oa-verify:verification"),
+        {"type": "file", "file-to-verify": ContentFile(b'{"data": {}}', name="document.json")},
+    )
+    assert resp.status_code == 302
+    job = get_job(resp["Location"].split("?job=")[1])
+    assert job["filename"] == "document.json"
+    assert default_storage.exists(job["file"])
+
+    process_job(job["id"])
+    verify_mock.assert_called_once_with(b'{"data": {}}')
+    assert get_job(job["id"])["result"] == VERIFY_RESULT
+    # the uploaded file is not kept
+    assert not default_storage.exists(job["file"])
+
+
+def test_verification_job_file_expired(jobs_enabled):
+    client = Client()
+    resp = client.post(
+        reverse("oa-verify:verification"),
+        {"type": "file", "file-to-verify": ContentFile(b'{"data": {}}', name="document.json")},
+    )
+    job = get_job(resp["Location"].split("?job=")[1])
+    jobs.cache.clear()
+
+    # the task is given the file, so it's removed even if nobody waits for the result anymore
+    process_job(job["id"], job["file"])
+    assert not default_storage.exists(job["file"])
+
+
+@mock.patch("trade_portal.oa_verify.services.OaVerificationService.verify_qr_code")
+def test_verification_job_cached_result(verify_mock, jobs_enabled):
+    verify_mock.return_value = dict(
+        VERIFY_RESULT,
+        status="valid",
+        unwrapped_file={"data": {"name": "CoO"}, "signature": {}},
+        oa_raw_data={"data": {}},
+        oa_base64="e30=",
+        attachments=[],
+    )
+    resp = Client().post(reverse("oa-verify:verification"), {"type": "qrcode", "qrcode": "tradetrust://{}"})
+    job_id = resp["Location"].split("?job=")[1]
+
+    with mock.patch("trade_portal.oa_verify.jobs.config") as config_mock:
+        config_mock.VERIFIER_SHOW_DOWNLOAD_TAB = False
+        process_job(job_id)
+    # only what the page renders
+    assert get_job(job_id)["result"] == dict(VERIFY_RESULT, status="valid", unwrapped_file={"data": {"name": "CoO"}})
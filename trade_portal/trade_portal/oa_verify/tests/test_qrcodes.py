@@ -0,0 +1,102 @@
+import io
+from unittest import mock
+
+import pytest
+from PIL import Image
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from trade_portal.oa_verify import qrcodes
+from trade_portal.oa_verify.qrcodes import QrCodeExtractor
+from trade_portal.oa_verify.services import PdfVerificationService
+
+SUPPORTED_CODE = 'tradetrust://{"uri":"https://example.com/oa/1/#KEY"}'
+
+
+def _is_supported(text):
+    return PdfVerificationService(None).is_qr_of_supported_format(text)
+
+
+def _pdf(pages=3, with_image=True):
+    image = Image.new("RGB", (100, 100), color=(200, 10, 10))
+    content = io.BytesIO()
+    c = canvas.Canvas(content)
+    for i in range(pages):
+        c.drawString(100, 100, f"Page {i}")
+        if with_image:
+            # the same logo on every page
+            c.drawImage(ImageReader(image), 100, 200, 100, 100)
+        c.showPage()
+    c.save()
+    return content.getvalue()
+
+
+@pytest.fixture
+def inline_extraction(settings):
+    settings.OA_VERIFY_QR_WORKERS = 0
+    settings.OA_VERIFY_QR_RASTERISE_PAGES = 2
+    settings.OA_VERIFY_QR_RASTERISE_DPI = [100, 200]
+    return settings
+
+
+@mock.patch("trade_portal.oa_verify.qrcodes.rasterise_page")
+@mock.patch("trade_portal.oa_verify.qrcodes.decode_qr_codes")
+def test_qr_extraction_images(decode_mock, rasterise_mock, inline_extraction):
+    # the same image is decoded only once
+    decode_mock.return_value = set()
+    rasterise_mock.return_value = set()
+    extractor = QrCodeExtractor(_pdf(), _is_supported)
+    assert extractor.extract() == set()
+    assert decode_mock.call_count == 1
+    assert extractor.stats["images_decoded"] == 1
+    assert extractor.stats["images_duplicated"] == 2
+    # unfiltered from the encoded stream by the worker task
+    image = decode_mock.call_args[0][0]
+    assert image.size == (100, 100)
+    assert image.getpixel((50, 50)) == (200, 10, 10)
+
+    # and the search stops at the first page with the supported code
+    decode_mock.reset_mock()
+    rasterise_mock.reset_mock()
+    decode_mock.return_value = {SUPPORTED_CODE}
+    extractor = QrCodeExtractor(_pdf(), _is_supported)
+    assert extractor.extract() == {SUPPORTED_CODE}
+    assert decode_mock.call_count == 1
+    assert extractor.stats["stage"] == "images"
+    assert extractor.stats["images_duplicated"] == 0
+    assert rasterise_mock.call_count == 0
+
+
+@mock.patch("trade_portal.oa_verify.qrcodes.rasterise_page")
+def test_qr_extraction_rasterisation(rasterise_mock, inline_extraction):
+    # lowest resolution for the first pages, then the higher one, until something is found
+    rasterise_mock.side_effect = lambda content, page, dpi, timeout: (
+        {SUPPORTED_CODE} if (page, dpi) == (2, 200) else {"http://unsupported.example.com"}
+    )
+    extractor = QrCodeExtractor(_pdf(pages=30, with_image=False), _is_supported)
+    assert extractor.extract() == {SUPPORTED_CODE, "http://unsupported.example.com"}
+    assert [c[0][1:3] for c in rasterise_mock.call_args_list] == [(1, 100), (2, 100), (1, 200), (2, 200)]
+    assert extractor.stats["stage"] == "rasterisation"
+
+    # the document shorter than the pages limit
+    rasterise_mock.reset_mock()
+    rasterise_mock.side_effect = lambda content, page, dpi, timeout: set() if page == 1 else None
+    extractor = QrCodeExtractor(_pdf(pages=1, with_image=False), _is_supported)
+    assert extractor.extract() == set()
+    assert [c[0][1:3] for c in rasterise_mock.call_args_list] == [(1, 100), (2, 100), (1, 200)]
+    assert extractor.stats["pages_rasterised"] == 2
+
+    # nothing is done once the time budget is spent
+    rasterise_mock.reset_mock()
+    extractor = QrCodeExtractor(_pdf(pages=1, with_image=False), _is_supported, time_budget=0)
+    assert extractor.extract() == set()
+    assert rasterise_mock.call_count == 0
+
+
+def test_qr_extraction_pool(settings):
+    settings.OA_VERIFY_QR_WORKERS = 1
+    settings.OA_VERIFY_QR_RASTERISE_DPI = []
+    extractor = QrCodeExtractor(_pdf(pages=1), _is_supported)
+    assert extractor._run([(qrcodes.decode_image, ("RGB", (1, 1), "/Unknown", b""))]) == [set()]
+    assert extractor.extract() == set()
+    assert extractor.stats["images_decoded"] == 1
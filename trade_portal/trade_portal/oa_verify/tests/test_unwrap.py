@@ -0,0 +1,68 @@
+import json
+import os
+from unittest import mock
+
+import pytest
+
+from trade_portal.oa_verify import unwrap
+from trade_portal.oa_verify.unwrap import unwrap_document
+
+SALT = "6cdb27f1-a46e-4dea-b1af-3b3faf7d983d"
+
+
+@pytest.mark.parametrize("backend", [None, unwrap.orjson])
+def test_unwrap_document(backend):
+    wrapped = {
+        "version": "https://schema.openattestation.com/2.0/schema.json",
+        "data": {
+            "id": f"{SALT}:string:AU-1:2:3",
+            "isValid": f"{SALT}:boolean:TRUE",
+            "count": f"{SALT}:number:42",
+            "note": f"{SALT}:null:null",
+            "missing": f"{SALT}:undefined:undefined",
+            "items": [f"{SALT}:string:a", [f"{SALT}:boolean:false"], {"b": f"{SALT}:string:"}],
+            "attachedFile": {"file": f"{SALT}:string:" + "QUJD" * 1000},
+        },
+        "signature": {"merkleRoot": "abcd", "proof": [], "count": 1},
+    }
+    with mock.patch.object(unwrap, "orjson", backend):
+        parsed = unwrap.loads(json.dumps(wrapped).encode("utf-8"))
+    assert parsed == wrapped
+    assert unwrap_document(parsed) == {
+        "version": "https://schema.openattestation.com/2.0/schema.json",
+        "data": {
+            "id": "AU-1:2:3",
+            "isValid": True,
+            "count": 42,
+            "note": None,
+            "missing": None,
+            "items": ["a", [False], {"b": ""}],
+            "attachedFile": {"file": "QUJD" * 1000},
+        },
+        "signature": {"merkleRoot": "abcd", "proof": [], "count": 1},
+    }
+    # the parsed document is not changed, it's returned as oa_raw_data
+    assert parsed == wrapped
+    assert unwrap_document(f"{SALT}:string:x") == "x"
+    assert unwrap_document("not:wrapped:value") == "not:wrapped:value"
+
+
+def test_unwrap_document_deeply_nested():
+    wrapped = f"{SALT}:string:deep"
+    for i in range(5000):
+        wrapped = [wrapped]
+    unwrapped = unwrap_document(wrapped)
+    for i in range(5000):
+        unwrapped = unwrapped[0]
+    assert unwrapped == "deep"
+
+
+@pytest.mark.skipif(unwrap.orjson is None, reason="orjson is not installed")
+def test_loads_backends_agree():
+    ASSETS_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "assets")
+    content = open(os.path.join(ASSETS_PATH, "simple-oa.json"), "rb").read()
+    with mock.patch.object(unwrap, "orjson", None):
+        parsed = unwrap.loads(content)
+    assert unwrap.loads(content) == parsed
+    with pytest.raises(ValueError):
+        unwrap.loads(b"{not json")
@@ -97,7 +97,7 @@ def test_verify_tt_document(api_verify_mock, kick_mock):
 
     verify_result = s.verify_json_tt_document(tt_document)
 
-    assert kick_mock.call_count == 1
+    assert kick_mock.call_count == 0  # done by the keep_verify_api_warm task
     assert api_verify_mock.call_count == 1
 
     assert verify_result.get("attachments") == []
@@ -132,7 +132,7 @@ def test_verify_pdf_file(retr_mock, get_mock, api_verify_mock, kick_mock):
 
     verify_result = s.verify_pdf_file(scanned)
 
-    assert kick_mock.call_count == 1
+    assert kick_mock.call_count == 0  # done by the keep_verify_api_warm task
     assert api_verify_mock.call_count == 1
     assert get_mock.call_count == 1
 
@@ -141,3 +141,150 @@ def test_verify_pdf_file(retr_mock, get_mock, api_verify_mock, kick_mock):
     assert verify_result["status"] == "valid"
     assert verify_result["template_url"] == "https://template-url/"
     assert verify_result["verify_result"] == api_verify_mock.return_value
+
+
+@mock.patch("trade_portal.oa_verify.services.OaVerificationService.kick_verify_api")
+@mock.patch("trade_portal.oa_verify.services.OaVerificationService._api_verify_tt_json_file")
+@mock.patch("trade_portal.oa_verify.services.OaVerificationService._retrieve_template_url")
+def test_verify_result_cache(retr_mock, api_verify_mock, kick_mock, settings):
+    from django.core.cache.backends.locmem import LocMemCache
+    from trade_portal.oa_verify.services import OaVerificationError
+
+    ASSETS_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "assets")
+    tt_document = open(os.path.join(ASSETS_PATH, "simple-oa.json"), "rb").read()
+    merkle_root = json.loads(tt_document)["signature"]["merkleRoot"]
+    api_verify_mock.return_value = TYPICAL_VERIFY_RESP[:]
+    retr_mock.return_value = "https://template-url/"
+    settings.OA_VERIFY_CACHE_SECONDS = 300
+    settings.OA_VERIFY_CACHE_ERROR_SECONDS = 30
+
+    with mock.patch("trade_portal.oa_verify.services.cache", LocMemCache("verify-tests", {})):
+        s = OaVerificationService()
+        first = s.verify_json_tt_document(tt_document)
+        second = s.verify_json_tt_document(tt_document)
+        assert api_verify_mock.call_count == 1
+        assert first["status"] == second["status"] == "valid"
+        assert second["verify_result"] == first["verify_result"]
+        assert second["issued_by"] == first["issued_by"] == "wpca-alpha.datatrust.link"
+
+        # the same merkle root but other content is not taken from the cache
+        compact_document = json.dumps(json.loads(tt_document), separators=(",", ":")).encode("utf-8")
+        s.verify_json_tt_document(compact_document)
+        assert api_verify_mock.call_count == 2
+        # and both are kept
+        s.verify_json_tt_document(tt_document)
+        s.verify_json_tt_document(compact_document)
+        assert api_verify_mock.call_count == 2
+
+        # neither it's taken when asked not to, or after the invalidation
+        s.verify_json_tt_document(tt_document, use_cache=False)
+        assert api_verify_mock.call_count == 3
+        s.verify_json_tt_document(tt_document)
+        assert api_verify_mock.call_count == 3
+        OaVerificationService.invalidate_cached_result(merkle_root)
+        s.verify_json_tt_document(tt_document)
+        assert api_verify_mock.call_count == 4
+        # the invalidation covers all the documents with that merkle root
+        s.verify_json_tt_document(compact_document)
+        assert api_verify_mock.call_count == 5
+
+        # errors are kept for their own time
+        settings.OA_VERIFY_CACHE_ERROR_SECONDS = 0
+        OaVerificationService.invalidate_cached_result(merkle_root)
+        api_verify_mock.side_effect = OaVerificationError("Verifier is temporary unavailable")
+        assert s.verify_json_tt_document(tt_document)["status"] == "error"
+        assert s.verify_json_tt_document(tt_document)["status"] == "error"
+        assert api_verify_mock.call_count == 7
+
+
+@mock.patch("trade_portal.oa_verify.services.OaVerificationService._api_verify_tt_json_file")
+@mock.patch("requests.get")
+def test_verify_api_warm_keeper(get_mock, api_verify_mock, settings):
+    from django.core.cache.backends.locmem import LocMemCache
+    from trade_portal.oa_verify.tasks import keep_verify_api_warm
+
+    ASSETS_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "assets")
+    tt_document = open(os.path.join(ASSETS_PATH, "simple-oa.json"), "rb").read()
+    settings.OA_VERIFY_API_HEALTHCHECK_URL = "http://verifier/healthcheck"
+    settings.OA_TEMPLATE_URLS_PRERESOLVE = []
+    api_verify_mock.return_value = TYPICAL_VERIFY_RESP[:1]
+
+    with mock.patch("trade_portal.oa_verify.services.cache", LocMemCache("verify-tests", {})):
+        s = OaVerificationService()
+        # unknown is not a reason to refuse the verification
+        assert s.get_verify_api_health() is None
+        assert s.verify_json_tt_document(tt_document)["status"] == "error"  # just one subject
+        assert api_verify_mock.call_count == 1
+
+        get_mock.return_value = MockResponse(status_code=503, json_resp={})
+        keep_verify_api_warm()
+        assert get_mock.call_args[0] == ("http://verifier/healthcheck",)
+        assert s.get_verify_api_health()["healthy"] is False
+        result = s.verify_json_tt_document(tt_document)
+        assert result["status"] == "error" and result["verifier_unavailable"]
+        assert api_verify_mock.call_count == 1
+
+        get_mock.return_value = MockResponse(status_code=200, json_resp={})
+        keep_verify_api_warm()
+        assert s.get_verify_api_health()["healthy"] is True
+        s.verify_json_tt_document(tt_document)
+        assert api_verify_mock.call_count == 2
+
+
+@mock.patch("requests.get")
+def test_template_url_cache(get_mock, settings):
+    from django.core.cache.backends.locmem import LocMemCache
+
+    settings.OA_TEMPLATE_URL_CACHE_SECONDS = 3600
+    settings.OA_TEMPLATE_URL_ERROR_CACHE_SECONDS = 60
+    get_mock.return_value = mock.MagicMock(status_code=200, url="https://renderer.example.com/v2/")
+    unwrapped = {"data": {"$template": {"url": "https://renderer.example.com"}}}
+
+    with mock.patch("trade_portal.oa_verify.services.cache", LocMemCache("verify-tests", {})) as cache_mock:
+        s = OaVerificationService()
+        assert s._retrieve_template_url(unwrapped) == "https://renderer.example.com/v2/"
+        assert s._retrieve_template_url(unwrapped) == "https://renderer.example.com/v2/"
+        assert get_mock.call_count == 1
+        assert get_mock.call_args[1]["timeout"] == settings.OA_TEMPLATE_URL_TIMEOUT
+
+        # failures are remembered as well, for less time
+        get_mock.side_effect = Exception("Timeout")
+        unwrapped = {"data": {"$template": {"url": "https://down.example.com"}}}
+        with mock.patch.object(cache_mock, "set", wraps=cache_mock.set) as set_mock:
+            assert s._retrieve_template_url(unwrapped) == "https://down.example.com"
+        assert set_mock.call_args[0][1:] == ("https://down.example.com", 60)
+        assert s._retrieve_template_url(unwrapped) == "https://down.example.com"
+        assert get_mock.call_count == 2
+
+
+@mock.patch("trade_portal.oa_verify.services.OaVerificationService.verify_json_tt_document")
+@mock.patch("requests.get")
+def test_verify_qr_code_local_document(get_mock, verify_mock, docapi_env, settings):
+    from django.core.files.base import ContentFile
+    from trade_portal.documents.models import OaDetails
+    from trade_portal.documents.services.encryption import AESCipher
+
+    settings.BASE_URL = "https://trade.example.com"
+    ASSETS_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "assets")
+    tt_document = open(os.path.join(ASSETS_PATH, "simple-oa.json"), "rb").read()
+
+    oa = OaDetails.retrieve_new(for_org=docapi_env["u1"].direct_orgs[0])
+    oa.oa_file = ContentFile(tt_document, name="oa-doc-wrapped.json")
+    oa.save_ciphertext(*AESCipher(oa.key).encrypt_with_params_separate(tt_document.decode("utf-8")))
+    verify_mock.return_value = {"status": "valid"}
+
+    # our own document is read directly, the same as it would be downloaded
+    s = OaVerificationService()
+    assert s.verify_qr_code(query={"uri": oa.uri, "key": oa.key}) == {"status": "valid"}
+    verify_mock.assert_called_once_with(tt_document)
+    assert get_mock.call_count == 0
+
+    get_mock.return_value = MockResponse(
+        status_code=200, json_resp=oa.render_ciphertext_document(oa.iv_base64, oa.tag_base64, oa.get_ciphertext())
+    )
+    assert s._download_document(oa.uri, oa.key) == tt_document
+
+    # but not if the key is wrong or it's not our host
+    assert s._get_local_document(oa.uri, OaDetails._generate_aes_key()) is None
+    assert s._get_local_document(oa.uri.replace("trade.example.com", "trade.other.com"), oa.key) is None
+    assert s._get_local_document(oa.uri.replace(str(oa.id), "not-a-uuid"), oa.key) is None
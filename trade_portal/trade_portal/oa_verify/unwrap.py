@@ -0,0 +1,79 @@
+"""
+Parsing and unwrapping of OA (v2) documents being verified
+
+Every value of the wrapped document is a "<salt uuid>:<type>:<value>" string, the
+documents often have a PDF attached as a (large) base64 string. So the document is
+parsed once, only the head of each string is looked at and the new structure
+shares everything which is not wrapped with the parsed one.
+
+orjson is used for parsing if installed, it's several times faster and doesn't
+keep the intermediate copies of big strings around.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    # optional, the standard library does the same just slower
+    orjson = None
+
+SALT_LENGTH = len("6cdb27f1-a46e-4dea-b1af-3b3faf7d983d")
+
+
+def loads(content):
+    """
+    json.loads() accepting bytes or str, raising ValueError for invalid JSON
+    """
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def unwrap_value(value: str):
+    """
+    This is a reproduction of OA.unwrap() for a single value and will stop working
+    if OA wrapping rules change in the future
+    """
+    # the salt is the fixed length so there is no need to scan (or split) the whole string
+    if value.find(":", 0, SALT_LENGTH + 1) != SALT_LENGTH:
+        # could be unwrapped already (which means the document is invalid)
+        return value
+    type_end = value.find(":", SALT_LENGTH + 1)
+    if type_end == -1:
+        return value
+    vtype = value[SALT_LENGTH + 1:type_end]
+    if vtype == "string":
+        return value[type_end + 1:]
+    elif vtype == "boolean":
+        return value[type_end + 1:].lower() == "true"
+    elif vtype == "number":
+        return int(value[type_end + 1:])
+    # null, undefined and anything unknown
+    return None
+
+
+def unwrap_document(wrapped):
+    """
+    Return the unwrapped copy of the parsed document, which is left untouched
+    Done without recursion, so deeply nested documents don't hit the recursion limit
+    """
+    if isinstance(wrapped, str):
+        return unwrap_value(wrapped)
+    if not isinstance(wrapped, (dict, list)):
+        return wrapped
+    result = {} if isinstance(wrapped, dict) else [None] * len(wrapped)
+    stack = [(wrapped, result)]
+    while stack:
+        source, target = stack.pop()
+        for key, value in (source.items() if isinstance(source, dict) else enumerate(source)):
+            if isinstance(value, str):
+                target[key] = unwrap_value(value)
+            elif isinstance(value, dict):
+                target[key] = {}
+                stack.append((value, target[key]))
+            elif isinstance(value, list):
+                target[key] = [None] * len(value)
+                stack.append((value, target[key]))
+            else:
+                target[key] = value
+    return result
@@ -1,10 +1,11 @@
 from django.urls import path
 
-from trade_portal.oa_verify.views import OaVerificationView
+from trade_portal.oa_verify.views import OaVerificationJobView, OaVerificationView
 
 app_name = "oa_verify"
 
 urlpatterns = [
     # Documents
     path("", view=OaVerificationView.as_view(), name="verification"),
+    path("jobs/<str:job_id>/", view=OaVerificationJobView.as_view(), name="verification-job"),
 ]
@@ -2,12 +2,16 @@ import json
 import logging
 
 from constance import config
+from django.conf import settings
 from django.contrib import messages
-from django.views.generic import TemplateView
+from django.http import Http404, JsonResponse
+from django.shortcuts import redirect
+from django.views.generic import TemplateView, View
 
-from trade_portal.documents.models import OaDetails, Document
-from trade_portal.oa_verify.services import OaVerificationService
 from trade_portal.monitoring.models import VerificationAttempt
+from trade_portal.oa_verify.jobs import (
+    JOB_STATUS_DONE, create_job, find_verified_document, get_job, run_verification,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -24,12 +28,20 @@ class OaVerificationView(TemplateView):
         c = super().get_context_data(*args, **kwargs)
         c["VERIFIER_SHOW_DOWNLOAD_TAB"] = config.VERIFIER_SHOW_DOWNLOAD_TAB
 
-        if self.request.POST:
+        if self.request.POST and not settings.OA_VERIFY_ASYNC_JOBS:
             try:
                 c["verification_result"] = self.perform_verification()
             except Exception as e:
                 logger.exception(e)
                 pass
+        elif self.request.GET.get("job"):
+            job = get_job(self.request.GET.get("job"))
+            if not job:
+                messages.warning(self.request, "The verification has expired, please try again")
+            elif job["status"] == JOB_STATUS_DONE:
+                c["verification_result"] = job["result"]
+            else:
+                c["verification_job"] = job
         else:
             query_query = self._get_qr_code_query()
             if query_query:
@@ -67,6 +79,11 @@ class OaVerificationView(TemplateView):
         return None
 
     def post(self, request, *args, **kwargs):
+        if settings.OA_VERIFY_ASYNC_JOBS:
+            # the worker verifies it, the page waits for the job to be done
+            job_id = self.create_verification_job()
+            if job_id:
+                return redirect(f"{request.path}?job={job_id}")
         # get_context_data calls the verification step if the data is present
         return super().get(request, *args, **kwargs)
 
@@ -91,81 +108,57 @@ class OaVerificationView(TemplateView):
         Please note that invalid means that file is okay but not issued/tampered/etc
         but error means that the file is not OA file or API returns 500 errors
         """
+        request_to_verify = self._get_request_to_verify(query)
+        if not request_to_verify:
+            return None
+        kind, value = request_to_verify
+        verify_result = run_verification(kind, value)
+
+        # logging part
+        att = VerificationAttempt.create_from_request(self.request, kind)
+        doc = find_verified_document(kind, value, verify_result)
+        if doc:
+            att.document = doc
+            att.save()
+        return verify_result
+
+    def _get_request_to_verify(self, query: dict = None):
+        """
+        Return (kind, value) of what the user wants to verify or None
+        """
         if self.request.POST.get("type") == "file":
             the_file = self.request.FILES.get("file-to-verify")
             if not the_file:
                 messages.warning(self.request, "No file provided, please upload one")
                 return None
-
-            if the_file.name.lower().endswith(".pdf"):
-                # PDF workflow
-                verify_result = OaVerificationService().verify_pdf_file(the_file)
-            else:
-                # OA workflow - any other extension is considered to be OA (like .json or .tt)
-                tt_content = the_file.read()
-                verify_result = OaVerificationService().verify_json_tt_document(tt_content)
-
-            # logging part
-            att = VerificationAttempt.create_from_request(self.request, VerificationAttempt.TYPE_FILE)
-            if verify_result.get("doc_number"):
-                doc = Document.objects.filter(
-                    document_number=verify_result.get("doc_number")
-                ).first()
-                if doc:
-                    att.document = doc
-                    att.save()
+            return VerificationAttempt.TYPE_FILE, the_file
         elif query:
             # ?q={...}
-            try:
-                verify_result = OaVerificationService().verify_qr_code(query=query)
-                va = VerificationAttempt.create_from_request(
-                    self.request,
-                    VerificationAttempt.TYPE_LINK
-                )
-                local_oa_details = OaDetails.objects.filter(
-                    key=query["key"]
-                ).first()
-                if local_oa_details:
-                    va.document = Document.objects.filter(
-                        oa=local_oa_details
-                    ).first()
-                    va.save()
-            except Exception as e:
-                if str(e) == "Nonce cannot be empty":
-                    verify_result = {
-                        "status": "error",
-                        "error_message": (
-                            "The query seems to be invalid or unsupported "
-                            "(most likely the document is not issued yet)"
-                        ),
-                    }
-                else:
-                    logger.exception(e)
-                    verify_result = {
-                        "status": "error",
-                        "error_message": f"The query seems to be invalid or unsupported ({str(e)})",
-                    }
+            return VerificationAttempt.TYPE_LINK, query
         elif self.request.POST.get("type") == "qrcode":
-            the_code = self.request.POST.get("qrcode")
-            try:
-                verify_result = OaVerificationService().verify_qr_code(code=the_code)
-                # TODO: create that log object if we still need it
-                va = VerificationAttempt.create_from_request(
-                    self.request,
-                    VerificationAttempt.TYPE_QR
-                )
-                doc = Document.objects.filter(
-                    document_number=verify_result.get("doc_number")
-                ).first()
-                if doc:
-                    va.document = doc
-                    va.save()
-            except Exception as e:
-                logger.exception(e)
-                verify_result = {
-                    "status": "error",
-                    "error_message": "The QR code seems to be invalid or unsupported",
-                }
-        else:
+            return VerificationAttempt.TYPE_QR, self.request.POST.get("qrcode")
+        return None
+
+    def create_verification_job(self):
+        """
+        Return the job id if there is something to verify
+        """
+        request_to_verify = self._get_request_to_verify()
+        if not request_to_verify:
             return None
-        return verify_result
+        kind, value = request_to_verify
+        att = VerificationAttempt.create_from_request(self.request, kind)
+        return create_job(kind, value, attempt=att)
+
+
+class OaVerificationJobView(View):
+    """
+    The verification job status for the page to wait for it, the result itself
+    is displayed by the OaVerificationView
+    """
+
+    def get(self, request, *args, **kwargs):
+        job = get_job(kwargs["job_id"])
+        if not job:
+            raise Http404()
+        return JsonResponse({"id": job["id"], "status": job["status"]})
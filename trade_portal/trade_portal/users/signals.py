@@ -0,0 +1,20 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from trade_portal.documents.models import DocumentAccess
+from trade_portal.users.models import Organisation
+
+
+@receiver(post_save, sender=Organisation)
+def update_org_document_access(sender, instance, raw=False, **kwargs):
+    """
+    The documents the organisation can see depend on its name and business id
+    """
+    if raw:
+        # loading fixtures
+        return
+    if not instance.is_trader:
+        # only traders see the documents by the rule, drop the rows left if it was one
+        DocumentAccess.objects.filter(org=instance).delete()
+        return
+    DocumentAccess.update_for_org(instance)
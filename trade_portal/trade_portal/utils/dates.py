@@ -0,0 +1,23 @@
+import datetime
+
+from django.db import models
+from django.utils import timezone
+
+
+def date_range_filter(field: str, after=None, before=None) -> dict:
+    """
+    Filter kwargs for the datetime field being within the days (inclusive, in the current timezone)
+
+    The same as field__date__gte/lte, but comparing the column itself so its index can be used;
+    the dates may be strings (ValidationError is raised for invalid ones, like the __date lookups do)
+    """
+    lookups = {}
+    if after:
+        lookups[f"{field}__gte"] = _day_start(models.DateField().to_python(after))
+    if before:
+        lookups[f"{field}__lt"] = _day_start(models.DateField().to_python(before) + datetime.timedelta(days=1))
+    return lookups
+
+
+def _day_start(date: datetime.date) -> datetime.datetime:
+    return timezone.make_aware(datetime.datetime.combine(date, datetime.time.min))
@@ -0,0 +1,160 @@
+"""
+Incremental JSON serialisation for documents containing large binary attachments
+
+The rendered OA document may contain a PDF file as a base64 string, which makes
+every json.dumps() call allocate several times the file size. Instead the renderer
+may put a Base64File there, which is encoded chunk by chunk only when the document
+is written somewhere (storage, HTTP request body).
+
+The output is the same json.dumps() (default parameters) would produce.
+"""
+import base64
+import io
+import json
+import math
+
+# must be a multiple of 3 so base64 encoded chunks may be concatenated
+CHUNK_SIZE = 3 * 256 * 1024
+
+
+class Base64File:
+    """
+    Lazy base64 representation of the file content (Django File or FieldFile)
+    """
+
+    def __init__(self, file):
+        self.file = file
+
+    @property
+    def size(self) -> int:
+        return self.file.size
+
+    def encoded_size(self) -> int:
+        return 4 * math.ceil(self.size / 3)
+
+    def iter_base64(self, chunk_size=CHUNK_SIZE):
+        # closed when the generator is exhausted or discarded; the next call reopens it
+        with self.file.open("rb") as file:
+            file.seek(0)
+            rest = b""
+            while True:
+                chunk = file.read(chunk_size)
+                if not chunk:
+                    break
+                chunk = rest + chunk
+                # storages may return less than asked; keep the tail to not have padding in the middle
+                cut = len(chunk) - len(chunk) % 3
+                chunk, rest = chunk[:cut], chunk[cut:]
+                if chunk:
+                    yield base64.b64encode(chunk).decode("ascii")
+            if rest:
+                yield base64.b64encode(rest).decode("ascii")
+
+    def read_base64(self) -> str:
+        return "".join(self.iter_base64())
+
+
+def _contains_lazy(value) -> bool:
+    if isinstance(value, Base64File):
+        return True
+    if isinstance(value, dict):
+        return any(_contains_lazy(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_contains_lazy(v) for v in value)
+    return False
+
+
+def iter_json(value):
+    """
+    Yield the JSON representation of the value by parts
+    """
+    if isinstance(value, Base64File):
+        yield '"'
+        yield from value.iter_base64()
+        yield '"'
+    elif not _contains_lazy(value):
+        yield json.dumps(value)
+    elif isinstance(value, dict):
+        yield "{"
+        for index, (key, item) in enumerate(value.items()):
+            yield (", " if index else "") + json.dumps(str(key)) + ": "
+            yield from iter_json(item)
+        yield "}"
+    else:
+        yield "["
+        for index, item in enumerate(value):
+            if index:
+                yield ", "
+            yield from iter_json(item)
+        yield "]"
+
+
+def json_size(value) -> int:
+    """
+    Length of the JSON representation (ascii only so it's bytes as well)
+    computed without encoding the attachments
+    """
+    if isinstance(value, Base64File):
+        return value.encoded_size() + 2
+    if not _contains_lazy(value):
+        return len(json.dumps(value))
+    if isinstance(value, dict):
+        return 2 + sum(
+            len(json.dumps(str(key))) + 2 + json_size(item) for key, item in value.items()
+        ) + 2 * max(len(value) - 1, 0)
+    return 2 + sum(json_size(item) for item in value) + 2 * max(len(value) - 1, 0)
+
+
+class JsonReader(io.RawIOBase):
+    """
+    Read-only file object returning the JSON representation of the value,
+    suitable for storages (default_storage.save) and requests (data=...)
+    without having the whole JSON in memory. Its length is known in advance
+    so HTTP requests are sent with Content-Length, not chunked.
+    """
+
+    def __init__(self, value):
+        self.value = value
+        self._length = json_size(value)
+        self.seek(0)
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def size(self):
+        return self._length
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        # only rewinding to the start is supported, which is enough for storages
+        return False
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if (offset, whence) != (0, io.SEEK_SET):
+            raise io.UnsupportedOperation("JsonReader may be rewound only to the start")
+        self._parts = iter_json(self.value)
+        self._buffer = b""
+        self._offset = 0
+        self._position = 0
+        return 0
+
+    def tell(self):
+        return self._position
+
+    def readinto(self, b):
+        size = 0
+        while size < len(b):
+            if self._offset >= len(self._buffer):
+                part = next(self._parts, None)
+                if part is None:
+                    break
+                self._buffer, self._offset = part.encode("ascii"), 0
+            taken = self._buffer[self._offset:self._offset + len(b) - size]
+            b[size:size + len(taken)] = taken
+            size += len(taken)
+            self._offset += len(taken)
+        self._position += size
+        return size
@@ -84,3 +84,14 @@ def statsd_counter(name, value):
             counter.increment(name, value)
     except Exception as e:
         logger.exception(e)
+
+
+def statsd_timing(name, seconds):
+    # for durations measured elsewhere, where statsd_timer decorator can't be used
+    try:
+        if not settings.STATSD_HOST:
+            return
+        timer = statsd.Timer(settings.STATSD_PREFIX)
+        timer.send(name, seconds)
+    except Exception as e:
+        logger.exception(e)
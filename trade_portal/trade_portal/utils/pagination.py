@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+def estimate_count(qs) -> int:
+    """
+    Number of rows the database planner expects the queryset to return, which is
+    what the table statistics say (could be way off) but costs nothing compared to COUNT(*)
+    """
+    sql, params = qs.query.sql_with_params()
+    with connections[qs.db].cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class ApproximateCountPaginator(Paginator):
+    """
+    Counts the objects exactly only if there are less than APPROXIMATE_COUNT_FROM
+    of them by the planner estimate, the estimate is used otherwise (so the last
+    pages could be empty or missing); "approximate" tells which one it is
+    """
+    approximate = False
+
+    @cached_property
+    def count(self):
+        threshold = settings.APPROXIMATE_COUNT_FROM
+        qs = self.object_list
+        # django_tables2 pages the table rows wrapping the queryset
+        while not hasattr(qs, "query") and hasattr(qs, "data"):
+            qs = qs.data
+        if threshold and hasattr(qs, "query"):
+            estimate = estimate_count(qs)
+            if estimate >= threshold:
+                self.approximate = True
+                return estimate
+        return super().count
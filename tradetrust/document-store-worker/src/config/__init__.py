@@ -83,7 +83,9 @@ class Config:
             aws_config['region_name'] = aws_region_name
 
         queues = {
-            'Unprocessed': os.environ['UNPROCESSED_QUEUE_URL']
+            'Unprocessed': os.environ['UNPROCESSED_QUEUE_URL'],
+            # optional, "issued" events are published there for the document owners to consume
+            'IssuedEvents': os.environ.get('ISSUED_EVENTS_QUEUE_URL') or None
         }
         buckets = {
             'Unprocessed': os.environ['UNPROCESSED_BUCKET_NAME'],
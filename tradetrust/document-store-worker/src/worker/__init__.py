@@ -47,6 +47,7 @@ class Worker:
     def connect_resources(self):
         self.connect_blockchain_node()
         self.connect_unprocessed_queue()
+        self.connect_issued_events_queue()
         self.connect_unprocessed_bucket()
         self.connect_issued_bucket()
         self.connect_contract()
@@ -128,6 +129,14 @@ class Worker:
         queue_url = self.config['AWS']['Resources']['Queues']['Unprocessed']
         self.unprocessed_queue = boto3.resource('sqs', **config).Queue(queue_url)
 
+    def connect_issued_events_queue(self):
+        logger.debug('connect_issued_events_queue')
+        self.issued_events_queue = None
+        queue_url = self.config['AWS']['Resources']['Queues'].get('IssuedEvents')
+        if queue_url:
+            config = self.config['AWS']['Config']
+            self.issued_events_queue = boto3.resource('sqs', **config).Queue(queue_url)
+
     def _connect_to_bucket(self, bucket_name):
         config = self.config['AWS']['Config']
         return boto3.resource('s3', **config).Bucket(bucket_name)
@@ -257,6 +266,7 @@ class Worker:
             receipt = self.wait_for_transaction_receipt(tx_hash)
             if receipt.status != 1:
                 raise RuntimeError(json.dumps(Web3.toJSON(receipt)))
+            return receipt
         except ValueError as e:
             try:
                 if e.args[0]['message'] == 'replacement transaction underpriced':
@@ -328,55 +338,111 @@ class Worker:
             ContentLength=content_length
         )
 
+    def load_record(self, record):
+        """
+        Returns key, wrapped document and "is already wrapped" flag for the given S3 event record
+        """
+        key, document = self.load_unprocessed_document(record)
+        version = self.get_document_version(document)
+
+        is_wrapped = "data" in document and "signature" in document
+
+        if not is_wrapped:
+            logger.info("Document is not wrapped, wrapping it...")
+            wrapped_document = self.wrap_document(document, version)
+        else:
+            logger.info("Document is wrapped, unwrapping it to access business data...")
+            wrapped_document = document.copy()
+            document = self.unwrap_document(document, version)
+            self.verify_document_signature(wrapped_document)
+        self.verify_document_store_address(document, version)
+        return key, wrapped_document, is_wrapped
+
+    def issue_documents(self, documents, check_issued):
+        """
+        Issues documents sharing the same merkle root by a single transaction
+        and puts all of them to the issued bucket
+        """
+        if check_issued:
+            # This is used to fix potential rare error when a stuck pending transaction
+            # gets mined before a higher-priced one which causes a wrapped document to hang forever
+            # in the unprocessed bucket because it's already issued
+            logger.info("Checking issuance status")
+            if self.is_issued_document(documents[0][1]):
+                logger.info("The document already issued, moving to issued bucket")
+                for key, wrapped_document in documents:
+                    self.put_document(key, wrapped_document)
+                self.publish_issued_event(documents, None)
+                return
+            logger.info('The document is not issued, continuing normally')
+        self.refresh_gas_price()
+        receipt = self.issue_document(documents[0][1])
+        for key, wrapped_document in documents:
+            self.put_document(key, wrapped_document)
+        self.transactions_count += 1
+        self.publish_issued_event(documents, receipt)
+
+    def publish_issued_event(self, documents, receipt):
+        """
+        Tell the documents owner (if ISSUED_EVENTS_QUEUE_URL is configured) that the merkle root
+        is issued and the documents are in the issued bucket, so it doesn't need to poll for that;
+        the receipt is None if the root had been issued before (by a transaction we don't know)
+        """
+        if self.issued_events_queue is None:
+            return
+        merkle_root = documents[0][1]['signature']['merkleRoot']
+        event = {
+            'type': 'issued',
+            'merkleRoot': merkle_root,
+            'documentStore': self.config['DocumentStore']['Address'],
+            'transactionHash': Web3.toHex(receipt.transactionHash) if receipt is not None else None,
+            'blockNumber': receipt.blockNumber if receipt is not None else None,
+            'keys': [key for key, wrapped_document in documents],
+        }
+        try:
+            self.issued_events_queue.send_message(MessageBody=json.dumps(event))
+            logger.info('Issued event for %s has been published', merkle_root)
+        except Exception as e:
+            # the documents are issued anyway, the owner just finds that out later by itself
+            logger.exception(e)
+
     def process_message(self, message):
+        """
+        The message may contain multiple records; documents wrapped together
+        (sharing the merkle root) are issued by a single transaction
+        """
         logger.debug('process_message')
         event = json.loads(message.body)
-        for record in event['Records']:
-            try:
-                key, document = self.load_unprocessed_document(record)
-                version = self.get_document_version(document)
-
-                is_wrapped = "data" in document and "signature" in document
-
-                if not is_wrapped:
-                    logger.info("Document is not wrapped, wrapping it...")
-                    wrapped_document = self.wrap_document(document, version)
-                else:
-                    logger.info("Document is wrapped, unwrapping it to access business data...")
-                    wrapped_document = document.copy()
-                    document = self.unwrap_document(document, version)
-                    self.verify_document_signature(wrapped_document)
-                    # This is used to fix potential rare error when a stuck pending transaction
-                    # gets mined before a higher-priced one which causes a wrapped document to hang forever
-                    # in the unprocessed bucket because it's already issued
-                    logger.info("Checking issuance status")
-                    if self.is_issued_document(wrapped_document):
-                        logger.info("The document already issued, moving to issued bucket")
-                        self.verify_document_store_address(document, version)
-                        self.put_document(key, wrapped_document)
-                        return True
-                    logger.info('The document is not issued, continuing normally')
-                self.verify_document_store_address(document, version)
-                self.refresh_gas_price()
-                self.issue_document(wrapped_document)
-                self.put_document(key, wrapped_document)
-                self.transactions_count += 1
-                return True
-            except DocumentError as e:
-                logger.exception(e)
-                return True
-            except TransactionTimeoutException:
-                # next transaction will replace this one using actual gas price because of the same nonce value
-                logger.warn('Transaction timed out, increasing gas price')
-                self.increase_gas_price()
-                return False
-            except UnderpricedReplacementTransactionException:
-                logger.warn('Replacement transaction is underpriced, increasing gas price')
-                self.increase_gas_price()
-                return False
-            except Exception as e:
-                logger.exception(e)
-                return False
+        batches = {}
+        try:
+            for record in event['Records']:
+                try:
+                    key, wrapped_document, is_wrapped = self.load_record(record)
+                except DocumentError as e:
+                    # there is no sense to retry it, the document is invalid
+                    logger.exception(e)
+                    continue
+                merkle_root = wrapped_document['signature']['merkleRoot']
+                batches.setdefault(merkle_root, (is_wrapped, []))[1].append((key, wrapped_document))
+
+            for check_issued, documents in batches.values():
+                self.issue_documents(documents, check_issued)
+            return True
+        except DocumentError as e:
+            logger.exception(e)
+            return True
+        except TransactionTimeoutException:
+            # next transaction will replace this one using actual gas price because of the same nonce value
+            logger.warn('Transaction timed out, increasing gas price')
+            self.increase_gas_price()
+            return False
+        except UnderpricedReplacementTransactionException:
+            logger.warn('Replacement transaction is underpriced, increasing gas price')
+            self.increase_gas_price()
+            return False
+        except Exception as e:
+            logger.exception(e)
+            return False
 
     def receive_messages(self):
         # logger.debug('receive_messages')
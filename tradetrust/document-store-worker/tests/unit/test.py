@@ -238,6 +238,91 @@ def test_process_message_error(
     assert not worker.process_message(message)
 
 
+@mock.patch('src.worker.Worker.load_record')
+@mock.patch('src.worker.Worker.is_issued_document')
+@mock.patch('src.worker.Worker.issue_document')
+@mock.patch('src.worker.Worker.put_document')
+def test_process_message_batch(
+    put_document,
+    issue_document,
+    is_issued_document,
+    load_record
+):
+    config = Config.from_environ()
+    worker = Worker(config)
+
+    message = mock.MagicMock()
+    message.body = json.dumps({
+        'Records': [{}, {}, {}, {}]
+    })
+
+    def document(merkle_root):
+        return {'signature': {'merkleRoot': merkle_root}}
+
+    load_record.side_effect = [
+        ('key-1', document('root-1'), True),
+        ('key-2', document('root-1'), True),
+        DocumentError('Mock Expected'),
+        ('key-4', document('root-2'), False),
+    ]
+    is_issued_document.return_value = False
+
+    assert worker.process_message(message)
+
+    # single transaction per merkle root, the invalid document is skipped
+    assert issue_document.call_count == 2
+    issue_document.assert_any_call(document('root-1'))
+    issue_document.assert_any_call(document('root-2'))
+    # freshly wrapped documents can't be issued already
+    is_issued_document.assert_called_once_with(document('root-1'))
+    assert [c[0][0] for c in put_document.call_args_list] == ['key-1', 'key-2', 'key-4']
+
+
+@mock.patch('src.worker.Worker.is_issued_document')
+@mock.patch('src.worker.Worker.issue_document')
+@mock.patch('src.worker.Worker.put_document')
+def test_issued_event(
+    put_document,
+    issue_document,
+    is_issued_document
+):
+    config = Config.from_environ()
+    worker = Worker(config)
+    worker.issued_events_queue = mock.MagicMock()
+
+    documents = [
+        ('key-1', {'signature': {'merkleRoot': 'root-1'}}),
+        ('key-2', {'signature': {'merkleRoot': 'root-1'}}),
+    ]
+    receipt = mock.MagicMock()
+    receipt.transactionHash = b'\x12\x34'
+    receipt.blockNumber = 15
+    issue_document.return_value = receipt
+
+    worker.issue_documents(documents, check_issued=False)
+    event = json.loads(worker.issued_events_queue.send_message.call_args[1]['MessageBody'])
+    assert event == {
+        'type': 'issued',
+        'merkleRoot': 'root-1',
+        'documentStore': config['DocumentStore']['Address'],
+        'transactionHash': '0x1234',
+        'blockNumber': 15,
+        'keys': ['key-1', 'key-2'],
+    }
+
+    # issued before, there is no transaction to tell about
+    worker.issued_events_queue.reset_mock()
+    is_issued_document.return_value = True
+    worker.issue_documents(documents, check_issued=True)
+    event = json.loads(worker.issued_events_queue.send_message.call_args[1]['MessageBody'])
+    assert (event['merkleRoot'], event['transactionHash'], event['blockNumber']) == ('root-1', None, None)
+
+    # and the documents are issued anyway if the event can't be sent
+    worker.issued_events_queue.send_message.side_effect = Exception('Mock Unexpected')
+    worker.issue_documents(documents, check_issued=False)
+    assert put_document.call_count == 6
+
+
 def test_config_error():
     with mock.patch.dict(os.environ, {'WORKER_POLLING_VISIBILITY_TIMEOUT': '0'}):
         with pytest.raises(ValueError) as einfo:
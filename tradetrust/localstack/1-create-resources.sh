@@ -6,6 +6,7 @@ echo "Creating queues..."
 awslocal sqs create-queue --queue-name "unprocessed" --output text > /dev/null
 awslocal sqs create-queue --queue-name "revoke-unprocessed" --output text > /dev/null
 awslocal sqs create-queue --queue-name "issue-unprocessed" --output text > /dev/null
+awslocal sqs create-queue --queue-name "issued-events" --output text > /dev/null
 echo "Done"
 echo "Creating buckets..."
 awslocal s3api create-bucket --bucket "unprocessed"